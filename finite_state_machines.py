@@ -1,18 +1,35 @@
+from collections import Counter
+from time import perf_counter
+
+from fsm_ranges import CharRange, alphabet_ranges, state_range_maps
+
+# Symbol used for epsilon moves in NFA transitions, e.g. ('q0', EPSILON): {'q1'}
+EPSILON = ''
+
+
 class FSM:
     """
     A class representing a Finite State Machine (can be used for both DFA and NFA)
     """
-    def __init__(self, states, alphabet, transitions, start_state, accept_states, is_deterministic=True):
+    def __init__(self, states, alphabet, transitions, start_state, accept_states, is_deterministic=True,
+                 engine='dict'):
         """
         Initialize the FSM with its components
         
         Args:
             states (set): Set of all states in the FSM
-            alphabet (set): Set of all input symbols
+            alphabet (set): Set of all input symbols (and CharRanges of symbols)
             transitions (dict): Dictionary mapping (state, symbol) to a set of next states
+                (NFAs may use the EPSILON symbol for moves that read no input, and
+                a CharRange in place of the symbol labels a whole interval)
             start_state: The initial state
             accept_states (set): Set of accepting states
             is_deterministic (bool): Whether this FSM is deterministic
+            engine (str): How process_string runs the machine - 'dict' walks the
+                transitions dict and records history, 'compiled' uses the
+                dense table built by compile(), 'lazy' uses the cached subset
+                construction built by lazy_dfa(), 'bitset' uses the integer
+                state masks built by bitset_nfa()
         """
         self.states = states
         self.alphabet = alphabet
@@ -20,13 +37,378 @@ class FSM:
         self.start_state = start_state
         self.accept_states = accept_states
         self.is_deterministic = is_deterministic
-        self.current_states = {start_state} if not is_deterministic else start_state
-        self.input_sequence = []
+        self.engine = engine
+        self._engines = {}
+        self.has_epsilon = not is_deterministic and any(
+            symbol == EPSILON for (_, symbol) in transitions
+        )
+        self._closures = {}
+        self.has_ranges = any(isinstance(label, CharRange) for label in alphabet) or any(
+            isinstance(symbol, CharRange) for (_, symbol) in transitions
+        )
+        if self.has_ranges:
+            self._range_maps = state_range_maps(self)
+            self._alphabet_ranges = alphabet_ranges(alphabet)
+        # Run state of the legacy single-run API (reset/transition/
+        # process_string); concurrent evaluations each use their own cursor()
+        self._cursor = Cursor(self)
         
+    @property
+    def current_states(self):
+        """Current state (DFA) or set of states (NFA) of the built-in cursor"""
+        return self._cursor.current_states
+    
+    @property
+    def input_sequence(self):
+        """Symbols consumed by the built-in cursor since the last reset"""
+        return self._cursor.input_sequence
+    
+    def cursor(self):
+        """
+        Start an independent evaluation of this FSM
+
+        The FSM itself is only read during a run, so any number of cursors
+        (in threads or coroutines) can share one machine and its engines.
+
+        Returns:
+            Cursor: A fresh cursor at the start state
+        """
+        return Cursor(self)
+    
     def reset(self):
         """Reset the FSM to its initial state"""
-        self.current_states = {self.start_state} if not self.is_deterministic else self.start_state
-        self.input_sequence = []
+        self._cursor.reset()
+    
+    def epsilon_closure(self, states):
+        """
+        Get every state reachable from the given states through epsilon moves
+
+        The closure of each single state is computed once and cached.
+
+        Args:
+            states: Iterable of states
+
+        Returns:
+            set: The states plus everything reachable by epsilon moves
+        """
+        if not self.has_epsilon:
+            return set(states)
+        closure = set()
+        for state in states:
+            state_closure = self._closures.get(state)
+            if state_closure is None:
+                state_closure = self._closures[state] = self._compute_closure(state)
+            closure |= state_closure
+        return closure
+    
+    def _compute_closure(self, state):
+        """Follow epsilon moves from one state with a depth-first search"""
+        closure = {state}
+        stack = [state]
+        while stack:
+            for next_state in self.transitions.get((stack.pop(), EPSILON), ()):
+                if next_state not in closure:
+                    closure.add(next_state)
+                    stack.append(next_state)
+        return frozenset(closure)
+    
+    def in_alphabet(self, symbol):
+        """
+        Check whether a symbol is in the alphabet, directly or through a CharRange
+
+        Args:
+            symbol: The input symbol
+
+        Returns:
+            bool: True if the FSM can read the symbol
+        """
+        if symbol in self.alphabet:
+            return True
+        return self.has_ranges and len(symbol) == 1 and self._alphabet_ranges.lookup(ord(symbol), False)
+    
+    def target(self, state, symbol):
+        """
+        Look up the transition for one state and symbol, including range transitions
+
+        In a DFA a single-symbol transition wins over a range; in an NFA the
+        targets of both are combined.
+
+        Args:
+            state: The source state
+            symbol: The input symbol
+
+        Returns:
+            The next state (DFA) or set of next states (NFA), or None if there
+            is no transition
+        """
+        target = self.transitions.get((state, symbol))
+        if not self.has_ranges or len(symbol) != 1 or state not in self._range_maps:
+            return target
+        range_target = self._range_maps[state].lookup(ord(symbol))
+        if range_target is None:
+            return target
+        if target is None:
+            return range_target
+        return target if self.is_deterministic else target | range_target
+    
+    def start_states(self):
+        """
+        Get the set of states active before any input is read
+
+        Returns:
+            set: The epsilon-closure of the start state
+        """
+        return self.epsilon_closure([self.start_state])
+    
+    def compile(self):
+        """
+        Compile the FSM into a dense-table engine
+
+        The compiled machine is cached and used by process_string when
+        engine='compiled'. Call compile() again after editing the transitions.
+
+        Returns:
+            CompiledDFA: The compiled machine
+        """
+        from fsm_compiled import compile_dfa
+        self._engines['compiled'] = compile_dfa(self)
+        return self._engines['compiled']
+    
+    def lazy_dfa(self, max_states=10000):
+        """
+        Build a lazily determinized matcher for this FSM
+
+        The matcher is cached and used by process_string when engine='lazy'.
+
+        Args:
+            max_states (int): Maximum number of state-sets kept in its cache
+
+        Returns:
+            LazyDFA: The lazy matcher
+        """
+        from fsm_lazy import LazyDFA
+        self._engines['lazy'] = LazyDFA(self, max_states)
+        return self._engines['lazy']
+    
+    def bitset_nfa(self):
+        """
+        Build a bit-parallel simulation of this FSM
+
+        The simulation is cached and used by process_string when engine='bitset'.
+
+        Returns:
+            BitsetNFA: The bit-parallel matcher
+        """
+        from fsm_bitset import BitsetNFA
+        self._engines['bitset'] = BitsetNFA(self)
+        return self._engines['bitset']
+    
+    def compact(self):
+        """
+        Convert the FSM into integer ids and CSR adjacency arrays
+
+        Returns:
+            CompactFSM: A compact copy that can be turned back with to_fsm()
+        """
+        from fsm_compact import CompactFSM
+        return CompactFSM.from_fsm(self)
+    
+    def accepts_many(self, strings):
+        """
+        Check a batch of strings with the vectorized compiled engine
+
+        NFAs are determinized and compiled once, on the first call.
+
+        Args:
+            strings (list): The input strings
+
+        Returns:
+            numpy.ndarray: Boolean array of verdicts in input order
+        """
+        return self.compiled_dfa().accepts_many(strings)
+    
+    def prefix_matcher(self, memo_size=0):
+        """
+        Build a matcher that reads prefixes shared between strings only once
+
+        It runs on the engine selected when it is built.
+
+        Args:
+            memo_size (int): Most prefixes its accepts() memoizes for strings
+                arriving one at a time (0 disables the memo)
+
+        Returns:
+            PrefixMatcher: accepts_many(strings) walks a sorted batch as a
+                trie; accepts(s) resumes from the longest memoized prefix
+        """
+        from fsm_prefix import PrefixMatcher
+        return PrefixMatcher(self, memo_size)
+    
+    def stream(self, encoding=None, record_history=False):
+        """
+        Start a constant-memory streaming match
+
+        Args:
+            encoding (str): Decode bytes chunks with this encoding (None reads
+                each byte as one latin-1 character)
+            record_history (bool): Keep every consumed symbol
+
+        Returns:
+            StreamMatcher: A cursor with feed(chunk) and finish() methods
+        """
+        from fsm_stream import StreamMatcher
+        return StreamMatcher(self.compiled_dfa(), encoding, record_history)
+    
+    def scan_file(self, path, by_line=False):
+        """
+        Run the FSM over a file through mmap, without loading it into memory
+
+        Each byte is read as one latin-1 character.
+
+        Args:
+            path (str): Path of the file to scan
+            by_line (bool): Report a verdict per line instead of for the whole file
+
+        Returns:
+            bool for a whole-file scan, or a generator of (line_number, accepted)
+            tuples when by_line is True
+        """
+        from fsm_stream import scan_file
+        return scan_file(self.compiled_dfa(), path, by_line)
+    
+    def compiled_dfa(self):
+        """
+        Get a compiled DFA for this FSM, determinizing NFAs once
+
+        Returns:
+            CompiledDFA: The cached compiled machine
+        """
+        compiled = self._engines.get('compiled')
+        if compiled is None and not self.is_deterministic:
+            compiled = self._engines.get('determinized')
+            if compiled is None:
+                compiled = self._engines['determinized'] = self.determinize().compile()
+        if compiled is None:
+            compiled = self.compile()
+        return compiled
+    
+    def determinize(self):
+        """
+        Build an equivalent DFA with the subset construction
+
+        Returns:
+            FSM: A new deterministic FSM
+        """
+        from fsm_construction import determinize
+        return determinize(self)
+    
+    def minimize(self):
+        """
+        Build the minimal equivalent DFA with Hopcroft's algorithm
+
+        Returns:
+            FSM: A new minimal deterministic FSM
+        """
+        from fsm_construction import minimize
+        return minimize(self)
+    
+    def trim(self):
+        """
+        Build a copy without the states no accepted run goes through
+
+        Returns:
+            FSM: A new FSM with only reachable, co-reachable states
+        """
+        from fsm_construction import trim
+        return trim(self)
+    
+    def dead_ends(self):
+        """
+        Get the states where the verdict of a run can no longer change
+
+        Computed once and cached like the engines; the engines use it to stop
+        reading as soon as a run only has sinks left (rejected) or reaches an
+        accept-forever state (accepted).
+
+        Returns:
+            tuple: (sinks, accept_forever) frozensets of states (see
+                fsm_construction.dead_ends)
+        """
+        ends = self._engines.get('dead_ends')
+        if ends is None:
+            from fsm_construction import dead_ends
+            ends = self._engines['dead_ends'] = dead_ends(self)
+        return ends
+    
+    def intersection(self, other):
+        """
+        Combine with another machine into a lazy product that needs both to accept
+
+        Args:
+            other: An FSM or LazyProduct
+
+        Returns:
+            LazyProduct: One-pass matcher for the combined rule (to_fsm()
+                builds it eagerly)
+        """
+        from fsm_product import combine
+        return combine('and', self, other)
+    
+    def union(self, other):
+        """
+        Combine with another machine into a lazy product that needs either to accept
+
+        Args:
+            other: An FSM or LazyProduct
+
+        Returns:
+            LazyProduct: One-pass matcher for the combined rule
+        """
+        from fsm_product import combine
+        return combine('or', self, other)
+    
+    def difference(self, other):
+        """
+        Combine with another machine into a lazy product for "this and not other"
+
+        Args:
+            other: An FSM or LazyProduct
+
+        Returns:
+            LazyProduct: One-pass matcher for the combined rule
+        """
+        from fsm_product import combine
+        return combine('and not', self, other)
+    
+    def complement(self):
+        """
+        Build a lazy product accepting exactly the strings this FSM rejects
+
+        Returns:
+            LazyProduct: One-pass matcher for the complement
+        """
+        from fsm_product import combine
+        return combine('not', self)
+    
+    def get_engine(self):
+        """
+        Get the matcher selected by self.engine, building it on first use
+
+        Returns:
+            The matcher object, or None for the 'dict' engine
+        """
+        if self.engine == 'dict':
+            return None
+        engine = self._engines.get(self.engine)
+        if engine is not None:
+            return engine
+        if self.engine == 'compiled':
+            return self.compile()
+        if self.engine == 'lazy':
+            return self.lazy_dfa()
+        if self.engine == 'bitset':
+            return self.bitset_nfa()
+        raise ValueError(f"Unknown engine: {self.engine}")
     
     def transition(self, symbol):
         """
@@ -38,74 +420,218 @@ class FSM:
         Returns:
             bool: True if valid transition, False otherwise
         """
-        self.input_sequence.append(symbol)
+        return self._cursor.transition(symbol)
+    
+    def process_string(self, input_string):
+        """
+        Process a complete input string
+        
+        The dict engine runs on the built-in cursor, so transition history
+        is available afterwards; use accepts() to share the FSM between
+        threads.
+        
+        Args:
+            input_string (str): The input string to process
+            
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        self._cursor.reset()
+        
+        # The fast engines don't record the transition history
+        engine = self.get_engine()
+        if engine is not None:
+            return engine.accepts(input_string)
+        return self._cursor.feed(input_string)
+    
+    def accepts(self, input_string):
+        """
+        Check a string without touching the FSM's own run state
+
+        Safe to call from many threads or coroutines on one shared FSM.
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        engine = self.get_engine()
+        if engine is not None:
+            return engine.accepts(input_string)
+        return Cursor(self).feed(input_string)
+    
+    def instrument(self, stats):
+        """
+        Switch process_string to its instrumented variant
+
+        Every run then reports to stats whichever engine is selected: symbols
+        consumed, the active-set size after each step, where the run died,
+        lazy DFA cache hits and time per phase. The normal loops carry no
+        checks for this; the instrumented copies replace them until
+        instrument(None) switches back.
+
+        Args:
+            stats (RunStats): Statistics to report to (see fsm_stats), or None
+        """
+        from fsm_stats import install
+        install(self, 'process_string', self._process_string_instrumented, stats)
+    
+    def _process_string_instrumented(self, stats, input_string):
+        """process_string() that also reports the run to stats"""
+        cursor = self._cursor
+        cursor.reset()
+        engine = self.get_engine()
+        if engine is not None:
+            return engine._accepts_instrumented(stats, input_string)
+        
+        began = perf_counter()
+        sizes = Counter()
+        symbols = 0
+        dead_at = None
+        for symbol in input_string:
+            symbols += 1
+            if not self.in_alphabet(symbol) or not cursor.transition(symbol):
+                sizes[0] += 1
+                dead_at = symbols - 1
+                break
+            sizes[1 if self.is_deterministic else len(cursor.current_states)] += 1
+        accepted = dead_at is None and cursor.is_accepting()
+        stats.record('dict', symbols, accepted, dead_at, sizes, phases={'run': perf_counter() - began})
+        return accepted
+    
+    def accepting_path(self, input_string, checkpoint_interval=None, checkpoint=False):
+        """
+        Find a genuine accepting run over a string (see fsm_path.find_path)
+
+        Args:
+            input_string (str): The input string
+            checkpoint_interval (int): Keep only every interval-th active set
+                and recompute the rest, for very long inputs
+            checkpoint (bool): Checkpoint every ~sqrt(len(input_string)) symbols
+
+        Returns:
+            RunPath: An accepting run, or a run over the longest viable prefix
+                when the string is rejected (its accepted attribute tells which)
+        """
+        from fsm_path import find_path
+        return find_path(self, input_string, checkpoint_interval, checkpoint)
+    
+    def get_transition_history(self):
+        """
+        Get the history of transitions made during the last string processing
+        
+        For an NFA this is an accepting run when there is one (epsilon moves
+        included), otherwise a run over the longest viable prefix.
         
-        if self.is_deterministic:
+        Returns:
+            list: List of (state, symbol, next_state) tuples
+        """
+        return self._cursor.get_transition_history()
+
+
+class Cursor:
+    """
+    The run state of one evaluation of an FSM
+
+    The FSM holds the definition and the compiled engines and is only read;
+    everything a run changes lives here, so a cursor is a few dozen bytes.
+    """
+    __slots__ = ('fsm', 'current_states', 'input_sequence')
+
+    def __init__(self, fsm):
+        """
+        Initialize the cursor at the start state
+
+        Args:
+            fsm (FSM): The machine to run
+        """
+        self.fsm = fsm
+        self.reset()
+
+    def reset(self):
+        """Go back to the start state and forget the consumed symbols"""
+        fsm = self.fsm
+        self.current_states = fsm.start_states() if not fsm.is_deterministic else fsm.start_state
+        self.input_sequence = []
+
+    def transition(self, symbol):
+        """
+        Process an input symbol and update the current state(s)
+
+        Args:
+            symbol: The input symbol to process
+
+        Returns:
+            bool: True if valid transition, False otherwise
+        """
+        fsm = self.fsm
+        self.input_sequence.append(symbol)
+
+        if fsm.is_deterministic:
             # DFA transition
-            if (self.current_states, symbol) in self.transitions:
-                self.current_states = self.transitions[(self.current_states, symbol)]
+            next_state = fsm.target(self.current_states, symbol)
+            if next_state is not None:
+                self.current_states = next_state
                 return True
             return False
         else:
             # NFA transition
             next_states = set()
             for state in self.current_states:
-                if (state, symbol) in self.transitions:
-                    next_states.update(self.transitions[(state, symbol)])
-                    
+                targets = fsm.target(state, symbol)
+                if targets is not None:
+                    next_states.update(targets)
+            if fsm.has_epsilon:
+                next_states = fsm.epsilon_closure(next_states)
+
             self.current_states = next_states
             return len(next_states) > 0
-    
-    def process_string(self, input_string):
+
+    def feed(self, input_string):
         """
-        Process a complete input string
-        
+        Process a string from the current state(s) and check the result
+
+        Stops at the first symbol without a transition, or as soon as only
+        sinks are left (see FSM.dead_ends), like process_string. Consumed
+        symbols are recorded up to that point.
+
         Args:
-            input_string (str): The input string to process
-            
+            input_string (str): The symbols to process
+
         Returns:
-            bool: True if the string is accepted, False otherwise
+            bool: True if the run is in an accept state afterwards
         """
-        self.reset()
-        
-        # Process each symbol in the input string
+        fsm = self.fsm
+        in_alphabet = fsm.in_alphabet
+        sinks = fsm.dead_ends()[0]
         for symbol in input_string:
-            if symbol not in self.alphabet:
+            if not in_alphabet(symbol):
                 return False
             if not self.transition(symbol):
                 return False
-        
-        # Check if we ended in an accept state
-        if self.is_deterministic:
-            return self.current_states in self.accept_states
-        else:
-            return any(state in self.accept_states for state in self.current_states)
-    
+            if fsm.is_deterministic:
+                if self.current_states in sinks:
+                    return False
+            elif sinks.issuperset(self.current_states):
+                return False
+        return self.is_accepting()
+
+    def is_accepting(self):
+        """Check whether the cursor is in an accept state"""
+        accept_states = self.fsm.accept_states
+        if self.fsm.is_deterministic:
+            return self.current_states in accept_states
+        return any(state in accept_states for state in self.current_states)
+
     def get_transition_history(self):
         """
-        Get the history of transitions made during the last string processing
-        
+        Get a run over the symbols consumed since the last reset
+
         Returns:
             list: List of (state, symbol, next_state) tuples
         """
-        history = []
-        state = self.start_state
-        
-        for symbol in self.input_sequence:
-            if self.is_deterministic:
-                next_state = self.transitions.get((state, symbol))
-                if next_state:
-                    history.append((state, symbol, next_state))
-                    state = next_state
-            else:
-                # For NFA, simplify by just showing one possible path
-                next_states = self.transitions.get((state, symbol), set())
-                if next_states:
-                    next_state = next(iter(next_states))
-                    history.append((state, symbol, next_state))
-                    state = next_state
-        
-        return history
+        return list(self.fsm.accepting_path(self.input_sequence))
 
 # Create DFA for the language (a+b)c*
 def create_dfa_a_plus_b_c_star():
@@ -138,6 +664,28 @@ def create_nfa_a_or_b_star_abb():
     
     return FSM(states, alphabet, transitions, start_state, accept_states, is_deterministic=False)
 
+# Create NFA for the language (a|b)*a(a|b){n}
+def create_nfa_nth_last_a(n):
+    """
+    Create an NFA for the language (a|b)*a(a|b){n}
+
+    The NFA has n + 2 states but its smallest equivalent DFA has 2^(n+1),
+    which makes it the standard stress test for determinization.
+    """
+    states = {f'q{i}' for i in range(n + 2)}
+    alphabet = {'a', 'b'}
+    transitions = {
+        ('q0', 'a'): {'q0', 'q1'},
+        ('q0', 'b'): {'q0'},
+    }
+    for i in range(1, n + 1):
+        transitions[(f'q{i}', 'a')] = {f'q{i + 1}'}
+        transitions[(f'q{i}', 'b')] = {f'q{i + 1}'}
+    start_state = 'q0'
+    accept_states = {f'q{n + 1}'}
+    
+    return FSM(states, alphabet, transitions, start_state, accept_states, is_deterministic=False)
+
 # Example usage:
 if __name__ == "__main__":
     # DFA example
@@ -3,7 +3,7 @@ from tkinter import ttk, filedialog, messagebox
 import json
 import os
 from PIL import Image, ImageTk
-import import nfa_config.txt, dfa_config.txt
+from fsm_loader import fsm_from_definition, parse_definition
 import visualize_fsm, visualize_string_processing, animate_string_processing
 
 class FSMApp(tk.Tk):
@@ -449,34 +449,9 @@ class FSMApp(tk.Tk):
     def create_fsm_from_definition(self):
         """Create a custom FSM from the JSON definition"""
         try:
-            # Get the JSON definition
-            json_text = self.definition_text.get("1.0", tk.END)
-            fsm_def = json.loads(json_text)
-            
-            # Convert to proper format for FSM class
-            states = set(fsm_def["states"])
-            alphabet = set(fsm_def["alphabet"])
-            
-            # Process transitions
-            transitions = {}
-            for src_state, state_trans in fsm_def["transitions"].items():
-                for symbol, dest_state in state_trans.items():
-                    if fsm_def.get("is_deterministic", True):
-                        transitions[(src_state, symbol)] = dest_state
-                    else:
-                        if isinstance(dest_state, list):
-                            transitions[(src_state, symbol)] = set(dest_state)
-                        else:
-                            transitions[(src_state, symbol)] = {dest_state}
-            
-            start_state = fsm_def["start_state"]
-            accept_states = set(fsm_def["accept_states"])
-            is_deterministic = fsm_def.get("is_deterministic", True)
-            
-            # Create the FSM
-            self.custom_fsm = FSM(
-                states, alphabet, transitions, start_state, accept_states, is_deterministic
-            )
+            # Parse and validate the definition (JSON or INI text)
+            definition = self.definition_text.get("1.0", tk.END)
+            self.custom_fsm = fsm_from_definition(parse_definition(definition))
             
             # Visualize the FSM
             viz_file = f"custom_fsm_{id(self.custom_fsm)}"
@@ -491,9 +466,9 @@ class FSMApp(tk.Tk):
             messagebox.showerror("Error", f"Failed to create FSM: {str(e)}")
     
     def load_fsm_from_file(self):
-        """Load FSM definition from a JSON file"""
+        """Load FSM definition from a JSON or INI file"""
         file_path = filedialog.askopenfilename(
-            filetypes=[("JSON Files", "*.json"), ("All Files", "*.*")]
+            filetypes=[("JSON Files", "*.json"), ("INI Files", "*.txt *.ini"), ("All Files", "*.*")]
         )
         
         if not file_path:
@@ -501,7 +476,7 @@ class FSMApp(tk.Tk):
         
         try:
             with open(file_path, 'r') as file:
-                fsm_def = json.load(file)
+                fsm_def = parse_definition(file.read())
             
             # Update the text widget with the loaded definition
             self.definition_text.delete("1.0", tk.END)
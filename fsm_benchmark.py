@@ -0,0 +1,507 @@
+"""
+FSM Benchmarks - throughput of the matching engines on generated corpora
+
+Run directly to benchmark every engine on generated workloads, optionally
+saving the results and comparing them with an earlier run:
+
+    python fsm_benchmark.py --output results.json
+    python fsm_benchmark.py --baseline results.json --threshold 0.15
+
+The exit status is 1 when any metric regressed by more than the threshold.
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from array import array
+
+from finite_state_machines import (
+    FSM, create_dfa_a_plus_b_c_star, create_nfa_a_or_b_star_abb, create_nfa_nth_last_a
+)
+
+# Fraction by which a metric may get worse before it counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Compile times below this are too noisy to compare
+MIN_COMPARED_SECONDS = 0.01
+
+# Metrics where a larger value is better; for the rest smaller is better
+HIGHER_IS_BETTER = ('strings_per_sec', 'bytes_per_sec')
+LOWER_IS_BETTER = ('compile_seconds', 'peak_bytes')
+
+# (workload name, generator name, parameters) for the default suite; the quick
+# suite divides every size by 10
+WORKLOADS = [
+    ('random_dfa_1k', 'random_dfa', {'num_states': 1000, 'alphabet': 'abcd', 'density': 1.0}),
+    ('random_dfa_sparse', 'random_dfa', {'num_states': 1000, 'alphabet': 'abcd', 'density': 0.9}),
+    ('random_nfa_200', 'random_nfa', {'num_states': 200, 'alphabet': 'ab', 'density': 1.5}),
+    ('nth_last_a_10', 'nth_last_a', {'n': 10}),
+]
+
+# (corpus name, number of strings, minimum length, maximum length)
+CORPORA = [
+    ('many_short', 5000, 0, 64),
+    ('long', 1, 200000, 200000),
+]
+
+ENGINES = ('dict', 'compiled', 'lazy', 'bitset', 'batch')
+
+
+def random_corpus(alphabet, count, min_length, max_length, seed=0):
+    """
+    Generate a reproducible list of random strings
+
+    Args:
+        alphabet (str): Characters to draw from
+        count (int): Number of strings
+        min_length (int): Shortest string length
+        max_length (int): Longest string length
+        seed (int): Random seed
+
+    Returns:
+        list: The generated strings
+    """
+    rng = random.Random(seed)
+    symbols = list(alphabet)
+    return [
+        ''.join(rng.choices(symbols, k=rng.randint(min_length, max_length)))
+        for _ in range(count)
+    ]
+
+
+def time_call(function, *args, repeat=3):
+    """Return the best wall-clock time of several calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_accepts_many(fsm, strings):
+    """
+    Compare accepts_many() against a process_string() loop
+
+    Args:
+        fsm (FSM): The machine to benchmark
+        strings (list): The input corpus
+
+    Returns:
+        dict: Strings per second for both approaches and the speedup
+    """
+    fsm.accepts_many(strings[:1])  # compile outside the timed region
+    loop_time = time_call(lambda: [fsm.process_string(s) for s in strings])
+    batch_time = time_call(fsm.accepts_many, strings)
+    return {
+        'strings': len(strings),
+        'loop_strings_per_sec': len(strings) / loop_time,
+        'batch_strings_per_sec': len(strings) / batch_time,
+        'speedup': loop_time / batch_time,
+    }
+
+
+def benchmark_parallel(fsm, strings, max_workers=None):
+    """
+    Measure how parallel_accepts() scales with the number of workers
+
+    Args:
+        fsm (FSM): The machine to benchmark
+        strings (list): The input corpus
+        max_workers (int): Largest pool to try (default: the CPU count)
+
+    Returns:
+        dict: Strings per second for each worker count
+    """
+    from fsm_parallel import parallel_accepts
+    
+    max_workers = max_workers or os.cpu_count() or 1
+    result = {}
+    workers = 1
+    while workers <= max_workers:
+        elapsed = time_call(parallel_accepts, fsm, strings, workers, repeat=1)
+        result[f'{workers}_workers_strings_per_sec'] = len(strings) / elapsed
+        workers *= 2
+    return result
+
+
+def random_dfa_edges(num_states, alphabet, seed=0):
+    """
+    Generate the edges of a random complete DFA as parallel arrays
+
+    Args:
+        num_states (int): Number of states
+        alphabet (str): Input symbols; every state has one edge per symbol
+        seed (int): Random seed
+
+    Returns:
+        tuple: (sources, columns, targets) arrays of state and column ids
+    """
+    rng = random.Random(seed)
+    sources = array('i')
+    columns = array('i')
+    targets = array('i')
+    for state in range(num_states):
+        for col in range(len(alphabet)):
+            sources.append(state)
+            columns.append(col)
+            targets.append(rng.randrange(num_states))
+    return sources, columns, targets
+
+
+def traced_bytes(function, *args):
+    """Call a function and return its result with the bytes it left allocated"""
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_memory(num_states, alphabet='ab'):
+    """
+    Compare the memory held by an FSM and a CompactFSM of a random DFA
+
+    The compact machine is built straight from the edge arrays and keeps no
+    state names, as it would for an automaton generated from rules.
+
+    Args:
+        num_states (int): Number of states
+        alphabet (str): Input symbols, one edge per state and symbol
+
+    Returns:
+        dict: Bytes held by each representation, bytes per edge and the ratio
+    """
+    from fsm_compact import CompactFSM
+    
+    sources, columns, targets = random_dfa_edges(num_states, alphabet)
+    accept_ids = range(0, num_states, 2)
+    
+    def build_fsm():
+        names = [f'q{state}' for state in range(num_states)]
+        transitions = {
+            (names[src], alphabet[col]): names[dest] for src, col, dest in zip(sources, columns, targets)
+        }
+        return FSM(set(names), set(alphabet), transitions, names[0], {names[i] for i in accept_ids})
+    
+    fsm, fsm_bytes = traced_bytes(build_fsm)
+    del fsm
+    compact, compact_bytes = traced_bytes(
+        CompactFSM.from_edges, num_states, list(alphabet), sources, columns, targets, 0, accept_ids)
+    edges = compact.num_edges
+    return {
+        'states': num_states,
+        'edges': edges,
+        'fsm_bytes': fsm_bytes,
+        'compact_bytes': compact_bytes,
+        'fsm_bytes_per_edge': fsm_bytes / edges,
+        'compact_bytes_per_edge': compact_bytes / edges,
+        'ratio': fsm_bytes / compact_bytes,
+    }
+
+
+def random_dfa(num_states, alphabet, density=1.0, seed=0):
+    """
+    Generate a random DFA
+
+    Args:
+        num_states (int): Number of states
+        alphabet (str): Input symbols
+        density (float): Fraction of (state, symbol) pairs that get a transition
+        seed (int): Random seed
+
+    Returns:
+        FSM: A DFA over states q0..q{num_states - 1}, about half of them accepting
+    """
+    rng = random.Random(seed)
+    states = [f'q{i}' for i in range(num_states)]
+    transitions = {
+        (state, symbol): rng.choice(states)
+        for state in states for symbol in alphabet if rng.random() < density
+    }
+    accept_states = {state for state in states if rng.random() < 0.5}
+    return FSM(set(states), set(alphabet), transitions, states[0], accept_states)
+
+
+def random_nfa(num_states, alphabet, density=1.5, seed=0):
+    """
+    Generate a random NFA
+
+    Args:
+        num_states (int): Number of states
+        alphabet (str): Input symbols
+        density (float): Average number of targets per (state, symbol) pair
+        seed (int): Random seed
+
+    Returns:
+        FSM: An NFA over states q0..q{num_states - 1}, about a tenth of them accepting
+    """
+    rng = random.Random(seed)
+    states = [f'q{i}' for i in range(num_states)]
+    transitions = {}
+    for state in states:
+        for symbol in alphabet:
+            # Between 0 and 2 * density targets, density on average
+            targets = {rng.choice(states) for _ in range(rng.randint(0, round(2 * density)))}
+            if targets:
+                transitions[(state, symbol)] = targets
+    accept_states = {state for state in states if rng.random() < 0.1}
+    return FSM(set(states), set(alphabet), transitions, states[0], accept_states, is_deterministic=False)
+
+
+def make_workload(generator, params, scale=1):
+    """
+    Build the FSM of one workload
+
+    Args:
+        generator (str): 'random_dfa', 'random_nfa' or 'nth_last_a'
+        params (dict): Keyword arguments of the generator
+        scale (int): Divide the number of states by this (or halve n)
+
+    Returns:
+        FSM: The machine
+    """
+    if generator == 'nth_last_a':
+        # The DFA has 2^(n+1) states, so a smaller suite halves n instead
+        return create_nfa_nth_last_a(params['n'] if scale == 1 else max(1, params['n'] // 2))
+    params = dict(params, num_states=max(2, params['num_states'] // scale))
+    if generator == 'random_dfa':
+        return random_dfa(**params)
+    if generator == 'random_nfa':
+        return random_nfa(**params)
+    raise ValueError(f"Unknown workload generator: {generator}")
+
+
+def build_engine(fsm, engine):
+    """
+    Build a matcher and return a function checking a list of strings with it
+
+    Args:
+        fsm (FSM): The machine
+        engine (str): One of ENGINES ('batch' is compiled accepts_many())
+
+    Returns:
+        function: Takes a list of strings and returns the verdicts
+    """
+    if engine == 'dict':
+        fsm.engine = 'dict'
+        return lambda strings: [fsm.process_string(s) for s in strings]
+    if engine == 'batch':
+        compiled = fsm.compiled_dfa()
+        return compiled.accepts_many
+    if engine == 'compiled':
+        matcher = fsm.compiled_dfa()
+    elif engine == 'lazy':
+        matcher = fsm.lazy_dfa()
+    elif engine == 'bitset':
+        matcher = fsm.bitset_nfa()
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    return lambda strings: [matcher.accepts(s) for s in strings]
+
+
+def benchmark_engine(make_fsm, engine, strings, repeat=3):
+    """
+    Measure one engine on one corpus
+
+    Compile time covers building the matcher from a fresh FSM (including
+    determinization for NFAs). Peak memory is traced over building the matcher
+    and one pass over the corpus; throughput is the best of the untraced runs.
+
+    Args:
+        make_fsm (function): Returns a fresh FSM
+        engine (str): One of ENGINES
+        strings (list): The input corpus
+        repeat (int): Timed runs to take the best of
+
+    Returns:
+        dict: compile_seconds, strings_per_sec, bytes_per_sec and peak_bytes
+    """
+    fsm = make_fsm()
+    start = time.perf_counter()
+    run = build_engine(fsm, engine)
+    compile_seconds = time.perf_counter() - start
+
+    fsm = make_fsm()
+    tracemalloc.start()
+    try:
+        build_engine(fsm, engine)(strings)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del fsm
+
+    elapsed = time_call(run, strings, repeat=repeat)
+    return {
+        'compile_seconds': compile_seconds,
+        'strings_per_sec': len(strings) / elapsed,
+        'bytes_per_sec': sum(map(len, strings)) / elapsed,
+        'peak_bytes': peak_bytes,
+    }
+
+
+def git_commit():
+    """Get the current git commit, or None outside a repository"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(workloads=WORKLOADS, corpora=CORPORA, engines=ENGINES, scale=1, repeat=3, progress=None):
+    """
+    Benchmark every engine on every workload and corpus
+
+    Args:
+        workloads (list): (name, generator, params) tuples
+        corpora (list): (name, count, min_length, max_length) tuples
+        engines (tuple): Engine names
+        scale (int): Divide machine and corpus sizes by this
+        repeat (int): Timed runs per measurement
+        progress (function): Called with each result as it is measured
+
+    Returns:
+        dict: 'meta' describing the run and 'results', a list of dicts with the
+            workload, corpus, engine and measured metrics
+    """
+    # Import every engine module and NumPy before anything is timed
+    for engine in engines:
+        build_engine(create_dfa_a_plus_b_c_star(), engine)(['ac'])
+
+    results = []
+    for workload, generator, params in workloads:
+        make_fsm = functools.partial(make_workload, generator, params, scale)
+        alphabet = ''.join(sorted(map(str, make_fsm().alphabet)))
+        for corpus, count, min_length, max_length in corpora:
+            strings = random_corpus(alphabet, max(1, count // scale), min_length // scale,
+                                    max_length // scale)
+            for engine in engines:
+                result = {'workload': workload, 'corpus': corpus, 'engine': engine}
+                result.update(benchmark_engine(make_fsm, engine, strings, repeat))
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'scale': scale,
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Find the metrics that got worse by more than a threshold
+
+    Args:
+        baseline (dict): Output of run_suite() for the reference run
+        current (dict): Output of run_suite() for the new run
+        threshold (float): Allowed relative change, e.g. 0.1 for 10%
+
+    Returns:
+        list: (workload, corpus, engine, metric, baseline value, current value)
+            tuples, one per regression
+    """
+    reference = {(r['workload'], r['corpus'], r['engine']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['workload'], result['corpus'], result['engine'])
+        old = reference.get(key)
+        if old is None:
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            before, after = old[metric], result[metric]
+            if metric == 'compile_seconds' and max(before, after) < MIN_COMPARED_SECONDS:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                worse = after < before * (1 - threshold)
+            else:
+                worse = after > before * (1 + threshold)
+            if worse:
+                regressions.append((*key, metric, before, after))
+    return regressions
+
+
+def print_result(name, result):
+    """Print one benchmark result"""
+    print(f"{name}:")
+    for key, value in result.items():
+        print(f"  {key}: {value:,.1f}" if isinstance(value, float) else f"  {key}: {value:,}")
+
+
+def print_suite_result(result):
+    """Print one run_suite() measurement as a table row"""
+    print(f"{result['workload']:<18} {result['corpus']:<11} {result['engine']:<9}"
+          f" {result['compile_seconds'] * 1000:>10.1f} {result['strings_per_sec']:>14,.0f}"
+          f" {result['bytes_per_sec']:>14,.0f} {result['peak_bytes'] / 1024:>10,.0f}")
+
+
+def print_engine_comparisons():
+    """Print the accepts_many, parallel and memory comparisons"""
+    # Mostly accepted strings, so neither approach can bail out early
+    corpus = ['a' + s for s in random_corpus('c', 20000, 0, 64)]
+    print_result("DFA (a+b)c* - accepts_many", benchmark_accepts_many(create_dfa_a_plus_b_c_star(), corpus))
+
+    corpus = random_corpus('ab', 20000, 0, 64)
+    print_result("NFA (a|b)*abb - accepts_many", benchmark_accepts_many(create_nfa_a_or_b_star_abb(), corpus))
+    print_result("NFA (a|b)*abb - parallel_accepts",
+                 benchmark_parallel(create_nfa_a_or_b_star_abb(), corpus * 10))
+
+    for num_states in (10 ** 4, 10 ** 5, 10 ** 6):
+        print_result(f"Random DFA, {num_states:,} states - FSM vs CompactFSM memory",
+                     benchmark_memory(num_states))
+
+
+def main(argv=None):
+    """Run the benchmark suite from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmark the FSM engines")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare with the results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed relative slowdown (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--engines', default=','.join(ENGINES), help="comma-separated engines to run")
+    parser.add_argument('--quick', action='store_true', help="run a 10x smaller suite")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per measurement")
+    parser.add_argument('--comparisons', action='store_true',
+                        help="also print the accepts_many, parallel and memory comparisons")
+    args = parser.parse_args(argv)
+
+    print(f"{'workload':<18} {'corpus':<11} {'engine':<9} {'compile ms':>10} {'strings/s':>14}"
+          f" {'bytes/s':>14} {'peak KiB':>10}")
+    results = run_suite(engines=tuple(args.engines.split(',')), scale=10 if args.quick else 1,
+                        repeat=args.repeat, progress=print_suite_result)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.comparisons:
+        print_engine_comparisons()
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_results(baseline, results, args.threshold)
+        for workload, corpus, engine, metric, before, after in regressions:
+            print(f"REGRESSION {workload}/{corpus}/{engine} {metric}: {before:,.4g} -> {after:,.4g}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Binary format for compiled DFAs - saved once, mapped with mmap to load
+
+save_compiled() writes a CompiledDFA as one little-endian file, whatever the
+byte order of the host:
+
+    header      magic, format version, sizes, start state, byte-order mark,
+                section offsets
+    delta       the transition table, pre-multiplied by the class count
+                (int32, or int64 for very large tables)
+    accepting   bitmap with bit i set for accepting state i
+    decided     bitmap with bit i set when state i decides the verdict (a sink
+                or an accept-forever state), so loading need not recompute it
+    symbols     JSON table of symbol classes and range classes
+    names       (num_states + 1) uint64 offsets, then the UTF-8 state names
+
+load_compiled() maps the file and hands the delta section to the matcher as
+a memoryview, without copying or parsing it, and decodes state names only
+when they are looked up. Big-endian hosts copy and byteswap the integer
+sections instead. Loading is dominated by page faults, and processes
+mapping the same file share its pages through the OS page cache.
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from fsm_compiled import CompiledDFA, UNKNOWN_CLASS
+from fsm_ranges import LabelIndex, RangeMap
+
+MAGIC = b'FSMC'
+FORMAT_VERSION = 3
+
+# magic, version, flags, num_states, num_classes, start, byte-order mark, then
+# (offset, length) of the delta, accepting, decided, symbols and names sections
+HEADER = struct.Struct('<4sHHIIII10Q')
+
+# Reads back as this value only when the file is little-endian like the header
+BYTE_ORDER_MARK = 0x01020304
+
+# Set in the header flags when delta entries are int64 instead of int32
+FLAG_WIDE_DELTA = 1
+
+ALIGNMENT = 8
+
+
+def _pad(length):
+    """Bytes of padding that align a section of the given length"""
+    return -length % ALIGNMENT
+
+
+def _pack_bits(values):
+    """Pack one 0/1 byte per item into a little-endian bitmap"""
+    bitmap = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return bytes(bitmap)
+
+
+def _to_little_endian(values):
+    """Get the bytes of an array in little-endian order"""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(view, typecode):
+    """
+    Read a little-endian section as items of an array typecode
+
+    Little-endian hosts get a cast of the mapped view, without copying.
+    """
+    if sys.byteorder == 'big':
+        values = array(typecode)
+        values.frombytes(view)
+        values.byteswap()
+        return values
+    return view.cast(typecode)
+
+
+# The 8 unpacked bytes of every possible bitmap byte
+_UNPACKED = [bytes(byte >> bit & 1 for bit in range(8)) for byte in range(256)]
+
+
+def _unpack_bits(bitmap, count):
+    """Unpack a little-endian bitmap into one 0/1 byte per item"""
+    return bytearray(b''.join(_UNPACKED[byte] for byte in bitmap)[:count])
+
+
+class _NameTable:
+    """
+    Read-only sequence of state names decoded on demand from the names section
+    """
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, state):
+        if not 0 <= state < len(self):
+            raise IndexError(state)
+        if state == 0:
+            return None
+        return str(self._blob[self._offsets[state]:self._offsets[state + 1]], 'utf-8')
+
+    def __iter__(self):
+        return (self[state] for state in range(len(self)))
+
+
+def save_compiled(compiled, path):
+    """
+    Write a compiled DFA in the binary format
+
+    State names are stored as strings, so they load back as str.
+
+    Args:
+        compiled (CompiledDFA): The machine to save
+        path (str): Output file path
+    """
+    wide = compiled.num_states * compiled.num_classes >= 2 ** 31
+    delta = _to_little_endian(array('q' if wide else 'i', compiled._delta))
+    accepting = _pack_bits(compiled.accepting)
+    decided = _pack_bits(compiled.decided)
+
+    index = compiled.symbol_index
+    symbols = json.dumps({
+        'symbols': dict(index),
+        'ranges': [list(entry) for entry in index.ranges] if index.ranges is not None else [],
+    }).encode('utf-8')
+
+    encoded = [b''] + [str(name).encode('utf-8') for name in compiled.state_names[1:]]
+    offsets = array('Q', [0])
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+    names = _to_little_endian(offsets) + b''.join(encoded)
+
+    sections = []
+    position = HEADER.size + _pad(HEADER.size)
+    for data in (delta, accepting, decided, symbols, names):
+        sections.append((position, len(data)))
+        position += len(data) + _pad(len(data))
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, FLAG_WIDE_DELTA if wide else 0, compiled.num_states,
+                         compiled.num_classes, compiled.start, BYTE_ORDER_MARK,
+                         *(value for section in sections for value in section))
+    with open(path, 'wb') as file:
+        file.write(header + bytes(_pad(HEADER.size)))
+        for data in (delta, accepting, decided, symbols, names):
+            file.write(data + bytes(_pad(len(data))))
+
+
+def load_compiled(path):
+    """
+    Map a file written by save_compiled() and build a matcher on it
+
+    Args:
+        path (str): Path of the file
+
+    Returns:
+        CompiledDFA: A matcher whose transition table lives in the mapped file
+    """
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    if len(view) < HEADER.size:
+        raise ValueError(f"{path} is too short to be a compiled FSM")
+    (magic, version, flags, num_states, num_classes, start, byte_order_mark, delta_offset, delta_length, accept_offset,
+     accept_length, decided_offset, decided_length, symbols_offset, symbols_length, names_offset,
+     names_length) = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a compiled FSM file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    if byte_order_mark != BYTE_ORDER_MARK:
+        raise ValueError(f"{path} has a bad byte order mark {byte_order_mark:#010x}")
+    if names_offset + names_length > len(view):
+        raise ValueError(f"{path} is truncated")
+
+    delta = _from_little_endian(view[delta_offset:delta_offset + delta_length],
+                                'q' if flags & FLAG_WIDE_DELTA else 'i')
+    if len(delta) != num_states * num_classes:
+        raise ValueError(f"{path} has a transition table of the wrong size")
+    accepting = _unpack_bits(view[accept_offset:accept_offset + accept_length], num_states)
+    decided = _unpack_bits(view[decided_offset:decided_offset + decided_length], num_states)
+
+    symbols = json.loads(str(view[symbols_offset:symbols_offset + symbols_length], 'utf-8'))
+    ranges = RangeMap(map(tuple, symbols['ranges'])) if symbols['ranges'] else None
+    symbol_classes = LabelIndex(symbols['symbols'], ranges, UNKNOWN_CLASS)
+
+    names_end = names_offset + 8 * (num_states + 1)
+    state_names = _NameTable(_from_little_endian(view[names_offset:names_end], 'Q'),
+                             view[names_end:names_offset + names_length])
+
+    return CompiledDFA(state_names, symbol_classes, num_classes, None, start, accepting, delta, decided)
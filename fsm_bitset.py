@@ -0,0 +1,257 @@
+"""
+Bit-parallel NFA simulation - the set of active states as one Python int
+
+Every NFA state gets a bit position. For each symbol and each state we
+precompute the mask of its successors, so a step never allocates sets. The
+successor of a whole active set is looked up one byte of the mask at a time:
+the OR of the successor masks for each 8-state chunk is cached the first time
+that chunk pattern shows up, so a step costs at most num_states / 8 lookups
+and ORs no matter how many states are active.
+"""
+
+from collections import Counter
+from time import perf_counter
+
+from fsm_lazy import nfa_targets
+from fsm_ranges import label_index, symbol_labels
+from fsm_stats import install
+
+
+class BitsetNFA:
+    """
+    An NFA simulated with integer state masks
+    """
+    def __init__(self, fsm):
+        """
+        Initialize the bit-parallel simulation
+
+        Args:
+            fsm (FSM): The NFA (or DFA) to simulate
+        """
+        self.fsm = fsm
+        self.state_names = sorted(fsm.states, key=str)
+        self.state_bits = {state: bit for bit, state in enumerate(self.state_names)}
+        self.symbols = symbol_labels(fsm)
+        self.symbol_index = label_index(self.symbols, range(len(self.symbols)))
+        self.num_bytes = max(1, (len(self.state_names) + 7) // 8)
+
+        # successors[col][bit] is the mask of states reachable from bit on symbols[col]
+        # (a symbol or a CharRange whose characters all behave alike)
+        self.successors = []
+        for symbol in self.symbols:
+            masks = []
+            for state in self.state_names:
+                mask = 0
+                for target in nfa_targets(fsm, state, symbol):
+                    mask |= 1 << self.state_bits[target]
+                masks.append(mask)
+            self.successors.append(masks)
+
+        if fsm.is_deterministic:
+            self.start_mask = 1 << self.state_bits[fsm.start_state]
+        else:
+            self.start_mask = self.to_mask(fsm.start_states())
+        self.accept_mask = self.to_mask(fsm.accept_states)
+        # A run is decided once no live state is active (rejected) or an
+        # accept-forever state is (accepted); see FSM.dead_ends()
+        sinks, accept_forever = fsm.dead_ends()
+        self.live_mask = self.to_mask(fsm.states - sinks)
+        self.accept_forever_mask = self.to_mask(accept_forever)
+
+        # _chunks[col][byte_position][byte_value] caches the OR of successor
+        # masks for that byte of the active set (None until first needed).
+        # A symbol's table is only allocated once the symbol is read.
+        self._chunks = [None] * len(self.symbols)
+
+    def to_mask(self, states):
+        """
+        Convert a collection of state names into a mask
+
+        Args:
+            states: Iterable of state names
+
+        Returns:
+            int: The mask with the bit of every given state set
+        """
+        mask = 0
+        for state in states:
+            mask |= 1 << self.state_bits[state]
+        return mask
+
+    def to_states(self, mask):
+        """
+        Convert a mask back into a set of state names
+
+        Args:
+            mask (int): A state mask
+
+        Returns:
+            set: The states whose bits are set
+        """
+        return {state for bit, state in enumerate(self.state_names) if mask >> bit & 1}
+
+    def _column_chunks(self, col):
+        """Allocate the chunk cache of one symbol"""
+        chunks = [[0] + [None] * 255 for _ in range(self.num_bytes)]
+        self._chunks[col] = chunks
+        return chunks
+
+    def _fill(self, col, position, byte):
+        """Compute and cache the successor mask of one byte of the active set"""
+        masks = self.successors[col]
+        base = position * 8
+        mask = 0
+        for offset in range(8):
+            if byte >> offset & 1:
+                mask |= masks[base + offset]
+        self._chunks[col][position][byte] = mask
+        return mask
+
+    def _successors_of(self, mask, col):
+        """
+        OR the cached successor masks of every byte of the active set
+
+        Args:
+            mask (int): The active states
+            col (int): Index of the symbol in self.symbols
+
+        Returns:
+            int: The next active states (0 if none)
+        """
+        chunks = self._chunks[col] or self._column_chunks(col)
+        next_mask = 0
+        for position, byte in enumerate(mask.to_bytes(self.num_bytes, 'little')):
+            if byte:
+                chunk_mask = chunks[position][byte]
+                if chunk_mask is None:
+                    chunk_mask = self._fill(col, position, byte)
+                next_mask |= chunk_mask
+        return next_mask
+
+    def step(self, mask, symbol):
+        """
+        Advance a set of active states by one symbol
+
+        Args:
+            mask (int): The active states
+            symbol: The input symbol
+
+        Returns:
+            int: The next active states (0 if none)
+        """
+        col = self.symbol_index[symbol]
+        if col is None:
+            return 0
+        return self._successors_of(mask, col)
+
+    def run(self, input_string):
+        """
+        Run the NFA over a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            int: The mask of active states at the end (0 once the run dies)
+        """
+        return self.advance(self.start_mask, input_string)
+
+    def advance(self, mask, input_string):
+        """
+        Run the NFA from a given set of active states
+
+        Args:
+            mask (int): The active states to start from
+            input_string (str): The input string to process
+
+        Returns:
+            int: The mask of active states at the end (0 once the run dies)
+        """
+        # The step of _successors_of() is inlined: this is the hot loop
+        num_bytes = self.num_bytes
+        symbol_index = self.symbol_index
+        all_chunks = self._chunks
+        for symbol in input_string:
+            col = symbol_index[symbol]
+            if col is None:
+                return 0
+            chunks = all_chunks[col] or self._column_chunks(col)
+            next_mask = 0
+            for position, byte in enumerate(mask.to_bytes(num_bytes, 'little')):
+                if byte:
+                    chunk_mask = chunks[position][byte]
+                    if chunk_mask is None:
+                        chunk_mask = self._fill(col, position, byte)
+                    next_mask |= chunk_mask
+            if not next_mask:
+                return 0
+            mask = next_mask
+        return mask
+
+    def accepts(self, input_string):
+        """
+        Check whether the NFA accepts a string
+
+        Unlike run(), this stops as soon as the active set decides the verdict.
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        num_bytes = self.num_bytes
+        symbol_index = self.symbol_index
+        all_chunks = self._chunks
+        live = self.live_mask
+        forever = self.accept_forever_mask
+        mask = self.start_mask
+        if not mask & live or mask & forever:
+            return bool(mask & forever)
+        for symbol in input_string:
+            col = symbol_index[symbol]
+            if col is None:
+                return False
+            chunks = all_chunks[col] or self._column_chunks(col)
+            next_mask = 0
+            for position, byte in enumerate(mask.to_bytes(num_bytes, 'little')):
+                if byte:
+                    chunk_mask = chunks[position][byte]
+                    if chunk_mask is None:
+                        chunk_mask = self._fill(col, position, byte)
+                    next_mask |= chunk_mask
+            if not next_mask & live:
+                return False
+            if next_mask & forever:
+                return True
+            mask = next_mask
+        return bool(mask & self.accept_mask)
+
+    def instrument(self, stats):
+        """
+        Switch accepts() to its instrumented variant, or back with None
+
+        Args:
+            stats (RunStats): Statistics every run reports to (see fsm_stats)
+        """
+        install(self, 'accepts', self._accepts_instrumented, stats)
+
+    def _accepts_instrumented(self, stats, input_string):
+        """accepts() that also reports the run to stats"""
+        began = perf_counter()
+        symbol_index = self.symbol_index
+        sizes = Counter()
+        mask = self.start_mask
+        symbols = 0
+        dead_at = None
+        for symbol in input_string:
+            symbols += 1
+            col = symbol_index[symbol]
+            mask = 0 if col is None else self._successors_of(mask, col)
+            sizes[bin(mask).count('1')] += 1
+            if not mask:
+                dead_at = symbols - 1
+                break
+        accepted = bool(mask & self.accept_mask)
+        stats.record('bitset', symbols, accepted, dead_at, sizes, phases={'run': perf_counter() - began})
+        return accepted
@@ -0,0 +1,316 @@
+"""
+Compact FSM storage - interned integer ids and CSR adjacency arrays
+
+An FSM keeps its states as strings and its transitions as a dict with tuple
+keys, which costs a few hundred bytes per edge. CompactFSM stores the same
+machine as flat arrays:
+
+    row_offsets[state] .. row_offsets[state + 1]   the edges leaving a state
+    edge_symbols[edge]                              the label column of an edge
+    edge_targets[edge]                              the target state of an edge
+
+Edges of one state are sorted by column, so a lookup is a bisect within the
+row, and the accepting states are a bitmap. An NFA simply has several edges
+with the same column; epsilon moves use column EPSILON_COLUMN.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import sys
+
+from finite_state_machines import EPSILON, FSM
+from fsm_ranges import label_index, representative, symbol_labels
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Column of epsilon moves, sorted before every real label
+EPSILON_COLUMN = -1
+
+
+def _counting_sort(order, keys, num_keys, with_offsets=False):
+    """
+    Stable-sort indices by small integer keys in O(len(order) + num_keys)
+
+    Args:
+        order: The indices to sort
+        keys: keys[i] in range(num_keys) for every index i
+        num_keys (int): Number of distinct keys
+        with_offsets (bool): Also return where each key's run starts
+
+    Returns:
+        array: The sorted indices, or (indices, offsets) where offsets[k] ..
+            offsets[k + 1] is the run of key k
+    """
+    offsets = array('l', [0]) * (num_keys + 1)
+    for i in order:
+        offsets[keys[i] + 1] += 1
+    for key in range(num_keys):
+        offsets[key + 1] += offsets[key]
+    sorted_order = array('l', [0]) * offsets[num_keys]
+    slots = array('l', offsets)
+    for i in order:
+        key = keys[i]
+        sorted_order[slots[key]] = i
+        slots[key] += 1
+    if with_offsets:
+        return sorted_order, offsets
+    return sorted_order
+
+
+class CompactFSM:
+    """
+    A DFA or NFA stored as CSR arrays over integer state and label ids
+    """
+    __slots__ = ('state_names', 'symbols', 'symbol_index', 'is_deterministic', 'start', 'num_states',
+                 'accepting', 'row_offsets', 'edge_symbols', 'edge_targets')
+
+    def __init__(self, state_names, symbols, num_states, start, accepting, row_offsets, edge_symbols,
+                 edge_targets, is_deterministic=True):
+        """
+        Initialize the compact FSM from already built arrays
+
+        Args:
+            state_names (list): Name of each state id, or None to use the ids as names
+            symbols (list): Label of each column (plain symbols and disjoint CharRanges)
+            num_states (int): Number of states
+            start (int): Id of the start state
+            accepting (bytearray): Bitmap with bit i set for each accepting state i
+            row_offsets (array): num_states + 1 offsets into the edge arrays
+            edge_symbols (array): Column of each edge, sorted within each row
+            edge_targets (array): Target state id of each edge
+            is_deterministic (bool): Whether this FSM is deterministic
+        """
+        self.state_names = state_names
+        self.symbols = symbols
+        self.symbol_index = label_index(symbols, range(len(symbols)))
+        self.num_states = num_states
+        self.start = start
+        self.accepting = accepting
+        self.row_offsets = row_offsets
+        self.edge_symbols = edge_symbols
+        self.edge_targets = edge_targets
+        self.is_deterministic = is_deterministic
+
+    @classmethod
+    def from_edges(cls, num_states, symbols, sources, columns, targets, start, accept_ids,
+                   is_deterministic=True, state_names=None):
+        """
+        Build a compact FSM from parallel edge arrays
+
+        Edges are ordered with a NumPy argsort (or counting sorts without
+        NumPy) into flat arrays, so no per-edge Python objects are created
+        and generated automata can skip the FSM dict form entirely.
+
+        Args:
+            num_states (int): Number of states
+            symbols (list): Label of each column
+            sources, columns, targets: Equal-length sequences of source state,
+                column (EPSILON_COLUMN for epsilon moves) and target state ids
+            start (int): Id of the start state
+            accept_ids: Iterable of accepting state ids
+            is_deterministic (bool): Whether this FSM is deterministic
+            state_names (list): Optional name of each state id
+
+        Returns:
+            CompactFSM: The compact machine
+        """
+        if np is not None:
+            # One key per edge: rows in state order, columns within a row
+            src = np.asarray(sources, dtype=np.int64)
+            col = np.asarray(columns, dtype=np.int64)
+            order = np.argsort(src * (len(symbols) + 1) + col + 1, kind='stable')
+            row_offsets = array('l', [0])
+            row_offsets.extend(np.cumsum(np.bincount(src, minlength=num_states)).tolist())
+            edge_symbols = array('i', col[order].astype(np.int32).tobytes())
+            edge_targets = array('i', np.asarray(targets, dtype=np.int32)[order].tobytes())
+        else:
+            # Two stable counting sorts: by column, then by source, so rows
+            # come in state order with their columns sorted
+            order = _counting_sort(range(len(sources)), array('l', (col + 1 for col in columns)),
+                                   len(symbols) + 1)
+            order, row_offsets = _counting_sort(order, sources, num_states, with_offsets=True)
+            edge_symbols = array('i', (columns[i] for i in order))
+            edge_targets = array('i', (targets[i] for i in order))
+        del order
+
+        if is_deterministic:
+            for state in range(num_states):
+                row = edge_symbols[row_offsets[state]:row_offsets[state + 1]]
+                if len(set(row)) != len(row) or EPSILON_COLUMN in row:
+                    raise ValueError(f"State {state} has several transitions on one symbol")
+
+        accepting = bytearray((num_states + 7) // 8)
+        for state in accept_ids:
+            accepting[state >> 3] |= 1 << (state & 7)
+
+        return cls(state_names, list(symbols), num_states, start, accepting, row_offsets, edge_symbols,
+                   edge_targets, is_deterministic)
+
+    @classmethod
+    def from_fsm(cls, fsm):
+        """
+        Convert an FSM into the compact form
+
+        Range transitions are split into the disjoint labels of symbol_labels().
+
+        Args:
+            fsm (FSM): A DFA or NFA
+
+        Returns:
+            CompactFSM: The compact machine, accepting exactly the same strings
+        """
+        state_names = sorted(fsm.states, key=str)
+        state_ids = {state: i for i, state in enumerate(state_names)}
+        symbols = symbol_labels(fsm)
+        columns_of = {symbol: col for col, symbol in enumerate(symbols)}
+
+        def edges():
+            if fsm.has_ranges:
+                # Resolve every label in every state, ranges included
+                for state in state_names:
+                    for col, label in enumerate(symbols):
+                        target = fsm.target(state, representative(label))
+                        if target is not None:
+                            yield state, col, target
+                for (state, symbol), target in fsm.transitions.items():
+                    if symbol == EPSILON:
+                        yield state, EPSILON_COLUMN, target
+                return
+            for (state, symbol), target in fsm.transitions.items():
+                if symbol == EPSILON:
+                    yield state, EPSILON_COLUMN, target
+                elif symbol in columns_of:
+                    yield state, columns_of[symbol], target
+
+        sources = array('i')
+        columns = array('i')
+        targets = array('i')
+        for state, col, target in edges():
+            for next_state in ([target] if fsm.is_deterministic else target):
+                sources.append(state_ids[state])
+                columns.append(col)
+                targets.append(state_ids[next_state])
+
+        return cls.from_edges(len(state_names), symbols, sources, columns, targets,
+                              state_ids[fsm.start_state], (state_ids[state] for state in fsm.accept_states),
+                              fsm.is_deterministic, state_names)
+
+    def to_fsm(self):
+        """
+        Convert back into a dict-based FSM
+
+        Returns:
+            FSM: An equivalent FSM with the same state names (or integer ids)
+        """
+        names = self.state_names if self.state_names is not None else range(self.num_states)
+        transitions = {}
+        for state in range(self.num_states):
+            for edge in range(self.row_offsets[state], self.row_offsets[state + 1]):
+                col = self.edge_symbols[edge]
+                symbol = EPSILON if col == EPSILON_COLUMN else self.symbols[col]
+                target = names[self.edge_targets[edge]]
+                if self.is_deterministic:
+                    transitions[(names[state], symbol)] = target
+                else:
+                    transitions.setdefault((names[state], symbol), set()).add(target)
+        accept_states = {names[state] for state in range(self.num_states) if self.is_accepting(state)}
+        return FSM(set(names), set(self.symbols), transitions, names[self.start], accept_states,
+                   self.is_deterministic)
+
+    @property
+    def num_edges(self):
+        """Number of stored edges"""
+        return len(self.edge_targets)
+
+    def is_accepting(self, state):
+        """Check the accepting bit of a state id"""
+        return bool(self.accepting[state >> 3] >> (state & 7) & 1)
+
+    def targets(self, state, col):
+        """
+        Get the targets of one state on one column
+
+        Args:
+            state (int): Source state id
+            col (int): Label column (or EPSILON_COLUMN)
+
+        Returns:
+            array: Target state ids (empty if there is no transition)
+        """
+        lo = self.row_offsets[state]
+        hi = self.row_offsets[state + 1]
+        first = bisect_left(self.edge_symbols, col, lo, hi)
+        last = bisect_right(self.edge_symbols, col, first, hi)
+        return self.edge_targets[first:last]
+
+    def epsilon_closure(self, states):
+        """
+        Get every state id reachable through epsilon moves
+
+        Args:
+            states: Iterable of state ids
+
+        Returns:
+            set: The state ids plus everything reachable by epsilon moves
+        """
+        closure = set(states)
+        stack = list(closure)
+        while stack:
+            for next_state in self.targets(stack.pop(), EPSILON_COLUMN):
+                if next_state not in closure:
+                    closure.add(next_state)
+                    stack.append(next_state)
+        return closure
+
+    def accepts(self, input_string):
+        """
+        Check whether the FSM accepts a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        symbol_index = self.symbol_index
+        if self.is_deterministic:
+            state = self.start
+            for symbol in input_string:
+                col = symbol_index[symbol]
+                if col is None:
+                    return False
+                next_states = self.targets(state, col)
+                if not next_states:
+                    return False
+                state = next_states[0]
+            return self.is_accepting(state)
+
+        states = self.epsilon_closure([self.start])
+        for symbol in input_string:
+            col = symbol_index[symbol]
+            if col is None:
+                return False
+            next_states = set()
+            for state in states:
+                next_states.update(self.targets(state, col))
+            if not next_states:
+                return False
+            states = self.epsilon_closure(next_states)
+        return any(self.is_accepting(state) for state in states)
+
+    def memory_usage(self):
+        """
+        Estimate the bytes held by this object and its arrays
+
+        Returns:
+            int: Approximate size in bytes (state names included)
+        """
+        size = sum(sys.getsizeof(part) for part in (
+            self.accepting, self.row_offsets, self.edge_symbols, self.edge_targets, self.symbols,
+        ))
+        if self.state_names is not None:
+            size += sys.getsizeof(self.state_names) + sum(map(sys.getsizeof, self.state_names))
+        return size + sys.getsizeof(self)
@@ -0,0 +1,495 @@
+"""
+Compiled DFA engine - a dense, array-backed transition table for fast matching
+
+The dict-based FSM in finite_state_machines.py stays the authoring format.
+compile_dfa() interns its states as small integers and lays the transitions
+out in one flat table, so matching a string costs a single table lookup per
+character.
+
+Columns of the table are symbol classes rather than single symbols: symbols
+that behave identically in every state share one column, and a 256- or
+65536-entry lookup string maps input characters to their class. Large
+character sets therefore cost one column per distinct behaviour, and range
+transitions (see fsm_ranges) cost one class per distinct interval.
+"""
+
+import codecs
+from array import array
+from collections import Counter
+from time import perf_counter
+
+from fsm_construction import closed_subset
+from fsm_ranges import BMP_LIMIT, CharRange, LabelIndex, covers_every_code, label_index, symbol_labels
+from fsm_stats import install
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# State id 0 is always the explicit dead state: every missing transition and
+# every symbol outside the alphabet leads there, and it never leaves.
+DEAD_STATE = 0
+
+# Class 0 holds every symbol that has no transitions at all, including every
+# symbol outside the alphabet. Its column always leads to the dead state.
+UNKNOWN_CLASS = 0
+
+# accepts() checks whether the verdict is already decided once per this many
+# symbols instead of after every one. Decided states never leave the decided
+# set, so checking late only costs the symbols read in between.
+DECIDED_CHECK_INTERVAL = 32
+
+# accepts_many() works through the batch in blocks of this many strings so
+# the padded matrix stays small even when a few strings are very long
+BATCH_BLOCK_SIZE = 4096
+
+
+def _unknown_symbols(error):
+    """Codec error handler that encodes characters missing from a lookup string as class 0"""
+    return chr(UNKNOWN_CLASS) * (error.end - error.start), error.end
+
+
+codecs.register_error('fsm-unknown-symbol', _unknown_symbols)
+
+
+class _ColumnMap(dict):
+    """str.translate() mapping that looks code points missing from it up in a RangeMap"""
+
+    def __init__(self, mapping, ranges):
+        super().__init__(mapping)
+        self.ranges = ranges
+
+    def __missing__(self, key):
+        if self.ranges is None:
+            return UNKNOWN_CLASS
+        return self.ranges.lookup(key, UNKNOWN_CLASS)
+
+
+class CompiledDFA:
+    """
+    A DFA compiled to a flat transition table over symbol classes
+
+    States are numbered 0..num_states-1 with 0 reserved for the dead state,
+    and symbol classes are numbered 0..num_classes-1 with 0 reserved for
+    symbols without transitions. The next state for (state, class) is
+    table[state * num_classes + class].
+    """
+    def __init__(self, state_names, symbol_classes, num_classes, table, start, accepting, delta=None,
+                 decided=None):
+        """
+        Initialize the compiled DFA from already interned components
+
+        Args:
+            state_names (list): State name for each state id (None for the dead state)
+            symbol_classes (dict): Class of each symbol that has transitions (a
+                LabelIndex when classes also come from ranges)
+            num_classes (int): Number of classes, including UNKNOWN_CLASS
+            table (array): Flat array('i') of next-state ids (None when delta is given)
+            start (int): Id of the start state
+            accepting (bytearray): 1 for each accepting state id, 0 otherwise
+            delta: The table with each entry pre-multiplied by num_classes, when
+                already available (e.g. a memoryview loaded by fsm_binary)
+            decided (bytearray): 1 for each state where the verdict can no
+                longer change (computed from the table when not given)
+        """
+        self.state_names = state_names
+        if not isinstance(symbol_classes, LabelIndex):
+            symbol_classes = LabelIndex(symbol_classes, None, UNKNOWN_CLASS)
+        self.symbol_index = symbol_classes
+        self.symbols = sorted(symbol_classes, key=str)
+        self.num_classes = num_classes
+        self._table = table
+        self.start = start
+        self.accepting = accepting
+        self.num_states = len(state_names)
+        self._np_table = None
+        self._byte_delta = None
+        self._build_matcher(delta)
+        if decided is None:
+            decided = self._find_decided_states()
+        self.decided = decided
+        self._decided_offsets = frozenset(
+            state * self._stride for state in range(self.num_states) if decided[state]
+        )
+
+    @property
+    def table(self):
+        """The flat array('i') of next-state ids, rebuilt from delta if needed"""
+        if self._table is None:
+            stride = self.num_classes
+            self._table = array('i', (offset // stride for offset in self._delta))
+        return self._table
+
+    def _build_matcher(self, delta=None):
+        """Precompute the structures used by the matching loop"""
+        stride = self.num_classes
+        # Store pre-multiplied offsets so the loop only adds and indexes
+        self._stride = stride
+        if delta is None:
+            delta = [state * stride for state in self._table]
+        self._delta = delta
+        self._start_offset = self.start * stride
+
+        # When every class fits in a byte, str.translate() + encode() turns
+        # the whole input into column numbers in C before the loop runs
+        self._column_map = None
+        ranges = self.symbol_index.ranges
+        if stride <= 256:
+            codes = [ord(symbol) for symbol in self.symbol_index if len(symbol) == 1]
+            if ranges is not None:
+                codes.append(ranges.max_code)
+            size = max(codes, default=0) + 1
+            if size <= BMP_LIMIT:
+                size = 256 if size <= 256 else BMP_LIMIT
+                lookup = [chr(UNKNOWN_CLASS)] * size
+                if ranges is not None:
+                    for first, last, col in ranges:
+                        lookup[first:last + 1] = [chr(col)] * (last - first + 1)
+                for symbol, col in self.symbol_index.items():
+                    if len(symbol) == 1:
+                        lookup[ord(symbol)] = chr(col)
+                self._column_map = ''.join(lookup)
+            else:
+                self._column_map = _ColumnMap(
+                    {ord(symbol): col for symbol, col in self.symbol_index.items() if len(symbol) == 1},
+                    ranges,
+                )
+
+        # The same lookup for raw bytes, each byte read as a latin-1 character
+        if stride <= 256:
+            self._byte_map = bytes(self.symbol_index[chr(byte)] for byte in range(256))
+        else:
+            self._byte_map = None
+
+    def _reads_every_code(self):
+        """Check whether every character maps to a class other than UNKNOWN_CLASS"""
+        intervals = [(ord(symbol), ord(symbol)) for symbol, col in self.symbol_index.items()
+                     if len(symbol) == 1 and col != UNKNOWN_CLASS]
+        if self.symbol_index.ranges is not None:
+            intervals += [(first, last) for first, last, col in self.symbol_index.ranges if col != UNKNOWN_CLASS]
+        return covers_every_code(intervals)
+
+    def _find_decided_states(self):
+        """
+        Mark the states where the verdict of a run can no longer change
+
+        Those are the dead state and every other state that cannot reach an
+        accepting one (sinks), and the accepting states that every class
+        keeps among themselves (accept-forever). Class 0 leads to the dead
+        state, so accept-forever states only exist when no character falls
+        into it.
+
+        Returns:
+            bytearray: 1 for each decided state id
+        """
+        stride = self._stride
+        delta = self._delta
+        num_states = self.num_states
+        predecessors = [[] for _ in range(num_states)]
+        for state in range(num_states):
+            row = state * stride
+            for offset in set(delta[row:row + stride]):
+                predecessors[offset // stride].append(state)
+        live = bytearray(self.accepting)
+        stack = [state for state in range(num_states) if live[state]]
+        while stack:
+            for pred in predecessors[stack.pop()]:
+                if not live[pred]:
+                    live[pred] = 1
+                    stack.append(pred)
+
+        forever = set()
+        if any(self.accepting) and self._reads_every_code():
+            # Every class but 0 must stay among accept-forever states; each
+            # distinct target is a move of its own
+            def moves(state):
+                row = state * stride
+                return [(offset // stride,) for offset in set(delta[row + 1:row + stride])]
+
+            forever = closed_subset((state for state in range(num_states) if self.accepting[state]), moves)
+        return bytearray(not live[state] or state in forever for state in range(num_states))
+
+    def columns(self, input_string):
+        """
+        Translate an input string into column numbers
+
+        Args:
+            input_string (str): The input string
+
+        Returns:
+            Iterable of ints: One class per character, UNKNOWN_CLASS for characters
+                without transitions
+        """
+        if self._column_map is not None:
+            # Characters past the end of the lookup string come through
+            # translate() unchanged and are mapped to class 0 by the codec
+            return input_string.translate(self._column_map).encode('latin-1', 'fsm-unknown-symbol')
+        index = self.symbol_index
+        return [index[symbol] for symbol in input_string]
+
+    def byte_columns(self, data):
+        """
+        Translate raw bytes into column numbers, reading each byte as latin-1
+
+        Args:
+            data (bytes): The input bytes (or any buffer)
+
+        Returns:
+            Iterable of ints: One column per byte
+        """
+        if self._byte_map is not None:
+            return bytes(data).translate(self._byte_map)
+        index = self.symbol_index
+        return [index[chr(byte)] for byte in bytes(data)]
+
+    def byte_delta(self):
+        """
+        Get the byte-level transition table, building it on first use
+
+        Entry state * 256 + byte is the next state's offset (next state * 256),
+        so a buffer can be walked byte by byte without translating it first.
+
+        Returns:
+            list: The flat byte-level table
+        """
+        if self._byte_delta is None:
+            columns = [self.symbol_index[chr(byte)] for byte in range(256)]
+            delta = [DEAD_STATE] * (self.num_states * 256)
+            for state in range(self.num_states):
+                row = state * self.num_classes
+                for byte, col in enumerate(columns):
+                    delta[state * 256 + byte] = self.table[row + col] * 256
+            self._byte_delta = delta
+        return self._byte_delta
+
+    def advance(self, state, columns):
+        """
+        Run the DFA from a given state over already translated columns
+
+        Args:
+            state (int): State id to start from
+            columns: Column numbers from columns() or byte_columns()
+
+        Returns:
+            int: Id of the state reached
+        """
+        delta = self._delta
+        stride = self._stride
+        offset = state * stride
+        for col in columns:
+            offset = delta[offset + col]
+        return offset // stride
+
+    def run(self, input_string):
+        """
+        Run the DFA over a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            int: Id of the final state (DEAD_STATE if the run died)
+        """
+        delta = self._delta
+        offset = self._start_offset
+        for col in self.columns(input_string):
+            offset = delta[offset + col]
+        return offset // self._stride
+
+    def accepts(self, input_string):
+        """
+        Check whether the DFA accepts a string
+
+        Reading stops early once the run is in a decided state: a sink
+        (rejected) or an accept-forever state (accepted).
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        delta = self._delta
+        offset = self._start_offset
+        decided = self._decided_offsets
+        columns = self.columns(input_string)
+        for begin in range(0, len(columns), DECIDED_CHECK_INTERVAL):
+            if offset in decided:
+                break
+            for col in columns[begin:begin + DECIDED_CHECK_INTERVAL]:
+                offset = delta[offset + col]
+        return bool(self.accepting[offset // self._stride])
+
+    def instrument(self, stats):
+        """
+        Switch accepts() to its instrumented variant, or back with None
+
+        Args:
+            stats (RunStats): Statistics every run reports to (see fsm_stats)
+        """
+        install(self, 'accepts', self._accepts_instrumented, stats)
+
+    def _accepts_instrumented(self, stats, input_string):
+        """accepts() that also reports the run to stats, stopping at the dead state"""
+        began = perf_counter()
+        columns = self.columns(input_string)
+        translated = perf_counter()
+        delta = self._delta
+        offset = self._start_offset
+        symbols = 0
+        dead_at = None
+        for col in columns:
+            offset = delta[offset + col]
+            symbols += 1
+            if offset == DEAD_STATE:
+                dead_at = symbols - 1
+                break
+        accepted = bool(self.accepting[offset // self._stride])
+        finished = perf_counter()
+        sizes = Counter({1: symbols}) if dead_at is None else Counter({1: dead_at, 0: 1})
+        stats.record('compiled', symbols, accepted, dead_at, +sizes,
+                     phases={'translate': translated - began, 'run': finished - translated})
+        return accepted
+
+    def accepts_many(self, strings):
+        """
+        Check a batch of strings at once with NumPy
+
+        The strings are sorted by length and encoded as a padded matrix of
+        column numbers. Each column advances every string that is still long
+        enough with one fancy-indexing lookup into the transition table.
+        Without NumPy this falls back to calling accepts() per string.
+
+        Args:
+            strings (list): The input strings
+
+        Returns:
+            numpy.ndarray: Boolean array with one verdict per string, in input
+                order (a plain list of bools when NumPy is not installed)
+        """
+        if np is None:
+            return [self.accepts(s) for s in strings]
+
+        table = self._numpy_table()
+        accepting = np.frombuffer(bytes(self.accepting), dtype=np.uint8).astype(bool)
+        results = np.zeros(len(strings), dtype=bool)
+        # Longest first, so the strings still running are always a prefix of the block
+        order = sorted(range(len(strings)), key=lambda i: len(strings[i]), reverse=True)
+        for block_start in range(0, len(order), BATCH_BLOCK_SIZE):
+            block = order[block_start:block_start + BATCH_BLOCK_SIZE]
+            lengths = np.array([len(strings[i]) for i in block])
+            matrix = self._encode_block([strings[i] for i in block], int(lengths[0]))
+            states = np.full(len(block), self.start, dtype=np.int32)
+            # active[j] is how many strings in the block are longer than j
+            active = np.searchsorted(-lengths, -np.arange(matrix.shape[1]), side='left')
+            for j in range(matrix.shape[1]):
+                k = active[j]
+                states[:k] = table[states[:k], matrix[:k, j]]
+            results[block] = accepting[states]
+        return results
+
+    def _numpy_table(self):
+        """Get the transition table as a (num_states, num_classes) array"""
+        if self._np_table is None:
+            if self._table is None:
+                table = np.asarray(self._delta, dtype=np.int32) // self.num_classes
+            else:
+                table = np.frombuffer(self._table, dtype=np.int32)
+            self._np_table = table.reshape(self.num_states, self.num_classes)
+        return self._np_table
+
+    def _encode_block(self, strings, width):
+        """Encode strings as a zero-padded matrix of column numbers"""
+        if self._column_map is not None:
+            data = b''.join(self.columns(s).ljust(width, b'\0') for s in strings)
+            return np.frombuffer(data, dtype=np.uint8).reshape(len(strings), width)
+        matrix = np.zeros((len(strings), width), dtype=np.int32)
+        for row, s in enumerate(strings):
+            matrix[row, :len(s)] = self.columns(s)
+        return matrix
+
+    def step(self, state, symbol):
+        """
+        Look up a single transition
+
+        Args:
+            state (int): Current state id
+            symbol: Input symbol
+
+        Returns:
+            int: Next state id
+        """
+        return self.table[state * self.num_classes + self.symbol_index[symbol]]
+
+
+def compile_dfa(fsm):
+    """
+    Compile a deterministic FSM into a CompiledDFA
+
+    Args:
+        fsm (FSM): A deterministic FSM
+
+    Returns:
+        CompiledDFA: The compiled machine, accepting exactly the same strings
+    """
+    if not fsm.is_deterministic:
+        raise ValueError("compile_dfa() needs a deterministic FSM")
+
+    # Intern states in a stable order so the same FSM always compiles the same
+    state_names = [None] + sorted(fsm.states, key=str)
+    state_ids = {name: state_id for state_id, name in enumerate(state_names) if state_id}
+
+    # A symbol's behaviour is the set of (source, target) pairs it labels.
+    # Symbols with the same behaviour in every state share one class.
+    behaviour = {}
+    for (src_state, symbol), dest_state in fsm.transitions.items():
+        if not isinstance(symbol, CharRange) and fsm.in_alphabet(symbol):
+            behaviour.setdefault(symbol, {})[state_ids[src_state]] = state_ids[dest_state]
+    labels = sorted(behaviour, key=str)
+    if fsm.has_ranges:
+        # Range transitions add to the behaviour of plain symbols they cover,
+        # and each disjoint range label gets a behaviour of its own
+        labels = symbol_labels(fsm)
+        range_states = [state for state in fsm.states if state in fsm._range_maps]
+        for label in labels:
+            symbol = label.first if isinstance(label, CharRange) else label
+            pairs = behaviour.setdefault(label, {})
+            for state in range_states:
+                dest_state = fsm.target(state, symbol)
+                if dest_state is not None:
+                    pairs[state_ids[state]] = state_ids[dest_state]
+    classes = {}
+    label_classes = []
+    for label in labels:
+        signature = frozenset(behaviour[label].items())
+        label_classes.append(classes.setdefault(signature, len(classes) + 1) if signature else UNKNOWN_CLASS)
+    symbol_classes = label_index(labels, label_classes, UNKNOWN_CLASS)
+
+    num_classes = len(classes) + 1
+    table = array('i', [DEAD_STATE]) * (len(state_names) * num_classes)
+    for signature, col in classes.items():
+        for src_id, dest_id in signature:
+            table[src_id * num_classes + col] = dest_id
+
+    accepting = bytearray(len(state_names))
+    for state in fsm.accept_states:
+        accepting[state_ids[state]] = 1
+
+    return CompiledDFA(state_names, symbol_classes, num_classes, table, state_ids[fsm.start_state],
+                       accepting)
+
+
+def as_compiled(machine):
+    """
+    Get a CompiledDFA for either an FSM or an already compiled machine
+
+    Args:
+        machine (FSM or CompiledDFA): The machine
+
+    Returns:
+        CompiledDFA: The compiled machine
+    """
+    if isinstance(machine, CompiledDFA):
+        return machine
+    return machine.compiled_dfa()
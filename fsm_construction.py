@@ -0,0 +1,399 @@
+"""
+FSM constructions - subset construction (NFA to DFA), Hopcroft minimization
+and trimming
+
+Determinization and minimization work on integer-interned states internally
+and only build state names for the FSM they return, so they scale to
+automata with 10^5+ states. Trimming and dead_ends() only follow the
+transitions dict, whatever the labels.
+"""
+
+from collections import deque
+
+from finite_state_machines import FSM
+from fsm_lazy import nfa_targets
+from fsm_ranges import CharRange, covers_every_code, symbol_labels
+
+
+def _index_fsm(fsm):
+    """
+    Intern the states and symbols of an FSM
+
+    Range-labelled FSMs are indexed by the disjoint labels of symbol_labels(),
+    so the constructions below build range transitions in turn.
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        tuple: (states, symbols, state_ids, targets) where targets[state][col]
+            is a tuple of target state indices
+    """
+    states = sorted(fsm.states, key=str)
+    symbols = symbol_labels(fsm)
+    state_ids = {state: i for i, state in enumerate(states)}
+    targets = [
+        [tuple(state_ids[t] for t in nfa_targets(fsm, state, symbol)) for symbol in symbols]
+        for state in states
+    ]
+    return states, symbols, state_ids, targets
+
+
+def subset_name(states):
+    """Name a DFA state after the NFA states it stands for, e.g. {q0,q1}"""
+    return '{' + ','.join(sorted(map(str, states))) + '}'
+
+
+def determinize(fsm):
+    """
+    Convert an FSM into an equivalent DFA with the subset construction
+
+    Only state-sets reachable from the start state are built, and the empty
+    set is left out so the result stays a partial DFA like the hand-built ones.
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        FSM: A new deterministic FSM
+    """
+    states, symbols, state_ids, targets = _index_fsm(fsm)
+    accepting = {state_ids[state] for state in fsm.accept_states}
+
+    if fsm.is_deterministic:
+        start = frozenset([state_ids[fsm.start_state]])
+    else:
+        start = frozenset(state_ids[state] for state in fsm.start_states())
+    subset_ids = {start: 0}
+    subsets = [start]
+    dfa_transitions = []
+    queue = deque([start])
+    while queue:
+        subset = queue.popleft()
+        row = []
+        for col in range(len(symbols)):
+            next_subset = set()
+            for state in subset:
+                next_subset.update(targets[state][col])
+            if not next_subset:
+                row.append(None)
+                continue
+            next_subset = frozenset(next_subset)
+            next_id = subset_ids.get(next_subset)
+            if next_id is None:
+                next_id = len(subsets)
+                subset_ids[next_subset] = next_id
+                subsets.append(next_subset)
+                queue.append(next_subset)
+            row.append(next_id)
+        dfa_transitions.append(row)
+
+    names = [subset_name(states[i] for i in subset) for subset in subsets]
+    transitions = {}
+    for subset_id, row in enumerate(dfa_transitions):
+        for col, next_id in enumerate(row):
+            if next_id is not None:
+                transitions[(names[subset_id], symbols[col])] = names[next_id]
+    accept_states = {
+        names[subset_id] for subset_id, subset in enumerate(subsets)
+        if not accepting.isdisjoint(subset)
+    }
+
+    return FSM(set(names), set(fsm.alphabet), transitions, names[0], accept_states,
+               is_deterministic=True)
+
+
+def _hopcroft(num_states, num_symbols, delta, accepting):
+    """
+    Partition the states of a complete DFA into equivalence classes
+
+    Args:
+        num_states (int): Number of states
+        num_symbols (int): Number of symbols
+        delta (list): delta[state][col] is the next state
+        accepting (list): accepting[state] is True for accepting states
+
+    Returns:
+        list: block[state] is the equivalence class of each state
+    """
+    # Inverse transitions: inverse[col][state] lists the predecessors
+    inverse = [[[] for _ in range(num_states)] for _ in range(num_symbols)]
+    for state in range(num_states):
+        for col in range(num_symbols):
+            inverse[col][delta[state][col]].append(state)
+
+    final = {state for state in range(num_states) if accepting[state]}
+    non_final = set(range(num_states)) - final
+    blocks = [block for block in (final, non_final) if block]
+    block_of = [0] * num_states
+    for block_id, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = block_id
+
+    # Seeding the worklist with the smaller block is enough (Hopcroft 1971)
+    smaller = min(range(len(blocks)), key=lambda b: len(blocks[b]))
+    waiting = {(smaller, col) for col in range(num_symbols)}
+    stack = list(waiting)
+    while stack:
+        splitter = stack.pop()
+        waiting.discard(splitter)
+        block_id, col = splitter
+        inverse_col = inverse[col]
+
+        # Group the predecessors of the splitter by the block they live in
+        touched = {}
+        for state in blocks[block_id]:
+            for pred in inverse_col[state]:
+                touched.setdefault(block_of[pred], set()).add(pred)
+
+        for touched_id, inside in touched.items():
+            block = blocks[touched_id]
+            if len(inside) == len(block):
+                continue
+            # Split: the predecessors move into a new block
+            block -= inside
+            new_id = len(blocks)
+            blocks.append(inside)
+            for state in inside:
+                block_of[state] = new_id
+            for c in range(num_symbols):
+                if (touched_id, c) in waiting:
+                    pair = (new_id, c)
+                else:
+                    pair = (new_id, c) if len(inside) <= len(block) else (touched_id, c)
+                waiting.add(pair)
+                stack.append(pair)
+    return block_of
+
+
+def minimize(fsm):
+    """
+    Build the minimal DFA equivalent to an FSM with Hopcroft's algorithm
+
+    NFAs are determinized first. The result is trimmed to reachable,
+    co-reachable states and its states are named q0, q1, ... in breadth-first
+    order, so equivalent machines minimize to identical FSMs.
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        FSM: A new minimal deterministic FSM
+    """
+    if not fsm.is_deterministic:
+        fsm = determinize(fsm)
+    states, symbols, state_ids, targets = _index_fsm(fsm)
+    num_symbols = len(symbols)
+
+    # Keep the reachable states and complete the DFA with a dead state
+    start = state_ids[fsm.start_state]
+    reachable = {start: 0}
+    order = [start]
+    for state in order:
+        for target in targets[state]:
+            for next_state in target:
+                if next_state not in reachable:
+                    reachable[next_state] = len(order)
+                    order.append(next_state)
+    dead = len(order)
+    delta = [
+        [reachable[target[0]] if target else dead for target in targets[state]]
+        for state in order
+    ]
+    delta.append([dead] * num_symbols)
+    accept_ids = {state_ids[state] for state in fsm.accept_states}
+    accepting = [state in accept_ids for state in order] + [False]
+
+    block_of = _hopcroft(len(delta), num_symbols, delta, accepting)
+
+    # Rebuild in breadth-first order, dropping the dead block
+    dead_block = block_of[dead]
+    names = {block_of[0]: 'q0'}
+    representative = {block_of[0]: 0}
+    queue = deque([block_of[0]])
+    transitions = {}
+    while queue:
+        block = queue.popleft()
+        state = representative[block]
+        for col in range(num_symbols):
+            next_block = block_of[delta[state][col]]
+            if next_block == dead_block:
+                continue
+            if next_block not in names:
+                names[next_block] = f'q{len(names)}'
+                representative[next_block] = delta[state][col]
+                queue.append(next_block)
+            transitions[(names[block], symbols[col])] = names[next_block]
+    accept_states = {name for block, name in names.items() if accepting[representative[block]]}
+
+    return FSM(set(names.values()), set(fsm.alphabet), transitions, 'q0', accept_states,
+               is_deterministic=True)
+
+
+def _successor_graph(fsm, reverse=False):
+    """Map every state to the states one move (on any label) leads to, or comes from"""
+    graph = {state: set() for state in fsm.states}
+    for (state, _), target in fsm.transitions.items():
+        for next_state in ([target] if fsm.is_deterministic else target):
+            if reverse:
+                graph[next_state].add(state)
+            else:
+                graph[state].add(next_state)
+    return graph
+
+
+def _closure(graph, roots):
+    """All states reachable in a graph from some roots, roots included"""
+    seen = set(roots)
+    stack = list(seen)
+    while stack:
+        for next_state in graph[stack.pop()]:
+            if next_state not in seen:
+                seen.add(next_state)
+                stack.append(next_state)
+    return seen
+
+
+def reachable_states(fsm):
+    """
+    Find the states some input leads to from the start state
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        set: The reachable states
+    """
+    return _closure(_successor_graph(fsm), [fsm.start_state])
+
+
+def coreachable_states(fsm):
+    """
+    Find the states from which some input leads to an accept state
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        set: The co-reachable states
+    """
+    return _closure(_successor_graph(fsm, reverse=True), fsm.accept_states)
+
+
+def _reads_every_code(fsm):
+    """Check whether the alphabet of an FSM admits every character"""
+    intervals = []
+    for label in fsm.alphabet:
+        if isinstance(label, CharRange):
+            intervals.append(label.codes)
+        elif len(label) == 1:
+            intervals.append((ord(label), ord(label)))
+    return covers_every_code(intervals)
+
+
+def closed_subset(candidates, moves):
+    """
+    Find the largest subset of states that runs can never be forced out of
+
+    A state stays while each of its moves has a target that stays. This is
+    a greatest fixed point, computed with a worklist: every move counts its
+    targets still in the subset, and dropping a state only revisits the
+    moves into it, so the cost is linear in the number of move targets.
+
+    Args:
+        candidates: Iterable of the states to start from
+        moves (callable): state -> iterable of target collections, one per
+            symbol (a DFA move has one target)
+
+    Returns:
+        set: The states that stay
+    """
+    kept = set(candidates)
+    # For move i: sources[i] makes it and remaining[i] of its targets are
+    # still kept; into[target] lists the moves that count target
+    sources = []
+    remaining = []
+    into = {}
+    dropped = []
+    for state in kept:
+        for targets in moves(state):
+            inside = [target for target in set(targets) if target in kept]
+            if not inside:
+                dropped.append(state)
+                break
+            for target in inside:
+                into.setdefault(target, []).append(len(sources))
+            sources.append(state)
+            remaining.append(len(inside))
+    while dropped:
+        state = dropped.pop()
+        if state not in kept:
+            continue
+        kept.discard(state)
+        for move in into.get(state, ()):
+            remaining[move] -= 1
+            if not remaining[move] and sources[move] in kept:
+                dropped.append(sources[move])
+    return kept
+
+
+def dead_ends(fsm):
+    """
+    Find the states where the verdict of a run can no longer change
+
+    A sink is a state from which no accept state can be reached: a run that
+    only has sinks left is rejected whatever follows. An accept-forever state
+    is an accept state from which every next symbol leads to another
+    accept-forever state (to at least one, in an NFA): a run that has one
+    active is accepted whatever follows. Symbols outside the alphabet reject,
+    so accept-forever states only exist when the alphabet admits every
+    character, e.g. through CharRange(chr(0), chr(MAX_CODE)).
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        tuple: (sinks, accept_forever), two frozensets of states
+    """
+    sinks = frozenset(fsm.states - coreachable_states(fsm))
+    if not fsm.accept_states or not _reads_every_code(fsm):
+        return sinks, frozenset()
+
+    labels = symbol_labels(fsm)
+    forever = closed_subset(
+        fsm.accept_states,
+        lambda state: (nfa_targets(fsm, state, label) for label in labels),
+    )
+    return sinks, frozenset(forever)
+
+
+def trim(fsm):
+    """
+    Remove the states no accepted run goes through
+
+    A state stays when it is reachable from the start state and co-reachable
+    (some accept state is reachable from it); transitions into removed states
+    are dropped, so a trimmed DFA may be partial. The start state always
+    stays, as the only state of a machine that accepts nothing.
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        FSM: A new FSM accepting the same strings, with the same state names
+    """
+    keep = reachable_states(fsm) & coreachable_states(fsm)
+    keep.add(fsm.start_state)
+    transitions = {}
+    for (state, symbol), target in fsm.transitions.items():
+        if state not in keep:
+            continue
+        if fsm.is_deterministic:
+            if target in keep:
+                transitions[(state, symbol)] = target
+        else:
+            target = {next_state for next_state in target if next_state in keep}
+            if target:
+                transitions[(state, symbol)] = target
+    return FSM(keep, set(fsm.alphabet), transitions, fsm.start_state, fsm.accept_states & keep,
+               is_deterministic=fsm.is_deterministic, engine=fsm.engine)
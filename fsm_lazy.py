@@ -0,0 +1,265 @@
+"""
+Lazy DFA - on-the-fly subset construction for NFAs with a bounded cache
+
+Each distinct set of NFA states is interned the first time a run reaches it,
+and its successor on each symbol is cached. Once the cache is warm a run costs
+one dict lookup per character instead of rebuilding a set of next states.
+"""
+
+import threading
+from collections import Counter
+from time import perf_counter
+
+from fsm_ranges import representative
+from fsm_stats import install
+
+# accepts() checks whether the verdict is already decided once per this many
+# symbols (see fsm_compiled.DECIDED_CHECK_INTERVAL)
+DECIDED_CHECK_INTERVAL = 32
+
+
+def nfa_targets(fsm, state, symbol):
+    """
+    Get the set of next states for one (state, symbol) pair
+
+    Args:
+        fsm (FSM): A DFA or NFA
+        state: The source state
+        symbol: The input symbol, or a CharRange label from symbol_labels()
+
+    Returns:
+        set: The target states, closed under epsilon moves (empty if there
+            is no transition)
+    """
+    target = fsm.target(state, representative(symbol))
+    if target is None:
+        return set()
+    if fsm.is_deterministic:
+        return {target}
+    if fsm.has_epsilon:
+        return fsm.epsilon_closure(target)
+    return target
+
+
+class LazyDFA:
+    """
+    A DFA built lazily from an NFA, one state-set at a time
+
+    The cache holds at most max_states interned state-sets. When it is full
+    the whole cache is flushed and rebuilt from the sets the runs reach next,
+    so pathological NFAs cost time instead of unbounded memory.
+
+    Runs hold a lock, since a flush renumbers the cached state-sets under any
+    run in progress; one matcher can be shared between threads.
+    """
+    def __init__(self, fsm, max_states=10000):
+        """
+        Initialize the lazy DFA
+
+        Args:
+            fsm (FSM): The NFA (or DFA) to determinize
+            max_states (int): Maximum number of cached state-sets
+        """
+        if max_states < 2:
+            raise ValueError("max_states must be at least 2")
+        self.fsm = fsm
+        self.max_states = max_states
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._sinks, self._accept_forever = fsm.dead_ends()
+        self._flush()
+
+    def _flush(self):
+        """Drop every cached state-set"""
+        self._ids = {}
+        self._sets = []
+        self._next = []
+        self._accepting = []
+        self._decided = []
+        self._start = self._intern(frozenset(self.fsm.start_states()))
+
+    def _intern(self, state_set):
+        """
+        Get the id of a state-set, adding it to the cache if needed
+
+        Args:
+            state_set (frozenset): A set of NFA states
+
+        Returns:
+            int: The id of the state-set
+        """
+        state_id = self._ids.get(state_set)
+        if state_id is None:
+            state_id = len(self._sets)
+            self._ids[state_set] = state_id
+            self._sets.append(state_set)
+            self._next.append({})
+            self._accepting.append(not state_set.isdisjoint(self.fsm.accept_states))
+            # Only sinks left (the empty set included) or an accept-forever state
+            self._decided.append(
+                state_set <= self._sinks or not state_set.isdisjoint(self._accept_forever)
+            )
+        return state_id
+
+    def _successor(self, state_id, symbol):
+        """
+        Compute and cache the successor of a state-set on a cache miss
+
+        Args:
+            state_id (int): Id of the current state-set
+            symbol: The input symbol
+
+        Returns:
+            int: Id of the next state-set (valid after a possible flush)
+        """
+        self.misses += 1
+        next_states = set()
+        if self.fsm.in_alphabet(symbol):
+            for state in self._sets[state_id]:
+                next_states.update(nfa_targets(self.fsm, state, symbol))
+        next_states = frozenset(next_states)
+
+        if next_states not in self._ids and len(self._sets) >= self.max_states:
+            self.flushes += 1
+            self._flush()
+            return self._intern(next_states)
+
+        next_id = self._intern(next_states)
+        self._next[state_id][symbol] = next_id
+        return next_id
+
+    def _walk(self, state_id, symbols):
+        """
+        Step a state-set through symbols, computing successors on cache misses
+
+        Args:
+            state_id (int): Id of the current state-set
+            symbols (str): The symbols to read
+
+        Returns:
+            int: Id of the state-set reached (valid after a possible flush)
+        """
+        next_table = self._next
+        misses = self.misses
+        for symbol in symbols:
+            next_id = next_table[state_id].get(symbol)
+            if next_id is None:
+                next_id = self._successor(state_id, symbol)
+                # A flush replaces the table lists
+                next_table = self._next
+            state_id = next_id
+        self.hits += len(symbols) - (self.misses - misses)
+        return state_id
+
+    @property
+    def cache_size(self):
+        """Number of state-sets currently cached"""
+        return len(self._sets)
+
+    def run(self, input_string):
+        """
+        Run the lazy DFA over a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            frozenset: The set of NFA states reached
+        """
+        with self._lock:
+            state_id = self._run(input_string)
+            return self._sets[state_id]
+
+    def advance(self, state_set, input_string):
+        """
+        Run the lazy DFA from a given set of NFA states
+
+        Args:
+            state_set (frozenset): The NFA states to start from (e.g. from an
+                earlier run(), so it survives cache flushes)
+            input_string (str): The input string to process
+
+        Returns:
+            frozenset: The set of NFA states reached
+        """
+        with self._lock:
+            state_id = self._run(input_string, self._intern(frozenset(state_set)))
+            return self._sets[state_id]
+
+    def _run(self, input_string, state_id=None):
+        """Run the matching loop (from the start by default) and return the final state-set id"""
+        if state_id is None:
+            state_id = self._start
+        return self._walk(state_id, input_string)
+
+    def accepts(self, input_string):
+        """
+        Check whether the NFA accepts a string
+
+        Reading stops early once the state-set decides the verdict.
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        with self._lock:
+            # Run first: a flush during the run replaces self._accepting
+            state_id = self._run_until_decided(input_string)
+            return self._accepting[state_id]
+
+    def _run_until_decided(self, input_string):
+        """_run() that stops at the first check that finds a decided state-set"""
+        state_id = self._start
+        length = len(input_string)
+        consumed = 0
+        # self._decided is looked up each time, since a flush replaces it
+        while consumed < length and not self._decided[state_id]:
+            state_id = self._walk(state_id, input_string[consumed:consumed + DECIDED_CHECK_INTERVAL])
+            consumed += DECIDED_CHECK_INTERVAL
+        return state_id
+
+    def instrument(self, stats):
+        """
+        Switch accepts() to its instrumented variant, or back with None
+
+        Args:
+            stats (RunStats): Statistics every run reports to (see fsm_stats)
+        """
+        install(self, 'accepts', self._accepts_instrumented, stats)
+
+    def _accepts_instrumented(self, stats, input_string):
+        """accepts() that also reports the run to stats, stopping at the empty set"""
+        with self._lock:
+            return self._run_instrumented(stats, input_string)
+
+    def _run_instrumented(self, stats, input_string):
+        """The instrumented matching loop, run under the lock"""
+        began = perf_counter()
+        determinizing = 0.0
+        sizes = Counter()
+        misses = self.misses
+        state_id = self._start
+        symbols = 0
+        dead_at = None
+        for symbol in input_string:
+            missed = self.misses
+            computing = perf_counter()
+            state_id = self._walk(state_id, symbol)
+            if self.misses != missed:
+                determinizing += perf_counter() - computing
+            symbols += 1
+            size = len(self._sets[state_id])
+            sizes[size] += 1
+            if not size:
+                dead_at = symbols - 1
+                break
+        misses = self.misses - misses
+        accepted = self._accepting[state_id]
+        elapsed = perf_counter() - began
+        stats.record('lazy', symbols, accepted, dead_at, sizes, symbols - misses, misses,
+                     {'determinize': determinizing, 'run': elapsed - determinizing})
+        return accepted
@@ -0,0 +1,195 @@
+"""
+Maximal-munch lexer - splits text into tokens with one combined DFA
+
+Lexer takes token rules as (token_type, FSM) pairs in priority order and
+builds one DFA over tuples of rule states, like the eager product of
+fsm_product, whose accept states are tagged with the first rule that accepts
+there. tokens() then scans the input once: from each token start it runs the
+DFA as far as some rule could still match, remembers the last position where
+a tag was seen, and emits (token_type, start, end) for that longest match,
+earlier rules winning ties. Empty matches are never emitted.
+
+Plain maximal munch backtracks, so rules like 'a' and 'a*b' on 'aaa...a'
+rescan the rest of the input for every token, which is quadratic. The scan
+here follows Reps ("Maximal-munch tokenization in linear time", TOPLAS 1998):
+every (state, position) pair read after the last accept of a scan can never
+lead to an accept, and is recorded so later scans stop as soon as they reach
+it. A pair is recorded at most once and never read past again, the steps up
+to each token's end add up to the input length, and each scan makes one more
+step where it stops, so n characters cost at most (num_states + 2) * n
+transitions: linear for a fixed lexer. Recorded pairs behind the current
+token are dropped from time to time, so their memory follows how far scans
+read ahead rather than the input length.
+"""
+
+from collections import deque
+
+from finite_state_machines import FSM
+from fsm_lazy import nfa_targets
+from fsm_product import product_labels
+from fsm_ranges import representative
+
+# tokens() drops remembered failures behind the scan once it holds this many
+# (and twice as many as after the last pruning)
+FAILED_PRUNE_SIZE = 1 << 16
+
+
+class Lexer:
+    """
+    A prioritized set of token rules compiled into one tagged DFA
+    """
+    def __init__(self, rules):
+        """
+        Build the combined DFA
+
+        Args:
+            rules: (token_type, FSM) pairs in priority order, or a dict of
+                token_type -> FSM in priority order. The FSMs may be DFAs or
+                NFAs with epsilon moves and ranges.
+        """
+        if isinstance(rules, dict):
+            rules = list(rules.items())
+        if not rules:
+            raise ValueError("A lexer needs at least one rule")
+        self.token_types = [token_type for token_type, _ in rules]
+        # Trimmed rules drop out of the combined state as soon as they can
+        # no longer match, so scans stop at the dead state early
+        self.rules = [fsm.trim() for _, fsm in rules]
+        self.dfa, tags = self._combine()
+        self.compiled = self.dfa.compile()
+
+        # Tag of each compiled state (the token type index, or None), and
+        # the offsets where no rule can match any more
+        compiled = self.compiled
+        self._tags = [tags.get(name) for name in compiled.state_names]
+        self._sinks = frozenset(
+            state * compiled.num_classes for state in range(compiled.num_states)
+            if compiled.decided[state] and not compiled.accepting[state]
+        )
+
+    @classmethod
+    def from_regexes(cls, rules, alphabet=None):
+        """
+        Build a lexer from regular expressions (see fsm_regex)
+
+        Args:
+            rules: (token_type, pattern) pairs in priority order, or a dict
+            alphabet (set): Symbols '.' and negated classes range over
+
+        Returns:
+            Lexer: The lexer
+        """
+        from fsm_regex import regex_to_nfa
+        if isinstance(rules, dict):
+            rules = list(rules.items())
+        return cls([(token_type, regex_to_nfa(pattern, alphabet)) for token_type, pattern in rules])
+
+    def _combine(self):
+        """
+        Build the DFA over tuples of rule state-sets reachable from the start
+
+        Returns:
+            tuple: (FSM, tags) where tags maps each accepting state name to the
+                index of the first rule accepting there
+        """
+        labels = product_labels(self.rules)
+        start = tuple(frozenset(fsm.start_states()) for fsm in self.rules)
+        dead = tuple(frozenset() for _ in self.rules)
+        names = {start: 'q0'}
+        queue = deque([start])
+        transitions = {}
+        while queue:
+            state = queue.popleft()
+            for label in labels:
+                next_state = []
+                for fsm, component in zip(self.rules, state):
+                    targets = set()
+                    if component and fsm.in_alphabet(representative(label)):
+                        for src_state in component:
+                            targets.update(nfa_targets(fsm, src_state, label))
+                    next_state.append(frozenset(targets))
+                next_state = tuple(next_state)
+                if next_state == dead:
+                    continue
+                if next_state not in names:
+                    names[next_state] = f'q{len(names)}'
+                    queue.append(next_state)
+                transitions[(names[state], label)] = names[next_state]
+
+        tags = {}
+        for state, name in names.items():
+            for index, (fsm, component) in enumerate(zip(self.rules, state)):
+                if not component.isdisjoint(fsm.accept_states):
+                    tags[name] = index
+                    break
+        alphabet = set()
+        for fsm in self.rules:
+            alphabet |= fsm.alphabet
+        dfa = FSM(set(names.values()), alphabet, transitions, 'q0', set(tags), is_deterministic=True)
+        return dfa, tags
+
+    @property
+    def num_states(self):
+        """Number of states of the combined DFA, including the dead state"""
+        return self.compiled.num_states
+
+    def tokens(self, text):
+        """
+        Split a string into tokens, longest match first
+
+        Tokens are yielded as soon as they are found. When no rule matches
+        a non-empty prefix of the rest of the input, ValueError is raised
+        after the tokens before it have been yielded.
+
+        Args:
+            text (str): The input
+
+        Yields:
+            tuple: (token_type, start, end) with text[start:end] the token
+        """
+        compiled = self.compiled
+        delta = compiled._delta
+        stride = compiled.num_classes
+        start_offset = compiled._start_offset
+        tags = self._tags
+        sinks = self._sinks
+        columns = compiled.columns(text)
+        length = len(columns)
+        # (state, position) pairs known to lead to no accept, as
+        # offset + position * size
+        size = compiled.num_states * stride
+        failed = set()
+        prune_at = FAILED_PRUNE_SIZE
+        start = 0
+        while start < length:
+            offset = start_offset
+            position = start
+            end = -1
+            tag = None
+            # Pairs read since the last accept of this scan
+            pending = []
+            while position < length:
+                offset = delta[offset + columns[position]]
+                position += 1
+                if offset in sinks:
+                    break
+                key = offset + position * size
+                if key in failed:
+                    break
+                state_tag = tags[offset // stride]
+                if state_tag is not None:
+                    end = position
+                    tag = state_tag
+                    pending.clear()
+                else:
+                    pending.append(key)
+            failed.update(pending)
+
+            if end < 0:
+                raise ValueError(f"No token matches at position {start}")
+            yield self.token_types[tag], start, end
+            start = end
+            if len(failed) > prune_at:
+                # Later scans never go back behind the current start
+                failed = {key for key in failed if key // size > start}
+                prune_at = max(FAILED_PRUNE_SIZE, 2 * len(failed))
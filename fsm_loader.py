@@ -0,0 +1,430 @@
+"""
+FSM definition loader - one parser for every definition format, with a cache
+
+Three formats are understood, and all of them are turned into the same
+definition dict before an FSM is built:
+
+    JSON machine      {"states": [...], "alphabet": [...], "transitions": {...}, ...}
+                      as typed into the custom tab of fsm_app.py
+    JSON collection   several named machines, like transition_tables.json
+    INI               [General], [States] and [Transition_N] sections, like
+                      dfa_config.txt and nfa_config.txt
+
+Alphabet entries and symbols may use the range syntax of fsm_ranges.
+
+load_compiled_definition() also caches the compiled machine on disk in the
+fsm_binary format, keyed by a hash of the source, so loading an unchanged
+definition again skips parsing and compilation and just maps the file.
+load_compiled_machines() caches every machine of a file under one hash of
+it, with a manifest of the machine names, so a warm load reads no JSON.
+"""
+
+import configparser
+import hashlib
+import json
+import os
+
+from finite_state_machines import FSM
+from fsm_binary import FORMAT_VERSION, load_compiled, save_compiled
+from fsm_ranges import CharRange, alphabet_ranges, parse_label
+
+# Bump when parsing changes in a way that affects the compiled result, so
+# stale cache entries are never loaded
+LOADER_VERSION = 1
+
+REQUIRED_KEYS = ('states', 'alphabet', 'transitions', 'start_state', 'accept_states')
+
+
+def split_list(value):
+    """Split a comma-separated config value into stripped items"""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def config_to_definition(text):
+    """
+    Convert an INI definition like dfa_config.txt into a definition dict
+
+    Each [Transition_N] section names one from_state, symbol and comma-separated
+    to_states. The alphabet is every symbol or range used.
+
+    Args:
+        text (str): The INI source
+
+    Returns:
+        dict: A definition in the JSON machine layout
+    """
+    config = configparser.ConfigParser()
+    config.read_string(text)
+    is_deterministic = config.get('General', 'type', fallback='DFA').strip().upper() == 'DFA'
+    if not config.has_section('States'):
+        raise ValueError("INI definition has no [States] section")
+    states = config['States']
+
+    alphabet = []
+    transitions = {}
+    for section in config.sections():
+        if not section.startswith('Transition'):
+            continue
+        entry = config[section]
+        try:
+            src_state = entry['from_state'].strip()
+            symbol = entry['symbol']
+            targets = split_list(entry['to_states'])
+        except KeyError as error:
+            raise ValueError(f"[{section}] is missing {error}")
+        if symbol not in alphabet:
+            alphabet.append(symbol)
+        state_trans = transitions.setdefault(src_state, {})
+        if is_deterministic:
+            if len(targets) != 1:
+                raise ValueError(f"[{section}] needs exactly one target state in a DFA")
+            if symbol in state_trans:
+                raise ValueError(f"[{section}] repeats the transition of {src_state} on {symbol!r}")
+            state_trans[symbol] = targets[0]
+        else:
+            state_trans.setdefault(symbol, []).extend(targets)
+
+    return {
+        'name': config.get('General', 'name', fallback=None),
+        'states': split_list(states.get('states', '')),
+        'alphabet': alphabet,
+        'transitions': transitions,
+        'start_state': states.get('initial_state', '').strip(),
+        'accept_states': split_list(states.get('accepting_states', '')),
+        'is_deterministic': is_deterministic,
+    }
+
+
+def _covered(label, ranges):
+    """Check whether every character of a CharRange lies in the alphabet ranges"""
+    code, last = label.codes
+    for first, end, _ in ranges:
+        if first <= code <= end:
+            code = end + 1
+            if code > last:
+                return True
+    return False
+
+
+def validate_definition(fsm_def):
+    """
+    Check a definition dict before an FSM is built from it
+
+    Args:
+        fsm_def (dict): A definition in the JSON machine layout
+
+    Raises:
+        ValueError: Listing every problem found
+    """
+    missing = [key for key in REQUIRED_KEYS if key not in fsm_def]
+    if missing:
+        raise ValueError(f"Definition is missing {', '.join(missing)}")
+
+    problems = []
+    states = set(fsm_def['states'])
+    is_deterministic = fsm_def.get('is_deterministic', True)
+    alphabet = set()
+    for label in fsm_def['alphabet']:
+        try:
+            alphabet.add(parse_label(label))
+        except ValueError as error:
+            problems.append(str(error))
+    ranges = alphabet_ranges(alphabet)
+
+    if fsm_def['start_state'] not in states:
+        problems.append(f"start state {fsm_def['start_state']!r} is not a state")
+    for state in fsm_def['accept_states']:
+        if state not in states:
+            problems.append(f"accept state {state!r} is not a state")
+
+    for src_state, state_trans in fsm_def['transitions'].items():
+        if src_state not in states:
+            problems.append(f"transitions leave unknown state {src_state!r}")
+        for symbol, dest_state in state_trans.items():
+            try:
+                label = parse_label(symbol)
+            except ValueError as error:
+                problems.append(str(error))
+                continue
+            if isinstance(label, CharRange):
+                known = label in alphabet or _covered(label, ranges)
+            else:
+                known = label in alphabet or (len(label) == 1 and ranges.lookup(ord(label), False))
+            if not known:
+                problems.append(f"symbol {symbol!r} of state {src_state!r} is not in the alphabet")
+            if is_deterministic and not isinstance(dest_state, str):
+                problems.append(f"state {src_state!r} has several targets on {symbol!r} in a DFA")
+            targets = [dest_state] if isinstance(dest_state, str) else dest_state
+            for target in targets:
+                if target not in states:
+                    problems.append(f"transition {src_state!r} --{symbol}--> {target!r} leads to an unknown state")
+
+    if problems:
+        raise ValueError("Invalid FSM definition:\n  " + "\n  ".join(problems))
+
+
+def fsm_from_definition(fsm_def):
+    """
+    Build an FSM from a JSON definition like the ones in transition_tables.json
+
+    Alphabet entries and transition symbols may be ranges such as "a-z" or
+    "U+0400-U+04FF" (see fsm_ranges.parse_label).
+    """
+    is_deterministic = fsm_def.get("is_deterministic", True)
+    transitions = {}
+    for src_state, state_trans in fsm_def["transitions"].items():
+        for symbol, dest_state in state_trans.items():
+            symbol = parse_label(symbol)
+            if is_deterministic:
+                transitions[(src_state, symbol)] = dest_state
+            elif isinstance(dest_state, list):
+                transitions[(src_state, symbol)] = set(dest_state)
+            else:
+                transitions[(src_state, symbol)] = {dest_state}
+
+    return FSM(
+        set(fsm_def["states"]), {parse_label(symbol) for symbol in fsm_def["alphabet"]}, transitions,
+        fsm_def["start_state"], set(fsm_def["accept_states"]), is_deterministic
+    )
+
+
+def fsm_from_config(text):
+    """Build an FSM from an INI definition like dfa_config.txt"""
+    return fsm_from_definition(config_to_definition(text))
+
+
+def collection_names(collection):
+    """Get the names of the machine entries in a JSON collection, in file order"""
+    return [key for key, value in collection.items() if isinstance(value, dict) and 'states' in value]
+
+
+def parse_definition(text, name=None):
+    """
+    Parse a definition in any of the supported formats and validate it
+
+    Args:
+        text (str): The source text
+        name (str): Entry to use from a JSON collection (optional when it
+            holds exactly one machine)
+
+    Returns:
+        dict: The validated definition in the JSON machine layout
+    """
+    if not text.lstrip().startswith('{'):
+        fsm_def = config_to_definition(text)
+    else:
+        try:
+            fsm_def = json.loads(text)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Invalid JSON definition: {error}")
+        if 'states' not in fsm_def:
+            # A collection of named machines like transition_tables.json
+            machines = collection_names(fsm_def)
+            if name is None:
+                if len(machines) != 1:
+                    raise ValueError(f"Pick one of the machines in the file: {', '.join(machines)}")
+                name = machines[0]
+            if name not in machines:
+                raise ValueError(f"No machine named {name!r}; the file holds {', '.join(machines)}")
+            fsm_def = fsm_def[name]
+    validate_definition(fsm_def)
+    return fsm_def
+
+
+def load_fsm(path, name=None):
+    """
+    Load an FSM from a definition file in any supported format
+
+    Args:
+        path (str): Path of the definition file
+        name (str): Entry to use from a JSON collection
+
+    Returns:
+        FSM: The machine
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        return fsm_from_definition(parse_definition(file.read(), name))
+
+
+def load_fsms(path):
+    """
+    Load every machine of a definition file
+
+    Args:
+        path (str): Path of a JSON collection, or of a file holding one machine
+
+    Returns:
+        dict: Machine name -> FSM, in file order
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        return _parse_machines(file.read(), path)
+
+
+def _parse_machines(text, path):
+    """Build every machine of a definition source, named as load_fsms() names them"""
+    if text.lstrip().startswith('{'):
+        try:
+            collection = json.loads(text)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Invalid JSON definition: {error}")
+        if 'states' not in collection:
+            machines = {}
+            for name in collection_names(collection):
+                validate_definition(collection[name])
+                machines[name] = fsm_from_definition(collection[name])
+            return machines
+    fsm_def = parse_definition(text)
+    name = fsm_def.get('name') or os.path.splitext(os.path.basename(path))[0]
+    return {name: fsm_from_definition(fsm_def)}
+
+
+def default_cache_dir():
+    """Directory for compiled artifacts: $FSM_CACHE_DIR or ~/.cache/fsm"""
+    return os.environ.get('FSM_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'fsm')
+
+
+def source_key(source, name=None):
+    """
+    Hash a definition source into its cache key
+
+    The key covers the loader and binary format versions and the entry name,
+    so any change to what would be compiled gives a new key.
+
+    Args:
+        source (bytes): The raw definition file contents
+        name (str): Entry name for JSON collections
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(f'{LOADER_VERSION}:{FORMAT_VERSION}:{name or ""}\0'.encode('utf-8'))
+    digest.update(source)
+    return digest.hexdigest()
+
+
+def compile_source(source, name=None, cache_dir=None, use_cache=True):
+    """
+    Get the compiled machine for a definition source, through the cache
+
+    Args:
+        source (bytes): The raw definition file contents
+        name (str): Entry to use from a JSON collection
+        cache_dir (str): Cache directory (default: default_cache_dir())
+        use_cache (bool): Read and write the cache
+
+    Returns:
+        CompiledDFA: The compiled machine (NFAs are determinized)
+    """
+    path = os.path.join(cache_dir or default_cache_dir(), source_key(source, name) + '.fsmc')
+    if use_cache and os.path.exists(path):
+        try:
+            return load_compiled(path)
+        except ValueError:
+            pass  # corrupt or from another format version: rebuild it
+
+    compiled = fsm_from_definition(parse_definition(source.decode('utf-8'), name)).compiled_dfa()
+    if use_cache:
+        _store(path, lambda temporary: save_compiled(compiled, temporary))
+    return compiled
+
+
+def _store(path, write):
+    """
+    Write a cache file under a private name and rename it into place
+
+    Readers never see a partial file, and a cache that cannot be written is
+    only skipped.
+
+    Args:
+        path (str): The cache file
+        write (callable): Writes the contents to the path it is given
+
+    Returns:
+        bool: True if the file was stored
+    """
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write(temporary)
+        os.replace(temporary, path)
+        return True
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return False
+
+
+def _write_manifest(names, path):
+    """Write machine names one per line"""
+    with open(path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write(''.join(name + '\n' for name in names))
+
+
+def _read_manifest(path):
+    """Read the machine names of a manifest written by _write_manifest()"""
+    with open(path, 'r', encoding='utf-8', newline='\n') as file:
+        return file.read().split('\n')[:-1]
+
+
+def load_compiled_definition(path, name=None, cache_dir=None, use_cache=True):
+    """
+    Load a definition file straight to the compiled engine, through the cache
+
+    Args:
+        path (str): Path of the definition file
+        name (str): Entry to use from a JSON collection
+        cache_dir (str): Cache directory (default: default_cache_dir())
+        use_cache (bool): Read and write the cache
+
+    Returns:
+        CompiledDFA: The compiled machine
+    """
+    with open(path, 'rb') as file:
+        source = file.read()
+    return compile_source(source, name, cache_dir, use_cache)
+
+
+def load_compiled_machines(path, cache_dir=None, use_cache=True):
+    """
+    Load every machine of a definition file compiled, through the cache
+
+    The source is hashed once. A cache hit reads the manifest of machine
+    names stored under that hash and maps each binary, without parsing the
+    definitions.
+
+    Args:
+        path (str): A JSON collection, or a file holding one machine
+        cache_dir (str): Cache directory (default: default_cache_dir())
+        use_cache (bool): Read and write the cache
+
+    Returns:
+        dict: Machine name -> CompiledDFA, in file order
+    """
+    with open(path, 'rb') as file:
+        source = file.read()
+    # Machines are cached as <key>.<index>.fsmc, named by <key>.names; the
+    # file name is part of the key because single machines may be named by it
+    key = source_key(source, os.path.basename(path))
+    cache_dir = cache_dir or default_cache_dir()
+    manifest = os.path.join(cache_dir, key + '.names')
+
+    def binary(index):
+        return os.path.join(cache_dir, f'{key}.{index}.fsmc')
+
+    if use_cache and os.path.exists(manifest):
+        try:
+            names = _read_manifest(manifest)
+            return {name: load_compiled(binary(index)) for index, name in enumerate(names)}
+        except (OSError, ValueError):
+            pass  # incomplete or stale: rebuild it
+
+    machines = {name: fsm.compiled_dfa() for name, fsm in _parse_machines(source.decode('utf-8'), path).items()}
+    if use_cache and not any('\n' in name for name in machines):
+        # The manifest goes last, so a hit always finds every binary
+        stored = all(
+            _store(binary(index), lambda temporary, compiled=compiled: save_compiled(compiled, temporary))
+            for index, compiled in enumerate(machines.values())
+        )
+        if stored:
+            _store(manifest, lambda temporary: _write_manifest(machines, temporary))
+    return machines
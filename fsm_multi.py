@@ -0,0 +1,171 @@
+"""
+Multi-pattern matching - many FSMs evaluated together in one pass
+
+MultiMatcher merges its machines into one automaton and determinizes it
+lazily like the LazyDFA. A merged state is a tuple with one LazyDFA state-set
+id per pattern; each merged state reached is interned once with its
+successors cached, and it carries the set of pattern ids that accept there.
+Once warm, a string costs one dict lookup per character however many
+patterns there are. Only the merged states the inputs actually reach are
+built, which for typical rule sets (mostly literal keywords and anchored
+prefixes) stays far below the product of the pattern sizes, and building one
+costs a cached per-pattern lookup for each pattern.
+"""
+
+import sys
+
+from fsm_lazy import LazyDFA
+
+
+class MultiMatcher:
+    """
+    A set of FSMs matched in a single pass, reporting which of them accept
+
+    The cache holds at most max_states merged states and is flushed when it
+    fills up.
+    """
+    def __init__(self, fsms, max_states=10000):
+        """
+        Initialize the matcher
+
+        Args:
+            fsms: Dict of pattern id -> FSM, or a list of FSMs (ids are the
+                list positions)
+            max_states (int): Maximum number of cached merged states
+        """
+        if max_states < 2:
+            raise ValueError("max_states must be at least 2")
+        if not isinstance(fsms, dict):
+            fsms = dict(enumerate(fsms))
+        self.ids = list(fsms)
+        self.fsms = list(fsms.values())
+        self.max_states = max_states
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self._flush()
+
+    @classmethod
+    def from_file(cls, path, max_states=10000):
+        """
+        Build a matcher for every machine of a definition file
+
+        Args:
+            path (str): A JSON collection like transition_tables.json, or any
+                single-machine definition fsm_loader understands
+            max_states (int): Maximum number of cached merged states
+
+        Returns:
+            MultiMatcher: A matcher whose pattern ids are the machine names
+        """
+        from fsm_loader import load_fsms
+        return cls(load_fsms(path), max_states)
+
+    def _flush(self):
+        """Drop every cached merged state, and the per-pattern caches with them"""
+        # The pattern caches are only bounded through this flush, so their
+        # ids stay valid for as long as the merged states that hold them
+        self._patterns = [LazyDFA(fsm, sys.maxsize) for fsm in self.fsms]
+        self._ids = {}
+        self._states = []
+        self._next = []
+        self._matches = []
+        self._start = self._intern(tuple(pattern._start for pattern in self._patterns))
+
+    def _intern(self, state):
+        """
+        Get the id of a merged state, adding it to the cache if needed
+
+        Args:
+            state (tuple): One LazyDFA state-set id per pattern
+
+        Returns:
+            int: The id of the merged state
+        """
+        state_id = self._ids.get(state)
+        if state_id is None:
+            state_id = len(self._states)
+            self._ids[state] = state_id
+            self._states.append(state)
+            self._next.append({})
+            self._matches.append(frozenset(
+                self.ids[number] for number, (pattern, part) in enumerate(zip(self._patterns, state))
+                if pattern._accepting[part]
+            ))
+        return state_id
+
+    def _successor(self, state_id, symbol):
+        """Compute and cache the successor of a merged state on a cache miss"""
+        self.misses += 1
+        next_state = []
+        for pattern, part in zip(self._patterns, self._states[state_id]):
+            next_part = pattern._next[part].get(symbol)
+            if next_part is None:
+                next_part = pattern._successor(part, symbol)
+            next_state.append(next_part)
+        next_state = tuple(next_state)
+
+        if next_state not in self._ids and len(self._states) >= self.max_states:
+            self.flushes += 1
+            state_sets = [pattern._sets[part] for pattern, part in zip(self._patterns, next_state)]
+            self._flush()
+            # Start over from the pattern state-sets the run just reached
+            return self._intern(tuple(
+                pattern._intern(state_set) for pattern, state_set in zip(self._patterns, state_sets)
+            ))
+
+        next_id = self._intern(next_state)
+        self._next[state_id][symbol] = next_id
+        return next_id
+
+    @property
+    def cache_size(self):
+        """Number of merged states currently cached"""
+        return len(self._states)
+
+    def match(self, input_string):
+        """
+        Find every pattern that accepts a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            frozenset: Ids of the accepting patterns
+        """
+        state_id = self._start
+        next_table = self._next
+        misses = self.misses
+        for symbol in input_string:
+            next_id = next_table[state_id].get(symbol)
+            if next_id is None:
+                next_id = self._successor(state_id, symbol)
+                # A flush replaces the table lists
+                next_table = self._next
+            state_id = next_id
+        self.hits += len(input_string) - (self.misses - misses)
+        return self._matches[state_id]
+
+    def match_many(self, strings):
+        """
+        Find the accepting patterns of each string in a batch
+
+        Args:
+            strings: Iterable of input strings
+
+        Returns:
+            list: One frozenset of pattern ids per string, in input order
+        """
+        return [self.match(s) for s in strings]
+
+    def accepts(self, input_string):
+        """
+        Check whether any pattern accepts a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if at least one pattern accepts
+        """
+        return bool(self.match(input_string))
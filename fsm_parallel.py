@@ -0,0 +1,470 @@
+"""
+Parallel FSM evaluation - batches split across a process pool
+
+The compiled transition table is copied once into multiprocessing shared
+memory. Workers attach to it by name and index it through a memoryview,
+so no worker unpickles or rebuilds its own copy of the table. Results come
+back in input order.
+
+A single huge input is parallelized by transition-function composition:
+each worker computes where every start state ends up after its chunk, and
+the per-chunk mappings are then chained from the real start state. For a
+file, parallel_run_file() only sends byte offsets, and each worker maps the
+file and reads its chunk one window at a time.
+"""
+
+import mmap
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from fsm_compiled import as_compiled
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Each worker gets about this many chunks, so uneven chunks still balance out
+CHUNKS_PER_WORKER = 4
+
+# Chunk mappings merge states that have converged after every block of this
+# many symbols; most DFAs collapse to a handful of distinct states quickly
+MAPPING_BLOCK = 64
+
+# Below this many tracked states a per-state Python loop beats a NumPy step
+NUMPY_MIN_WIDTH = 16
+
+# Rough cost of one vectorized NumPy step, in units of one scalar table lookup
+NUMPY_STEP_COST = 20
+
+# Inputs shorter than this never go parallel: process start-up dominates
+MIN_PARALLEL_LENGTH = 1 << 20
+
+# Bytes of a mapped file translated to columns at a time
+FILE_WINDOW = 1 << 24
+
+# Set in each worker process by _init_worker()
+_worker = {}
+
+
+class SharedTable:
+    """
+    A compiled DFA's matching table placed in shared memory
+
+    The block holds the pre-multiplied transition offsets as C ints followed
+    by one accept flag per state. Use it as a context manager so the block is
+    unlinked when the work is done.
+    """
+    def __init__(self, compiled):
+        """
+        Copy the compiled table into a new shared memory block
+
+        Args:
+            compiled (CompiledDFA): The compiled machine
+        """
+        delta = array('i', compiled._delta)
+        table_bytes = delta.tobytes()
+        self.table_size = len(table_bytes)
+        self.memory = shared_memory.SharedMemory(create=True, size=self.table_size + compiled.num_states)
+        self.memory.buf[:self.table_size] = table_bytes
+        self.memory.buf[self.table_size:self.table_size + compiled.num_states] = compiled.accepting
+        # Everything a worker needs besides the table itself is small
+        self.worker_args = (
+            self.memory.name, self.table_size, compiled._stride, compiled._start_offset,
+            compiled._column_map, compiled._byte_map, compiled.symbol_index, compiled.num_states,
+        )
+
+    def close(self):
+        """Release and unlink the shared memory block"""
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _init_worker(name, table_size, stride, start_offset, column_map, byte_map, symbol_index, num_states):
+    """Attach a worker process to the shared table"""
+    # Pool workers share the parent's resource tracker, which unlinks the
+    # block only once, when the parent does
+    memory = shared_memory.SharedMemory(name=name)
+    _worker.update(
+        memory=memory,
+        table=memory.buf[:table_size].cast('i'),
+        accepting=memory.buf[table_size:table_size + num_states],
+        stride=stride,
+        start_offset=start_offset,
+        column_map=column_map,
+        byte_map=byte_map,
+        symbol_index=symbol_index,
+        num_states=num_states,
+    )
+
+
+def _run_columns(columns):
+    """Walk the shared table over column numbers and return the verdict"""
+    table = _worker['table']
+    offset = _worker['start_offset']
+    for col in columns:
+        offset = table[offset + col]
+    return bool(_worker['accepting'][offset // _worker['stride']])
+
+
+def _accepts_chunk(strings):
+    """Worker task: check a chunk of strings"""
+    column_map = _worker['column_map']
+    if column_map is not None:
+        return [_run_columns(s.translate(column_map).encode('latin-1', 'fsm-unknown-symbol')) for s in strings]
+    index = _worker['symbol_index']
+    return [_run_columns([index[symbol] for symbol in s]) for s in strings]
+
+
+def _columns_for(chunk):
+    """Translate a str or bytes chunk into column numbers inside a worker"""
+    if isinstance(chunk, (bytes, bytearray)):
+        if _worker['byte_map'] is not None:
+            return chunk.translate(_worker['byte_map'])
+        chunk = chunk.decode('latin-1')
+    if _worker['column_map'] is not None:
+        return chunk.translate(_worker['column_map']).encode('latin-1', 'fsm-unknown-symbol')
+    index = _worker['symbol_index']
+    return [index[symbol] for symbol in chunk]
+
+
+def chunk_mapping(table, stride, num_states, columns, stats=None):
+    """
+    Compute the state-to-state mapping of one chunk for every start state
+
+    All start states are advanced together. After each block of symbols the
+    ones that have reached the same state are merged, so the work per symbol
+    is the number of distinct states still in play, not num_states.
+
+    Args:
+        table: Flat table of pre-multiplied offsets (list or int memoryview)
+        stride (int): Row width of the table
+        num_states (int): Number of states
+        columns: Column numbers of the chunk
+        stats (list): If given, the number of tracked states per block is appended
+
+    Returns:
+        list: mapping[state] is the state reached from state after the chunk
+    """
+    tracked = [state * stride for state in range(num_states)]
+    group_of = list(range(num_states))
+    np_table = None
+    for start in range(0, len(columns), MAPPING_BLOCK):
+        block = columns[start:start + MAPPING_BLOCK]
+        if stats is not None:
+            stats.append(len(tracked))
+        if np is not None and len(tracked) >= NUMPY_MIN_WIDTH:
+            if np_table is None:
+                np_table = np.asarray(table)
+            offsets = np.array(tracked, dtype=np.int64)
+            for col in block:
+                offsets = np_table[offsets + col]
+            tracked = offsets.tolist()
+        else:
+            for i, offset in enumerate(tracked):
+                for col in block:
+                    offset = table[offset + col]
+                tracked[i] = offset
+        # Merge start states whose runs have converged
+        merged = {}
+        remap = [merged.setdefault(offset, len(merged)) for offset in tracked]
+        if len(merged) < len(tracked):
+            tracked = list(merged)
+            group_of = [remap[group] for group in group_of]
+    return [tracked[group] // stride for group in group_of]
+
+
+def _mapping_task(chunk):
+    """Worker task: the full state mapping of one chunk"""
+    table = _worker['table']
+    stride = _worker['stride']
+    return chunk_mapping(table, stride, _worker['num_states'], _columns_for(chunk))
+
+
+def _advance(offset, columns):
+    """Walk the shared table from an offset over column numbers"""
+    table = _worker['table']
+    for col in columns:
+        offset = table[offset + col]
+    return offset
+
+
+def _run_task(chunk):
+    """Worker task: run the first chunk from the start state only"""
+    return _advance(_worker['start_offset'], _columns_for(chunk)) // _worker['stride']
+
+
+def _file_windows(path, start, end):
+    """Yield the column numbers of a byte range of a file, one FILE_WINDOW at a time"""
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for position in range(start, end, FILE_WINDOW):
+            yield _columns_for(buffer[position:min(position + FILE_WINDOW, end)])
+
+
+def _run_file_task(path, start, end):
+    """Worker task: run the first byte range of a file from the start state only"""
+    offset = _worker['start_offset']
+    for columns in _file_windows(path, start, end):
+        offset = _advance(offset, columns)
+    return offset // _worker['stride']
+
+
+def _mapping_file_task(path, start, end):
+    """Worker task: the full state mapping of a byte range of a file"""
+    table = _worker['table']
+    stride = _worker['stride']
+    num_states = _worker['num_states']
+    mapping = list(range(num_states))
+    for columns in _file_windows(path, start, end):
+        window = chunk_mapping(table, stride, num_states, columns)
+        mapping = [window[state] for state in mapping]
+    return mapping
+
+
+def estimate_width(machine, sample):
+    """
+    Estimate how many distinct states a chunk mapping has to track
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        sample (str or bytes): A representative piece of the input
+
+    Returns:
+        float: Average number of tracked states per symbol over the sample
+    """
+    compiled = as_compiled(machine)
+    if isinstance(sample, (bytes, bytearray)):
+        columns = compiled.byte_columns(sample)
+    else:
+        columns = compiled.columns(sample)
+    stats = []
+    chunk_mapping(compiled._delta, compiled._stride, compiled.num_states, columns, stats)
+    return sum(stats) / len(stats) if stats else 1.0
+
+
+def composition_pays_off(machine, text, workers, sample_size=4096):
+    """
+    Decide whether parallel_run() will beat a sequential run
+
+    Every chunk after the first is run from all live states at once. Its
+    cost per symbol is the tracked width: one scalar lookup per state, or
+    about NUMPY_STEP_COST lookups for a vectorized step. Going parallel only
+    pays off when the workers outnumber that width, with some margin, and
+    the input is long enough to hide the process start-up.
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        text (str, bytes or mmap): The input
+        workers (int): Number of processes available
+        sample_size (int): Length of the prefix used to estimate the width
+
+    Returns:
+        bool: True if the input should be split across workers
+    """
+    if workers < 2 or len(text) < MIN_PARALLEL_LENGTH:
+        return False
+    width = estimate_width(machine, text[:sample_size])
+    if np is not None:
+        width = min(width, NUMPY_STEP_COST)
+    return workers > 1.5 * width
+
+
+def parallel_run(machine, text, workers=None, force=False):
+    """
+    Run one long input by composing per-chunk state mappings in parallel
+
+    The first chunk is run from the start state alone, the others from every
+    state. Chaining the mappings in order then gives the final state, which
+    takes one lookup per chunk. The chunks are copies sent to the workers;
+    use parallel_run_file() for input that is in a file.
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        text (str or bytes): The input
+        workers (int): Number of processes (default: the CPU count)
+        force (bool): Split the input even when composition_pays_off() says no
+
+    Returns:
+        int: Id of the final state in the compiled machine
+    """
+    compiled = as_compiled(machine)
+    workers = workers or os.cpu_count() or 1
+    if not force and not composition_pays_off(compiled, text, workers):
+        if isinstance(text, (bytes, bytearray)):
+            return compiled.advance(compiled.start, compiled.byte_columns(text))
+        return compiled.run(text)
+
+    chunk_size = max(1, -(-len(text) // workers))
+    chunks = [(text[start:start + chunk_size],) for start in range(0, len(text), chunk_size)]
+    return _compose_chunks(compiled, workers, _run_task, _mapping_task, chunks)
+
+
+def parallel_run_file(machine, path, workers=None, force=False):
+    """
+    Run the contents of a file with parallel_run(), without reading it in
+
+    Workers mmap the file themselves and get only byte offsets, so neither
+    the parent nor the task queue holds a copy of the input. Bytes are
+    read as latin-1 characters, like CompiledDFA.byte_columns().
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        path (str): Path of the file
+        workers (int): Number of processes (default: the CPU count)
+        force (bool): Split the input even when composition_pays_off() says no
+
+    Returns:
+        int: Id of the final state in the compiled machine
+    """
+    compiled = as_compiled(machine)
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(path)
+    if size == 0:
+        return compiled.start
+    if not force:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if not composition_pays_off(compiled, buffer, workers):
+                state = compiled.start
+                for position in range(0, size, FILE_WINDOW):
+                    state = compiled.advance(state, compiled.byte_columns(buffer[position:position + FILE_WINDOW]))
+                return state
+
+    chunk_size = -(-size // workers)
+    chunks = [(path, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+    return _compose_chunks(compiled, workers, _run_file_task, _mapping_file_task, chunks)
+
+
+def _compose_chunks(compiled, workers, run_task, mapping_task, chunks):
+    """Run the first chunk from the start state and chain the mappings of the others"""
+    if not chunks:
+        return compiled.start
+    with SharedTable(compiled) as shared, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=shared.worker_args) as pool:
+        first = pool.submit(run_task, *chunks[0])
+        mappings = [pool.submit(mapping_task, *chunk) for chunk in chunks[1:]]
+        state = first.result()
+        for mapping in mappings:
+            state = mapping.result()[state]
+    return state
+
+
+def parallel_accepts_string(machine, text, workers=None, force=False):
+    """
+    Check one long input with parallel_run()
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        text (str or bytes): The input
+        workers (int): Number of processes (default: the CPU count)
+        force (bool): Split the input even when composition_pays_off() says no
+
+    Returns:
+        bool: True if the input is accepted, False otherwise
+    """
+    compiled = as_compiled(machine)
+    return bool(compiled.accepting[parallel_run(compiled, text, workers, force)])
+
+
+def _scan_lines_chunk(path, start, end):
+    """Worker task: check the lines of one newline-aligned byte range of a file"""
+    byte_map = _worker['byte_map']
+    index = _worker['symbol_index']
+    results = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        position = start
+        while position < end:
+            line_end = buffer.find(b'\n', position, end)
+            next_position = line_end + 1
+            if line_end < 0:
+                line_end = next_position = end
+            line = buffer[position:line_end]
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            if byte_map is not None:
+                results.append(_run_columns(line.translate(byte_map)))
+            else:
+                results.append(_run_columns([index[chr(byte)] for byte in line]))
+            position = next_position
+    return results
+
+
+def _chunk_ranges(total, workers, chunk_size):
+    """Split range(total) into (start, end) chunks"""
+    if chunk_size is None:
+        chunk_size = max(1, -(-total // (workers * CHUNKS_PER_WORKER)))
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+
+def parallel_accepts(machine, strings, workers=None, chunk_size=None):
+    """
+    Check a batch of strings across a process pool
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        strings (list): The input strings
+        workers (int): Number of processes (default: the CPU count)
+        chunk_size (int): Strings per task (default: spread evenly)
+
+    Returns:
+        list: One bool per string, in input order
+    """
+    compiled = as_compiled(machine)
+    workers = workers or os.cpu_count() or 1
+    chunks = [strings[start:end] for start, end in _chunk_ranges(len(strings), workers, chunk_size)]
+    with SharedTable(compiled) as shared, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=shared.worker_args) as pool:
+        results = []
+        for chunk_results in pool.map(_accepts_chunk, chunks):
+            results.extend(chunk_results)
+    return results
+
+
+def _line_aligned_ranges(path, pieces):
+    """Split a file into about `pieces` byte ranges that start at line boundaries"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    boundaries = [0]
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for i in range(1, pieces):
+            newline = buffer.find(b'\n', max(size * i // pieces, boundaries[-1]))
+            if newline < 0:
+                break
+            if newline + 1 < size:
+                boundaries.append(newline + 1)
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def parallel_scan_lines(machine, path, workers=None):
+    """
+    Check every line of a file across a process pool
+
+    Workers mmap the file themselves, so only byte offsets are sent to them.
+
+    Args:
+        machine (FSM or CompiledDFA): The machine to run
+        path (str): Path of the file to scan
+        workers (int): Number of processes (default: the CPU count)
+
+    Returns:
+        list: One bool per line, in file order
+    """
+    compiled = as_compiled(machine)
+    workers = workers or os.cpu_count() or 1
+    ranges = _line_aligned_ranges(path, workers * CHUNKS_PER_WORKER)
+    with SharedTable(compiled) as shared, ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=shared.worker_args) as pool:
+        results = []
+        futures = [pool.submit(_scan_lines_chunk, path, start, end) for start, end in ranges]
+        for future in futures:
+            results.extend(future.result())
+    return results
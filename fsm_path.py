@@ -0,0 +1,281 @@
+"""
+Accepting-path reconstruction - a genuine run of the NFA, in bounded memory
+
+find_path() simulates the machine over interned integer state ids and keeps
+one backpointer per active state per step in flat arrays:
+
+    nodes[i]     the state id of node i
+    parents[i]   the node it was reached from (-1 for a root)
+    epsilon[i]   1 when that move was an epsilon move, 0 when it read a symbol
+
+Walking the parents back from an accepting node of the last step gives an
+accepting run, including its epsilon moves. A rejected input gives a run over
+the longest prefix that still has active states.
+
+The arrays cost about 13 bytes per active state per step. With
+checkpoint_interval (or checkpoint=True for an interval of about sqrt(n)),
+the first pass keeps only the active set at every interval-th position, and
+the path is rebuilt one segment at a time from the end, recomputing each
+segment's backpointers from its checkpoint. That costs a second simulation
+pass but only O(sqrt(n)) active sets of memory besides the path itself.
+"""
+
+import math
+from array import array
+
+from finite_state_machines import EPSILON
+
+
+class RunPath:
+    """
+    A run found by find_path(): the states visited and the moves between them
+
+    Iterating yields (state, symbol, next_state) tuples like
+    FSM.get_transition_history(), with EPSILON as the symbol of epsilon moves.
+    """
+    __slots__ = ('accepted', 'consumed', '_names', '_input', '_states', '_epsilon')
+
+    def __init__(self, accepted, consumed, names, input_string, states, epsilon):
+        """
+        Initialize the path from its compact arrays
+
+        Args:
+            accepted (bool): Whether the whole input was accepted along this run
+            consumed (int): Number of input symbols the run reads
+            names (list): State name of each state id
+            input_string: The input the run reads
+            states (array): State id of each node of the run, first to last
+            epsilon (bytearray): For each move, 1 if it is an epsilon move
+        """
+        self.accepted = accepted
+        self.consumed = consumed
+        self._names = names
+        self._input = input_string
+        self._states = states
+        self._epsilon = epsilon
+
+    def __len__(self):
+        """Number of moves in the run"""
+        return len(self._epsilon)
+
+    def __iter__(self):
+        names = self._names
+        states = self._states
+        position = 0
+        for move, is_epsilon in enumerate(self._epsilon):
+            if is_epsilon:
+                symbol = EPSILON
+            else:
+                symbol = self._input[position]
+                position += 1
+            yield names[states[move]], symbol, names[states[move + 1]]
+
+    def states(self):
+        """
+        Get the states of the run in order
+
+        Returns:
+            list: One state name per node, starting with the start state
+        """
+        return [self._names[state] for state in self._states]
+
+    @property
+    def final_state(self):
+        """The state the run ends in"""
+        return self._names[self._states[-1]]
+
+
+class _PathFinder:
+    """
+    An FSM interned to integer ids, with the move tables find_path() needs
+    """
+    def __init__(self, fsm):
+        self.fsm = fsm
+        self.names = sorted(fsm.states, key=str)
+        self.ids = {state: state_id for state_id, state in enumerate(self.names)}
+        self.start = self.ids[fsm.start_state]
+        self.accepting = bytearray(state in fsm.accept_states for state in self.names)
+        if fsm.has_epsilon:
+            self.epsilon_moves = [
+                tuple(self.ids[target] for target in fsm.transitions.get((state, EPSILON), ()))
+                for state in self.names
+            ]
+        else:
+            self.epsilon_moves = None
+        self._moves = {}
+
+    def moves(self, state_id, symbol):
+        """Target ids of one state on one symbol (cached)"""
+        key = (state_id, symbol)
+        targets = self._moves.get(key)
+        if targets is None:
+            target = None
+            if self.fsm.in_alphabet(symbol):
+                target = self.fsm.target(self.names[state_id], symbol)
+            if target is None:
+                targets = ()
+            elif self.fsm.is_deterministic:
+                targets = (self.ids[target],)
+            else:
+                targets = tuple(self.ids[state] for state in target)
+            self._moves[key] = targets
+        return targets
+
+    def closure(self, layer):
+        """Close a list of state ids under epsilon moves"""
+        if self.epsilon_moves is None:
+            return layer
+        seen = set(layer)
+        layer = list(layer)
+        for state_id in layer:
+            for target in self.epsilon_moves[state_id]:
+                if target not in seen:
+                    seen.add(target)
+                    layer.append(target)
+        return layer
+
+    def step(self, layer, symbol):
+        """Advance a closed list of state ids by one symbol"""
+        seen = set()
+        next_layer = []
+        for state_id in layer:
+            for target in self.moves(state_id, symbol):
+                if target not in seen:
+                    seen.add(target)
+                    next_layer.append(target)
+        return self.closure(next_layer)
+
+    def trace(self, roots, input_string, begin, end):
+        """
+        Simulate from a set of root states with backpointers
+
+        Args:
+            roots (list): State ids active at position begin
+            input_string: The input
+            begin (int): Position to start reading at
+            end (int): Position to stop before
+
+        Returns:
+            tuple: (nodes, parents, epsilon, layer_start, stop) where the nodes
+                from layer_start on are the last non-empty layer, reached at
+                position stop (end, or the position whose symbol killed the run)
+        """
+        nodes = array('i', roots)
+        parents = array('q', [-1] * len(roots))
+        epsilon = bytearray(len(roots))
+        self._close_traced(nodes, parents, epsilon, 0)
+        layer_start = 0
+        for position in range(begin, end):
+            symbol = input_string[position]
+            base = len(nodes)
+            seen = set()
+            for index in range(layer_start, base):
+                for target in self.moves(nodes[index], symbol):
+                    if target not in seen:
+                        seen.add(target)
+                        nodes.append(target)
+                        parents.append(index)
+                        epsilon.append(0)
+            if len(nodes) == base:
+                return nodes, parents, epsilon, layer_start, position
+            self._close_traced(nodes, parents, epsilon, base, seen)
+            layer_start = base
+        return nodes, parents, epsilon, layer_start, end
+
+    def _close_traced(self, nodes, parents, epsilon, base, seen=None):
+        """Add the epsilon closure of the layer starting at base, with backpointers"""
+        if self.epsilon_moves is None:
+            return
+        if seen is None:
+            seen = set(nodes[base:])
+        scan = base
+        while scan < len(nodes):
+            for target in self.epsilon_moves[nodes[scan]]:
+                if target not in seen:
+                    seen.add(target)
+                    nodes.append(target)
+                    parents.append(scan)
+                    epsilon.append(1)
+            scan += 1
+
+    def pick(self, nodes, layer_start):
+        """Index of an accepting node of the last layer, or of its first node"""
+        for index in range(layer_start, len(nodes)):
+            if self.accepting[nodes[index]]:
+                return index
+        return layer_start
+
+
+def _walk_back(nodes, parents, epsilon, index):
+    """Follow backpointers to a root; returns (state ids, epsilon flags) reversed"""
+    states = array('i', [nodes[index]])
+    moves = bytearray()
+    while parents[index] >= 0:
+        moves.append(epsilon[index])
+        index = parents[index]
+        states.append(nodes[index])
+    return states, moves
+
+
+def find_path(fsm, input_string, checkpoint_interval=None, checkpoint=False):
+    """
+    Find an accepting run of an FSM over an input, or the longest viable prefix
+
+    Args:
+        fsm (FSM): A DFA or NFA (epsilon moves and ranges are supported)
+        input_string: The input, a str or any sequence of symbols
+        checkpoint_interval (int): Keep only every interval-th active set and
+            recompute backpointers per segment (None keeps all of them)
+        checkpoint (bool): Checkpoint with an interval of about sqrt(len(input))
+
+    Returns:
+        RunPath: An accepting run when the input is accepted; otherwise a run
+            over the longest prefix that leaves some state active
+    """
+    finder = _PathFinder(fsm)
+    length = len(input_string)
+    if checkpoint and checkpoint_interval is None:
+        checkpoint_interval = max(1, int(math.sqrt(length)))
+    if checkpoint_interval is not None and checkpoint_interval < 1:
+        raise ValueError("checkpoint_interval must be at least 1")
+
+    if checkpoint_interval is None:
+        nodes, parents, epsilon, layer_start, stop = finder.trace([finder.start], input_string, 0, length)
+        index = finder.pick(nodes, layer_start)
+        states, moves = _walk_back(nodes, parents, epsilon, index)
+    else:
+        # First pass: only the active sets at the checkpoints
+        checkpoints = [[finder.start]]
+        layer = finder.closure([finder.start])
+        stop = length
+        for position in range(length):
+            if position and position % checkpoint_interval == 0:
+                checkpoints.append(layer)
+            next_layer = finder.step(layer, input_string[position])
+            if not next_layer:
+                stop = position
+                break
+            layer = next_layer
+
+        # Second pass: rebuild the run segment by segment from the end
+        states = array('i')
+        moves = bytearray()
+        required = None
+        for number in range((stop - 1) // checkpoint_interval if stop else 0, -1, -1):
+            begin = number * checkpoint_interval
+            end = min(stop, begin + checkpoint_interval)
+            nodes, parents, epsilon, layer_start, _ = finder.trace(checkpoints[number], input_string, begin, end)
+            if required is None:
+                index = finder.pick(nodes, layer_start)
+            else:
+                index = next(i for i in range(layer_start, len(nodes)) if nodes[i] == required)
+                states.pop()
+            segment_states, segment_moves = _walk_back(nodes, parents, epsilon, index)
+            states.extend(segment_states)
+            moves.extend(segment_moves)
+            required = states[-1]
+
+    states.reverse()
+    moves.reverse()
+    accepted = stop == length and bool(finder.accepting[states[-1]])
+    return RunPath(accepted, stop, finder.names, input_string, states, moves)
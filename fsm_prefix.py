@@ -0,0 +1,239 @@
+"""
+Shared-prefix evaluation - runs that start from the state of a common prefix
+
+Batches of URLs, paths or identifiers repeat long prefixes, and matching each
+string from the start state reads those prefixes again every time.
+
+PrefixMatcher.accepts_many() sorts the batch, so strings sharing a prefix
+are neighbours, and walks the implicit trie of the sorted strings: the
+branch points are the longest common prefixes (LCPs) of neighbours, the
+state reached at each one is kept on a stack while strings below it are
+processed, and every string starts from the deepest branch point it shares
+with the strings before it. Each trie edge, and so each distinct prefix, is
+read once.
+
+For strings that arrive one at a time, accepts() can keep an LRU memo of
+prefix -> state. Prefixes are memoized every block characters, keyed by the
+memo node of the prefix before them and the next block of text, so finding
+the longest memoized prefix costs one dict lookup per block.
+"""
+
+from collections import OrderedDict
+
+# Memoized prefixes are cut every this many characters
+PREFIX_BLOCK = 64
+
+
+def common_prefix_length(a, b):
+    """
+    Get the length of the longest common prefix of two strings
+
+    Slices are compared in C and the length is found by bisection, so long
+    prefixes cost O(log n) comparisons instead of a Python loop per character.
+
+    Args:
+        a (str): A string
+        b (str): Another string
+
+    Returns:
+        int: The number of leading characters they share
+    """
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    low, high = 0, n
+    while high - low > 1:
+        middle = (low + high) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def _dict_steps(fsm):
+    """(start, advance, accepting) for the dict engine, with None as the dead state"""
+    in_alphabet = fsm.in_alphabet
+
+    def advance(state, text):
+        if state is None:
+            return None
+        cursor = fsm.cursor()
+        cursor.current_states = state
+        for symbol in text:
+            if not in_alphabet(symbol) or not cursor.transition(symbol):
+                return None
+        return cursor.current_states
+
+    def accepting(state):
+        if state is None:
+            return False
+        if fsm.is_deterministic:
+            return state in fsm.accept_states
+        return not fsm.accept_states.isdisjoint(state)
+
+    return fsm.cursor().current_states, advance, accepting
+
+
+def _engine_steps(machine):
+    """
+    Get the functions a prefix walk needs for an FSM or a matcher
+
+    Args:
+        machine: An FSM (its selected engine is used), CompiledDFA, LazyDFA
+            or BitsetNFA
+
+    Returns:
+        tuple: (start, advance, accepting) where advance(state, text) returns
+            the state reached from state over text
+    """
+    from finite_state_machines import FSM
+    from fsm_bitset import BitsetNFA
+    from fsm_compiled import CompiledDFA
+    from fsm_lazy import LazyDFA
+
+    if isinstance(machine, FSM):
+        engine = machine.get_engine()
+        if engine is None:
+            return _dict_steps(machine)
+        machine = engine
+    if isinstance(machine, CompiledDFA):
+        def advance(state, text):
+            return machine.advance(state, machine.columns(text))
+        return machine.start, advance, lambda state: bool(machine.accepting[state])
+    if isinstance(machine, LazyDFA):
+        accept_states = machine.fsm.accept_states
+        return machine.run(''), machine.advance, lambda state: not state.isdisjoint(accept_states)
+    if isinstance(machine, BitsetNFA):
+        return machine.start_mask, machine.advance, lambda mask: bool(mask & machine.accept_mask)
+    raise ValueError(f"Cannot walk prefixes with {type(machine).__name__}")
+
+
+class PrefixMatcher:
+    """
+    Matches strings starting from the states of prefixes already read
+
+    symbols counts the characters actually stepped through, so the saving
+    over plain matching is sum(map(len, strings)) - symbols.
+    """
+    def __init__(self, machine, memo_size=0, block=PREFIX_BLOCK):
+        """
+        Initialize the matcher
+
+        Args:
+            machine: An FSM (its selected engine is used), CompiledDFA,
+                LazyDFA or BitsetNFA
+            memo_size (int): Most prefixes accepts() keeps (0 disables the memo)
+            block (int): Characters between memoized prefixes
+        """
+        if memo_size < 0 or block < 1:
+            raise ValueError("memo_size must be at least 0 and block at least 1")
+        self.start, self._advance, self._accepting = _engine_steps(machine)
+        self.memo_size = memo_size
+        self.block = block
+        self.symbols = 0
+        self.hits = 0
+        self.misses = 0
+        # (parent node, block of text) -> (node, state); node 0 is the empty prefix
+        self._memo = OrderedDict()
+        self._nodes = 0
+
+    def advance(self, state, text):
+        """
+        Step a state through some text with the underlying engine
+
+        Args:
+            state: A state of the engine
+            text (str): The characters to read
+
+        Returns:
+            The state reached
+        """
+        self.symbols += len(text)
+        return self._advance(state, text)
+
+    def accepts_many(self, strings):
+        """
+        Check a batch, reading every distinct prefix once
+
+        Args:
+            strings (list): The input strings
+
+        Returns:
+            list: One bool per string, in input order
+        """
+        strings = list(strings)
+        order = sorted(range(len(strings)), key=strings.__getitem__)
+        ordered = [strings[i] for i in order]
+        count = len(ordered)
+        # shared[k]: LCP of ordered[k - 1] and ordered[k] (0 for the first
+        # string and the end sentinel)
+        shared = [0] * (count + 1)
+        for k in range(1, count):
+            shared[k] = common_prefix_length(ordered[k - 1], ordered[k])
+        # smaller[k]: the next k' > k with shared[k'] < shared[k]. The branch
+        # points later strings resume from along ordered[k - 1] are
+        # shared[k], shared[smaller[k]], ... down to where it branched off.
+        smaller = [count] * (count + 1)
+        stack = []
+        for k in range(count, -1, -1):
+            while stack and shared[stack[-1]] >= shared[k]:
+                stack.pop()
+            if stack:
+                smaller[k] = stack[-1]
+            stack.append(k)
+
+        results = [False] * count
+        checkpoints = [(0, self.start)]
+        for k, s in enumerate(ordered):
+            while checkpoints[-1][0] > shared[k]:
+                checkpoints.pop()
+            depth, state = checkpoints[-1]
+            branches = []
+            branch = k + 1
+            while shared[branch] > depth:
+                branches.append(shared[branch])
+                branch = smaller[branch]
+            for branch_depth in reversed(branches):
+                state = self.advance(state, s[depth:branch_depth])
+                depth = branch_depth
+                checkpoints.append((depth, state))
+            results[order[k]] = self._accepting(self.advance(state, s[depth:]))
+        return results
+
+    def accepts(self, input_string):
+        """
+        Check one string, resuming from its longest memoized prefix
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        if not self.memo_size:
+            return self._accepting(self.advance(self.start, input_string))
+        memo = self._memo
+        block = self.block
+        node = 0
+        state = self.start
+        position = 0
+        full = len(input_string) - len(input_string) % block
+        while position < full:
+            key = (node, input_string[position:position + block])
+            entry = memo.get(key)
+            if entry is None:
+                self.misses += 1
+                self._nodes += 1
+                entry = (self._nodes, self.advance(state, key[1]))
+                memo[key] = entry
+                if len(memo) > self.memo_size:
+                    # Children of an evicted prefix are unreachable now and
+                    # age out the same way
+                    memo.popitem(last=False)
+            else:
+                self.hits += 1
+                memo.move_to_end(key)
+            node, state = entry
+            position += block
+        return self._accepting(self.advance(state, input_string[position:]))
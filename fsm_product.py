@@ -0,0 +1,320 @@
+"""
+Product automata - intersection, union, difference and complement of FSMs
+
+A LazyProduct runs several FSMs in lockstep as one machine. Its states are
+tuples with one set of states per operand, and whether a tuple accepts is a
+boolean expression over the operands' verdicts:
+
+    ('fsm', i)          operand i accepts
+    ('and', x, y)       both x and y hold
+    ('or', x, y)        x or y holds
+    ('not', x)          x does not hold
+
+Like the LazyDFA, product states are interned the first time a run reaches
+them and their successors are cached, so a composite rule such as "matches A
+and not B" is one dict lookup per character once warm, and only the pairs the
+inputs actually reach are ever built. to_fsm() instead builds every reachable
+product state up front and minimizes the result, for rules shipped as
+artifacts.
+
+The lazy product reads any symbol: an operand that cannot read a symbol just
+rejects, so a complement accepts it. to_fsm() can only label the symbols of
+the operands' alphabets, so there the complement is relative to the union of
+the alphabets.
+"""
+
+from collections import deque
+
+from finite_state_machines import FSM
+from fsm_construction import minimize, subset_name
+from fsm_lazy import nfa_targets
+from fsm_ranges import CharRange, representative, split_intervals, symbol_labels
+
+_EMPTY = frozenset()
+
+
+def _shift(expression, offset):
+    """Renumber the operand references of an expression by offset"""
+    if expression[0] == 'fsm':
+        return ('fsm', expression[1] + offset)
+    return (expression[0],) + tuple(_shift(operand, offset) for operand in expression[1:])
+
+
+def _evaluate(expression, verdicts):
+    """Evaluate an accept expression over the verdict of each operand"""
+    kind = expression[0]
+    if kind == 'fsm':
+        return verdicts[expression[1]]
+    if kind == 'and':
+        return _evaluate(expression[1], verdicts) and _evaluate(expression[2], verdicts)
+    if kind == 'or':
+        return _evaluate(expression[1], verdicts) or _evaluate(expression[2], verdicts)
+    if kind == 'not':
+        return not _evaluate(expression[1], verdicts)
+    raise ValueError(f"Unknown product operation: {kind}")
+
+
+def _parts(machine):
+    """Get the operands and accept expression of an FSM or a LazyProduct"""
+    if isinstance(machine, LazyProduct):
+        return list(machine.operands), machine.expression
+    return [machine], ('fsm', 0)
+
+
+def combine(operation, left, right=None, max_states=10000):
+    """
+    Build the lazy product of one or two machines
+
+    Args:
+        operation (str): 'and', 'or', 'and not' or 'not'
+        left: An FSM or LazyProduct
+        right: A second FSM or LazyProduct (not used by 'not')
+        max_states (int): Maximum number of cached product states
+
+    Returns:
+        LazyProduct: The combined machine
+    """
+    operands, expression = _parts(left)
+    if operation == 'not':
+        return LazyProduct(operands, ('not', expression), max_states)
+    if right is None:
+        raise ValueError(f"'{operation}' needs two machines")
+    right_operands, right_expression = _parts(right)
+    right_expression = _shift(right_expression, len(operands))
+    if operation == 'and not':
+        right_expression = ('not', right_expression)
+        operation = 'and'
+    if operation not in ('and', 'or'):
+        raise ValueError(f"Unknown product operation: {operation}")
+    return LazyProduct(operands + right_operands, (operation, expression, right_expression), max_states)
+
+
+def product_labels(fsms):
+    """
+    Partition the symbols of several FSMs into labels that behave alike in all
+
+    Args:
+        fsms (list): The FSMs
+
+    Returns:
+        list: Plain symbols, then disjoint CharRanges in code point order
+    """
+    symbols = set()
+    intervals = []
+    for fsm in fsms:
+        for label in symbol_labels(fsm):
+            if isinstance(label, CharRange):
+                intervals.append((*label.codes, True))
+            else:
+                symbols.add(label)
+    plain = {ord(symbol) for symbol in symbols if len(symbol) == 1}
+    cuts = plain | {code + 1 for code in plain}
+    ranges = [
+        CharRange(chr(first), chr(last))
+        for first, last, _ in split_intervals(intervals, cuts)
+        if not (first == last and first in plain)
+    ]
+    return sorted(symbols, key=str) + ranges
+
+
+class LazyProduct:
+    """
+    Several FSMs run in lockstep, with product states built on demand
+
+    The cache holds at most max_states product states and is flushed when it
+    fills up, like the LazyDFA's.
+    """
+    def __init__(self, operands, expression, max_states=10000):
+        """
+        Initialize the lazy product
+
+        Args:
+            operands (list): The FSMs (DFAs or NFAs) run in lockstep
+            expression (tuple): Accept expression over the operand indices
+            max_states (int): Maximum number of cached product states
+        """
+        if max_states < 2:
+            raise ValueError("max_states must be at least 2")
+        self.operands = tuple(operands)
+        self.expression = expression
+        self.max_states = max_states
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self._flush()
+
+    def _flush(self):
+        """Drop every cached product state"""
+        self._ids = {}
+        self._states = []
+        self._next = []
+        self._accepting = []
+        self._start = self._intern(tuple(frozenset(fsm.start_states()) for fsm in self.operands))
+
+    def _intern(self, state):
+        """Get the id of a product state, adding it to the cache if needed"""
+        state_id = self._ids.get(state)
+        if state_id is None:
+            state_id = len(self._states)
+            self._ids[state] = state_id
+            self._states.append(state)
+            self._next.append({})
+            self._accepting.append(self.accepts_state(state))
+        return state_id
+
+    def accepts_state(self, state):
+        """
+        Check whether a product state accepts
+
+        Args:
+            state (tuple): One set of states per operand
+
+        Returns:
+            bool: The accept expression over the operands' verdicts
+        """
+        verdicts = [
+            not component.isdisjoint(fsm.accept_states) for fsm, component in zip(self.operands, state)
+        ]
+        return _evaluate(self.expression, verdicts)
+
+    def successor(self, state, symbol):
+        """
+        Advance a product state by one symbol (uncached)
+
+        Args:
+            state (tuple): One set of states per operand
+            symbol: The input symbol, or a label from product_labels()
+
+        Returns:
+            tuple: The next product state
+        """
+        next_state = []
+        for fsm, component in zip(self.operands, state):
+            if not component or not fsm.in_alphabet(representative(symbol)):
+                next_state.append(_EMPTY)
+                continue
+            targets = set()
+            for src_state in component:
+                targets.update(nfa_targets(fsm, src_state, symbol))
+            next_state.append(frozenset(targets))
+        return tuple(next_state)
+
+    def _successor(self, state_id, symbol):
+        """Compute and cache the successor of a product state on a cache miss"""
+        self.misses += 1
+        next_state = self.successor(self._states[state_id], symbol)
+        if next_state not in self._ids and len(self._states) >= self.max_states:
+            self.flushes += 1
+            self._flush()
+            return self._intern(next_state)
+        next_id = self._intern(next_state)
+        self._next[state_id][symbol] = next_id
+        return next_id
+
+    @property
+    def cache_size(self):
+        """Number of product states currently cached"""
+        return len(self._states)
+
+    def _run(self, input_string):
+        """Run the matching loop and return the final product state id"""
+        state_id = self._start
+        next_table = self._next
+        misses = self.misses
+        for symbol in input_string:
+            next_id = next_table[state_id].get(symbol)
+            if next_id is None:
+                next_id = self._successor(state_id, symbol)
+                # A flush replaces the table lists
+                next_table = self._next
+            state_id = next_id
+        self.hits += len(input_string) - (self.misses - misses)
+        return state_id
+
+    def run(self, input_string):
+        """
+        Run every operand over a string in one pass
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            tuple: The set of states each operand reached
+        """
+        state_id = self._run(input_string)
+        return self._states[state_id]
+
+    def accepts(self, input_string):
+        """
+        Check whether the combined rule accepts a string
+
+        Args:
+            input_string (str): The input string to process
+
+        Returns:
+            bool: True if the string is accepted, False otherwise
+        """
+        # Run first: a flush during the run replaces self._accepting
+        state_id = self._run(input_string)
+        return self._accepting[state_id]
+
+    def process_string(self, input_string):
+        """Same as accepts(), so a product can stand in for an FSM"""
+        return self.accepts(input_string)
+
+    def intersection(self, other):
+        """Combine with another machine: both must accept"""
+        return combine('and', self, other, self.max_states)
+
+    def union(self, other):
+        """Combine with another machine: either must accept"""
+        return combine('or', self, other, self.max_states)
+
+    def difference(self, other):
+        """Combine with another machine: this one must accept and the other must not"""
+        return combine('and not', self, other, self.max_states)
+
+    def complement(self):
+        """Accept exactly the strings this product rejects"""
+        return combine('not', self, None, self.max_states)
+
+    def to_fsm(self, minimal=True):
+        """
+        Build the whole product eagerly as a DFA
+
+        Every product state reachable from the start over the operands'
+        labels is built. States where the rule can never accept again are
+        kept until minimization removes them.
+
+        Args:
+            minimal (bool): Minimize the DFA (states become q0, q1, ...)
+
+        Returns:
+            FSM: A deterministic FSM over the union of the operands' alphabets
+        """
+        labels = product_labels(self.operands)
+        start = tuple(frozenset(fsm.start_states()) for fsm in self.operands)
+        names = {start: self._name(start)}
+        queue = deque([start])
+        transitions = {}
+        while queue:
+            state = queue.popleft()
+            for label in labels:
+                next_state = self.successor(state, label)
+                if next_state not in names:
+                    names[next_state] = self._name(next_state)
+                    queue.append(next_state)
+                transitions[(names[state], label)] = names[next_state]
+
+        alphabet = set()
+        for fsm in self.operands:
+            alphabet |= fsm.alphabet
+        accept_states = {name for state, name in names.items() if self.accepts_state(state)}
+        dfa = FSM(set(names.values()), alphabet, transitions, names[start], accept_states,
+                  is_deterministic=True)
+        return minimize(dfa) if minimal else dfa
+
+    @staticmethod
+    def _name(state):
+        """Name a product state after its components, e.g. ({q0,q1},{q2})"""
+        return '(' + ','.join(subset_name(component) for component in state) + ')'
@@ -0,0 +1,387 @@
+"""
+Range-labelled transitions - code point intervals as transition labels
+
+A transition key may be (state, CharRange(first, last)) instead of
+(state, symbol), and the alphabet may hold CharRange items too, so "any
+letter" costs one entry instead of one per character. Each state's ranges
+are kept as sorted boundary arrays and resolved with bisect.
+
+A single-symbol transition takes precedence over a range covering the same
+symbol in a DFA, and is combined with it in an NFA. Ranges of one DFA state
+must not overlap.
+"""
+
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+# First code point that does not fit a 16-bit lookup table
+BMP_LIMIT = 0x10000
+
+# Largest code point
+MAX_CODE = sys.maxunicode
+
+
+class CharRange(namedtuple('CharRange', ['first', 'last'])):
+    """
+    An inclusive interval of characters, e.g. CharRange('a', 'z')
+    """
+    __slots__ = ()
+
+    def __new__(cls, first, last):
+        if ord(last) < ord(first):
+            raise ValueError(f"Empty character range: {first!r}-{last!r}")
+        return super().__new__(cls, first, last)
+
+    def __contains__(self, symbol):
+        return len(symbol) == 1 and self.first <= symbol <= self.last
+
+    def __str__(self):
+        return format_label(self)
+
+    @property
+    def codes(self):
+        """The (first, last) code points of the range"""
+        return ord(self.first), ord(self.last)
+
+
+def _parse_endpoint(text):
+    """Parse one end of a range: a single character or U+XXXX"""
+    if len(text) == 1:
+        return text
+    if text[:2].upper() == 'U+':
+        try:
+            return chr(int(text[2:], 16))
+        except ValueError:
+            pass
+    raise ValueError(f"Bad range endpoint: {text!r}")
+
+
+def parse_label(label):
+    """
+    Parse a transition or alphabet label from a definition file
+
+    'a-z' and 'U+0400-U+04FF' are ranges, 'U+00E9' is a single code point
+    and anything else (including '-') is a plain symbol.
+
+    Args:
+        label (str): The label as written in the file
+
+    Returns:
+        str or CharRange: The symbol or range it stands for
+    """
+    if len(label) == 3 and label[1] == '-':
+        return CharRange(label[0], label[2])
+    if label[:2].upper() == 'U+':
+        first, _, last = label.partition('-')
+        if not last:
+            return _parse_endpoint(first)
+        return CharRange(_parse_endpoint(first), _parse_endpoint(last))
+    return label
+
+
+def format_label(label):
+    """
+    Write a label back in the syntax parse_label() reads
+
+    Args:
+        label (str or CharRange): A symbol or range
+
+    Returns:
+        str: The label text
+    """
+    if not isinstance(label, CharRange):
+        return label
+    if label.first.isprintable() and label.last.isprintable() and label.first != ' ':
+        return f'{label.first}-{label.last}'
+    first, last = label.codes
+    return f'U+{first:04X}-U+{last:04X}'
+
+
+class RangeMap:
+    """
+    Sorted, disjoint code point intervals with a value each
+
+    Lookups bisect the array of interval starts, so memory and time depend on
+    the number of intervals, not on how many characters they cover.
+    """
+    def __init__(self, intervals):
+        """
+        Initialize the map
+
+        Args:
+            intervals: Iterable of (first_code, last_code, value) tuples that
+                do not overlap
+        """
+        intervals = sorted(intervals)
+        self.starts = array('l', [first for first, _, _ in intervals])
+        self.ends = array('l', [last for _, last, _ in intervals])
+        self.values = [value for _, _, value in intervals]
+        for i in range(1, len(intervals)):
+            if self.starts[i] <= self.ends[i - 1]:
+                raise ValueError(f"Overlapping ranges at U+{self.starts[i]:04X}")
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends, self.values))
+
+    def lookup(self, code, default=None):
+        """
+        Get the value of the interval containing a code point
+
+        Args:
+            code (int): The code point
+            default: Returned when no interval contains it
+
+        Returns:
+            The interval's value, or default
+        """
+        i = bisect_right(self.starts, code) - 1
+        if i >= 0 and code <= self.ends[i]:
+            return self.values[i]
+        return default
+
+    @property
+    def max_code(self):
+        """The largest code point covered (-1 for an empty map)"""
+        return self.ends[-1] if self.ends else -1
+
+
+def split_intervals(intervals, cuts=()):
+    """
+    Cut possibly overlapping intervals into disjoint pieces
+
+    Args:
+        intervals: Iterable of (first_code, last_code, value) tuples
+        cuts: Extra code points at which a piece must start
+
+    Returns:
+        list: (first_code, last_code, values) tuples in order, where values
+            lists the value of every input interval covering the piece
+    """
+    intervals = list(intervals)
+    points = set(cuts)
+    for first, last, _ in intervals:
+        points.add(first)
+        points.add(last + 1)
+    points = sorted(points)
+
+    # Sweep the boundaries, tracking which intervals are open
+    opening = {}
+    closing = {}
+    for first, last, value in intervals:
+        opening.setdefault(first, []).append(value)
+        closing.setdefault(last + 1, []).append(value)
+    pieces = []
+    active = []
+    for point, next_point in zip(points, points[1:]):
+        for value in closing.get(point, ()):
+            active.remove(value)
+        active.extend(opening.get(point, ()))
+        if active:
+            pieces.append((point, next_point - 1, list(active)))
+    return pieces
+
+
+def state_range_maps(fsm):
+    """
+    Build the RangeMap of range transitions for every state that has any
+
+    Args:
+        fsm (FSM): A DFA or NFA with range-labelled transitions
+
+    Returns:
+        dict: state -> RangeMap whose values are targets (a state for DFAs,
+            a set of states for NFAs)
+    """
+    by_state = {}
+    for (state, label), target in fsm.transitions.items():
+        if isinstance(label, CharRange):
+            by_state.setdefault(state, []).append((*label.codes, target))
+
+    maps = {}
+    for state, intervals in by_state.items():
+        if fsm.is_deterministic:
+            maps[state] = RangeMap(intervals)
+        else:
+            maps[state] = RangeMap(
+                (first, last, set().union(*targets))
+                for first, last, targets in split_intervals(intervals)
+            )
+    return maps
+
+
+def alphabet_ranges(alphabet):
+    """
+    Build a RangeMap of the CharRange items in an alphabet
+
+    Args:
+        alphabet (set): Symbols and CharRanges
+
+    Returns:
+        RangeMap: Covered intervals, with True as the value
+    """
+    pieces = split_intervals((*label.codes, True) for label in alphabet if isinstance(label, CharRange))
+    return RangeMap((first, last, True) for first, last, _ in pieces)
+
+
+def covers_every_code(intervals):
+    """
+    Check whether intervals leave no code point uncovered
+
+    Args:
+        intervals: Iterable of (first_code, last_code) pairs, in any order and
+            possibly overlapping
+
+    Returns:
+        bool: True if every code point from 0 to MAX_CODE is in some interval
+    """
+    reach = 0
+    for first, last in sorted(intervals):
+        if first > reach:
+            return False
+        reach = max(reach, last + 1)
+    return reach > MAX_CODE
+
+
+def merge_intervals(intervals):
+    """
+    Merge code point intervals into sorted, disjoint ones
+
+    Args:
+        intervals: Iterable of (first_code, last_code) pairs, in any order and
+            possibly overlapping or adjacent
+
+    Returns:
+        list: (first_code, last_code) pairs in order, with gaps between them
+    """
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def complement_intervals(intervals):
+    """
+    Get the code points no interval covers, as intervals
+
+    Args:
+        intervals: Sorted, disjoint (first_code, last_code) pairs, as
+            merge_intervals() returns them
+
+    Returns:
+        list: (first_code, last_code) pairs covering every other code point
+            from 0 to MAX_CODE
+    """
+    gaps = []
+    start = 0
+    for first, last in intervals:
+        if first > start:
+            gaps.append((start, first - 1))
+        start = last + 1
+    if start <= MAX_CODE:
+        gaps.append((start, MAX_CODE))
+    return gaps
+
+
+def symbol_labels(fsm):
+    """
+    Partition the input symbols of an FSM into labels that behave alike
+
+    Every plain symbol of the alphabet, and every symbol with transitions of
+    its own that a range of the alphabet admits, is its own label. The
+    characters covered by ranges are cut into disjoint CharRanges at every
+    range boundary and around every plain symbol, so all characters of one
+    label have the same transitions in every state. Constructions can then treat each label as one
+    symbol, and their size stays proportional to the number of ranges.
+
+    Args:
+        fsm (FSM): A DFA or NFA
+
+    Returns:
+        list: Plain symbols, then CharRanges in code point order
+    """
+    symbols = [label for label in fsm.alphabet if not isinstance(label, CharRange)]
+    if not fsm.has_ranges:
+        return sorted(symbols, key=str)
+
+    # Symbols with transitions of their own are labels too when a range of
+    # the alphabet admits them
+    symbols = set(symbols)
+    for (_, symbol) in fsm.transitions:
+        if not isinstance(symbol, CharRange) and len(symbol) == 1 and fsm.in_alphabet(symbol):
+            symbols.add(symbol)
+    symbols = sorted(symbols, key=str)
+
+    intervals = [(*label.codes, True) for label in fsm.alphabet if isinstance(label, CharRange)]
+    intervals += [
+        (*label.codes, False) for (_, label) in fsm.transitions if isinstance(label, CharRange)
+    ]
+    cuts = set()
+    for symbol in symbols:
+        if len(symbol) == 1:
+            cuts.add(ord(symbol))
+            cuts.add(ord(symbol) + 1)
+    plain = {ord(symbol) for symbol in symbols if len(symbol) == 1}
+
+    ranges = []
+    for first, last, in_alphabet in split_intervals(intervals, cuts):
+        # Only pieces the alphabet admits can be read, and a plain symbol
+        # already labels its own single character
+        if not any(in_alphabet) or (first == last and first in plain):
+            continue
+        ranges.append(CharRange(chr(first), chr(last)))
+    return symbols + ranges
+
+
+def representative(label):
+    """Get one character standing for every character of a label"""
+    return label.first if isinstance(label, CharRange) else label
+
+
+class LabelIndex(dict):
+    """
+    Map from plain symbols to values that falls back to a RangeMap
+
+    Works as a drop-in for the symbol -> column dicts of the engines: a
+    symbol missing from the dict is looked up by code point in the ranges.
+    """
+
+    def __init__(self, mapping, ranges=None, default=None):
+        super().__init__(mapping)
+        self.ranges = ranges
+        self.default = default
+
+    def __missing__(self, symbol):
+        if self.ranges is not None and len(symbol) == 1:
+            return self.ranges.lookup(ord(symbol), self.default)
+        return self.default
+
+
+def label_index(labels, values, default=None):
+    """
+    Build a LabelIndex for a list of labels
+
+    Args:
+        labels (list): Plain symbols and disjoint CharRanges
+        values (list): The value of each label
+        default: Value for symbols no label covers
+
+    Returns:
+        LabelIndex: The lookup
+    """
+    plain = {}
+    intervals = []
+    for label, value in zip(labels, values):
+        if isinstance(label, CharRange):
+            intervals.append((*label.codes, value))
+        else:
+            plain[label] = value
+    return LabelIndex(plain, RangeMap(intervals) if intervals else None, default)
@@ -0,0 +1,384 @@
+"""
+Regular expressions to NFAs - a Thompson construction front end
+
+regex_to_nfa() parses a pattern in one left-to-right pass and builds an NFA
+with epsilon transitions, so construction time is linear in the size of the
+pattern (with bounded repetitions counted as their expansion).
+
+Supported syntax:
+    ab          concatenation
+    a|b         alternation
+    a* a+ a?    zero or more, one or more, optional
+    a{m} a{m,} a{m,n}   bounded repetition
+    (...)       grouping
+    [abc] [a-z] [^...]  character classes
+    .           any symbol of the alphabet
+    \\d \\w \\s     digit, word and space classes; other escaped characters
+                stand for themselves
+
+Each interval of a character class becomes one CharRange transition, and
+[^...] takes the interval complement, so wide classes cost one edge per
+interval instead of one per character.
+
+The NFA matches whole strings, like process_string().
+"""
+
+import string
+from bisect import bisect_right
+
+from finite_state_machines import EPSILON, FSM
+from fsm_ranges import CharRange, alphabet_ranges, complement_intervals, merge_intervals
+
+# Symbols that '.' and negated classes range over when no alphabet is given
+DEFAULT_ALPHABET = frozenset(string.printable)
+
+ESCAPE_CLASSES = {
+    'd': frozenset(string.digits),
+    'w': frozenset(string.ascii_letters + string.digits + '_'),
+    's': frozenset(' \t\n\r\f\v'),
+}
+
+ESCAPE_CHARACTERS = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v'}
+
+# Pseudo-symbol set for '.', resolved against the alphabet after parsing
+ANY = 'any'
+
+
+class _Parser:
+    """
+    Recursive-descent parser producing a small syntax tree
+
+    Nodes are tuples: ('symbols', frozenset), ('any',), ('ranges', intervals),
+    ('negated', intervals) with intervals sorted, disjoint code point pairs,
+    ('empty',), ('cat', [nodes]), ('alt', [nodes]), ('star', node),
+    ('plus', node), ('optional', node) and ('repeat', node, low, high).
+    """
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.position = 0
+        self.uses_any = False
+
+    def error(self, message):
+        raise ValueError(f"{message} at position {self.position} in pattern {self.pattern!r}")
+
+    def peek(self):
+        if self.position < len(self.pattern):
+            return self.pattern[self.position]
+        return None
+
+    def take(self):
+        char = self.peek()
+        if char is None:
+            self.error("Unexpected end of pattern")
+        self.position += 1
+        return char
+
+    def parse(self):
+        node = self.parse_alternation()
+        if self.peek() is not None:
+            self.error("Unbalanced ')'")
+        return node
+
+    def parse_alternation(self):
+        branches = [self.parse_concatenation()]
+        while self.peek() == '|':
+            self.position += 1
+            branches.append(self.parse_concatenation())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def parse_concatenation(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            items.append(self.parse_repetition())
+        if not items:
+            return ('empty',)
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def parse_repetition(self):
+        node = self.parse_atom()
+        while True:
+            char = self.peek()
+            if char == '*':
+                node = ('star', node)
+            elif char == '+':
+                node = ('plus', node)
+            elif char == '?':
+                node = ('optional', node)
+            elif char == '{':
+                self.position += 1
+                low, high = self.parse_bounds()
+                node = ('repeat', node, low, high)
+                continue
+            else:
+                return node
+            self.position += 1
+
+    def parse_bounds(self):
+        low = self.parse_number()
+        high = low
+        if self.peek() == ',':
+            self.position += 1
+            high = None if self.peek() == '}' else self.parse_number()
+        if self.take() != '}':
+            self.error("Expected '}'")
+        if high is not None and high < low:
+            self.error("Bad repetition bounds")
+        return low, high
+
+    def parse_number(self):
+        start = self.position
+        while self.peek() is not None and self.peek().isdigit():
+            self.position += 1
+        if start == self.position:
+            self.error("Expected a number")
+        return int(self.pattern[start:self.position])
+
+    def parse_atom(self):
+        char = self.take()
+        if char == '(':
+            node = self.parse_alternation()
+            if self.take() != ')':
+                self.error("Expected ')'")
+            return node
+        if char == '[':
+            return self.parse_class()
+        if char == '.':
+            self.uses_any = True
+            return ('any',)
+        if char == '\\':
+            return ('symbols', self.parse_escape())
+        if char in '*+?{':
+            self.error("Nothing to repeat")
+        if char in ')|':
+            self.error(f"Unexpected {char!r}")
+        return ('symbols', frozenset(char))
+
+    def parse_escape(self):
+        char = self.take()
+        if char in ESCAPE_CLASSES:
+            return ESCAPE_CLASSES[char]
+        return frozenset(ESCAPE_CHARACTERS.get(char, char))
+
+    def parse_class(self):
+        negated = self.peek() == '^'
+        if negated:
+            self.position += 1
+        intervals = []
+        first = True
+        while True:
+            char = self.take()
+            if char == ']' and not first:
+                break
+            first = False
+            if char == '\\':
+                escaped = self.parse_escape()
+                if len(escaped) > 1:
+                    intervals.extend((ord(symbol), ord(symbol)) for symbol in escaped)
+                    continue
+                char = next(iter(escaped))
+            if self.peek() == '-' and self.position + 1 < len(self.pattern) \
+                    and self.pattern[self.position + 1] != ']':
+                self.position += 1
+                end = self.take()
+                if end == '\\':
+                    end = next(iter(self.parse_escape()))
+                if ord(end) < ord(char):
+                    self.error("Bad character range")
+                intervals.append((ord(char), ord(end)))
+            else:
+                intervals.append((ord(char), ord(char)))
+        intervals = tuple(merge_intervals(intervals))
+        if negated:
+            self.uses_any = True
+            return ('negated', intervals)
+        return ('ranges', intervals)
+
+
+def _literal_symbols(node, found):
+    """Collect every symbol and class interval named explicitly in a syntax tree"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        kind = node[0]
+        if kind == 'symbols':
+            found |= node[1]
+        elif kind == 'ranges':
+            found.update(chr(first) if first == last else CharRange(chr(first), chr(last))
+                         for first, last in node[1])
+        elif kind in ('cat', 'alt'):
+            stack.extend(node[1])
+        elif kind in ('star', 'plus', 'optional', 'repeat'):
+            stack.append(node[1])
+    return found
+
+
+class _Builder:
+    """
+    Thompson construction over integer states
+
+    Every fragment is a (start, end) pair where start has no incoming and end
+    no outgoing transitions, so fragments can be wired with epsilon moves.
+    """
+    def __init__(self, alphabet):
+        self.alphabet = alphabet
+        self.ranges = alphabet_ranges(alphabet)
+        self.num_states = 0
+        self.transitions = {}
+
+    def new_state(self):
+        self.num_states += 1
+        return self.num_states - 1
+
+    def add(self, src, symbol, dest):
+        self.transitions.setdefault((src, symbol), set()).add(dest)
+
+    def in_alphabet(self, symbol):
+        return symbol in self.alphabet or (len(symbol) == 1 and self.ranges.lookup(ord(symbol), False))
+
+    def labels_within(self, intervals, negated=False):
+        """
+        Get the alphabet's labels inside code point intervals
+
+        Plain symbols are kept whole and CharRanges of the alphabet are cut
+        to the intervals, so the labels are as many as the alphabet's
+        entries and the intervals, not the characters they cover.
+
+        Args:
+            intervals (tuple): Sorted, disjoint (first_code, last_code) pairs
+            negated (bool): Also keep symbols longer than one character, which
+                no class names
+
+        Returns:
+            list: Symbols and CharRanges
+        """
+        starts = [first for first, _ in intervals]
+        labels = []
+        for item in self.alphabet:
+            if isinstance(item, CharRange):
+                first, last = item.codes
+                i = max(bisect_right(starts, first) - 1, 0)
+                while i < len(intervals) and intervals[i][0] <= last:
+                    low, high = max(first, intervals[i][0]), min(last, intervals[i][1])
+                    if low <= high:
+                        labels.append(CharRange(chr(low), chr(high)))
+                    i += 1
+            elif len(item) == 1:
+                i = bisect_right(starts, ord(item)) - 1
+                if i >= 0 and ord(item) <= intervals[i][1]:
+                    labels.append(item)
+            elif negated:
+                labels.append(item)
+        return labels
+
+    def build(self, node):
+        kind = node[0]
+        if kind in ('symbols', 'any', 'ranges', 'negated'):
+            if kind == 'any':
+                symbols = self.alphabet
+            elif kind == 'ranges':
+                symbols = self.labels_within(node[1])
+            elif kind == 'negated':
+                symbols = self.labels_within(complement_intervals(node[1]), negated=True)
+            else:
+                symbols = [symbol for symbol in node[1] if self.in_alphabet(symbol)]
+            start, end = self.new_state(), self.new_state()
+            for symbol in symbols:
+                self.add(start, symbol, end)
+            return start, end
+        if kind == 'empty':
+            start, end = self.new_state(), self.new_state()
+            self.add(start, EPSILON, end)
+            return start, end
+        if kind == 'cat':
+            return self.chain([self.build(item) for item in node[1]])
+        if kind == 'alt':
+            start, end = self.new_state(), self.new_state()
+            for branch in node[1]:
+                branch_start, branch_end = self.build(branch)
+                self.add(start, EPSILON, branch_start)
+                self.add(branch_end, EPSILON, end)
+            return start, end
+        if kind == 'star':
+            return self.star(self.build(node[1]))
+        if kind == 'plus':
+            inner_start, inner_end = self.build(node[1])
+            start, end = self.new_state(), self.new_state()
+            self.add(start, EPSILON, inner_start)
+            self.add(inner_end, EPSILON, inner_start)
+            self.add(inner_end, EPSILON, end)
+            return start, end
+        if kind == 'optional':
+            return self.optional(self.build(node[1]))
+        if kind == 'repeat':
+            _, inner, low, high = node
+            fragments = [self.build(inner) for _ in range(low)]
+            if high is None:
+                fragments.append(self.star(self.build(inner)))
+            else:
+                # x{2,4} is built as xx(x(x)?)? so the optional tail stays linear
+                tail = None
+                for _ in range(high - low):
+                    fragment = self.build(inner)
+                    if tail is not None:
+                        fragment = self.chain([fragment, tail])
+                    tail = self.optional(fragment)
+                if tail is not None:
+                    fragments.append(tail)
+            if not fragments:
+                return self.build(('empty',))
+            return self.chain(fragments)
+        raise ValueError(f"Unknown syntax node: {kind}")
+
+    def chain(self, fragments):
+        for (_, end), (next_start, _) in zip(fragments, fragments[1:]):
+            self.add(end, EPSILON, next_start)
+        return fragments[0][0], fragments[-1][1]
+
+    def star(self, fragment):
+        inner_start, inner_end = fragment
+        start, end = self.new_state(), self.new_state()
+        self.add(start, EPSILON, inner_start)
+        self.add(start, EPSILON, end)
+        self.add(inner_end, EPSILON, inner_start)
+        self.add(inner_end, EPSILON, end)
+        return start, end
+
+    def optional(self, fragment):
+        inner_start, inner_end = fragment
+        start, end = self.new_state(), self.new_state()
+        self.add(start, EPSILON, inner_start)
+        self.add(start, EPSILON, end)
+        self.add(inner_end, EPSILON, end)
+        return start, end
+
+
+def regex_to_nfa(pattern, alphabet=None):
+    """
+    Compile a regular expression into an NFA with epsilon transitions
+
+    Args:
+        pattern (str): The regular expression
+        alphabet (set): Input symbols of the NFA. Defaults to the symbols and class
+            ranges named in the pattern, plus DEFAULT_ALPHABET if it uses '.' or [^...]
+
+    Returns:
+        FSM: A non-deterministic FSM accepting exactly the strings the pattern
+            matches in full
+    """
+    parser = _Parser(pattern)
+    tree = parser.parse()
+    if alphabet is None:
+        alphabet = _literal_symbols(tree, set())
+        if parser.uses_any:
+            alphabet |= DEFAULT_ALPHABET
+    alphabet = frozenset(alphabet)
+
+    builder = _Builder(alphabet)
+    start, end = builder.build(tree)
+    transitions = {
+        (f's{src}', symbol): {f's{dest}' for dest in targets}
+        for (src, symbol), targets in builder.transitions.items()
+    }
+    states = {f's{state}' for state in range(builder.num_states)}
+
+    return FSM(states, set(alphabet), transitions, f's{start}', {f's{end}'}, is_deterministic=False)
@@ -0,0 +1,390 @@
+"""
+Matching service - an asyncio server that answers match requests in batches
+
+The server loads its machines once, compiled, and speaks a line protocol
+over TCP or a Unix socket. Each request is one UTF-8 line:
+
+    MATCH <machine> <input>     ->  1 or 0
+    MACHINES                    ->  the machine names, space-separated
+    STATS                       ->  one line of JSON with latency percentiles
+    PING                        ->  PONG
+
+Anything else gets a line starting with ERR. The input is the rest of the
+line after the machine name, so it may contain spaces but not newlines.
+
+Clients may pipeline: responses come back in request order on each
+connection. MATCH requests from every connection go through one queue, and
+the batcher takes whatever is waiting (up to batch_size) and answers it
+grouped by machine, with the NumPy accepts_many() path for large groups.
+Backpressure is plain flow control: a connection stops being read while
+max_inflight of its responses are outstanding or the shared queue holds
+max_pending requests, and TCP pushes back on the client from there.
+
+run_load() is the matching load generator. It keeps a fixed number of
+pipelined requests in flight on each connection and reports a latency
+histogram, so the server can be sized against a p99 target locally.
+"""
+
+import asyncio
+import json
+import math
+from collections import deque
+from time import perf_counter
+
+# Groups smaller than this are matched one string at a time, which is
+# faster than setting up the NumPy batch
+VECTOR_MIN_BATCH = 32
+
+# Longest request line accepted, in bytes
+MAX_LINE = 1 << 20
+
+
+class LatencyHistogram:
+    """
+    Log-scale latency histogram with bounded relative error
+
+    Bucket i covers [min_seconds * 2^(i/k), min_seconds * 2^((i+1)/k)) for
+    k = buckets_per_doubling, so percentiles are reported to within a factor
+    of 2^(1/k) (about 9% for the default 8) in constant memory.
+    """
+    def __init__(self, min_seconds=1e-6, buckets_per_doubling=8):
+        """
+        Initialize an empty histogram
+
+        Args:
+            min_seconds (float): Upper bound of the first bucket
+            buckets_per_doubling (int): Resolution of the buckets
+        """
+        self.min_seconds = min_seconds
+        self.buckets_per_doubling = buckets_per_doubling
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Add one latency sample"""
+        if seconds > self.min_seconds:
+            bucket = int(math.log2(seconds / self.min_seconds) * self.buckets_per_doubling)
+        else:
+            bucket = 0
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        """Add every sample of another histogram with the same buckets"""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        """
+        Get an upper bound of a percentile
+
+        Args:
+            fraction (float): E.g. 0.99 for the p99
+
+        Returns:
+            float: Seconds, or None for an empty histogram
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.max, self.min_seconds * 2 ** ((bucket + 1) / self.buckets_per_doubling))
+        return self.max
+
+    def summary(self):
+        """
+        Get the usual percentiles in milliseconds
+
+        Returns:
+            dict: count, mean, p50, p90, p99, p999 and max
+        """
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 4)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count if self.count else None),
+            'p50_ms': ms(self.percentile(0.5)),
+            'p90_ms': ms(self.percentile(0.9)),
+            'p99_ms': ms(self.percentile(0.99)),
+            'p999_ms': ms(self.percentile(0.999)),
+            'max_ms': ms(self.max if self.count else None),
+        }
+
+
+class MatchServer:
+    """
+    Asyncio server answering match requests for a set of compiled machines
+    """
+    def __init__(self, machines, batch_size=256, batch_delay=0.0, max_pending=4096, max_inflight=256):
+        """
+        Initialize the server
+
+        Args:
+            machines (dict): Machine name -> CompiledDFA
+            batch_size (int): Most requests answered in one batch
+            batch_delay (float): Extra seconds the batcher waits for a batch
+                to fill after the first request (0 only coalesces requests
+                that are already waiting)
+            max_pending (int): Most requests queued for the batcher
+            max_inflight (int): Most unanswered requests per connection
+        """
+        if batch_size < 1 or max_pending < 1 or max_inflight < 1:
+            raise ValueError("batch_size, max_pending and max_inflight must be at least 1")
+        self.machines = dict(machines)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        self.latency = LatencyHistogram()
+        self.batches = 0
+        self.batched_requests = 0
+        self._queue = None
+        self._batcher = None
+        self._server = None
+        self._connections = {}
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """
+        Start listening and batching
+
+        Args:
+            host (str): TCP host
+            port (int): TCP port (0 picks a free one)
+            path (str): Listen on this Unix socket instead of TCP
+        """
+        self._queue = asyncio.Queue(self.max_pending)
+        self._batcher = asyncio.ensure_future(self._run_batches())
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path, limit=MAX_LINE)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_LINE)
+
+    @property
+    def address(self):
+        """The (host, port) or socket path the server listens on"""
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        """Serve until cancelled"""
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stop listening, hang up on every client and stop the batcher"""
+        self._server.close()
+        # Closed transports end each connection's read loop normally, so the
+        # requests already read are still answered before it finishes
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections)
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self):
+        """
+        Get the server statistics
+
+        Returns:
+            dict: Latency percentiles, batch counts and the mean batch size
+        """
+        return {
+            'latency': self.latency.summary(),
+            'batches': self.batches,
+            'mean_batch_size': round(self.batched_requests / self.batches, 2) if self.batches else None,
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    async def _handle(self, reader, writer):
+        """Read requests from one connection; a sender task writes the answers in order"""
+        self._connections[asyncio.current_task()] = writer
+        responses = asyncio.Queue(self.max_inflight)
+        sender = asyncio.ensure_future(self._send(responses, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await responses.put('ERR request line too long')
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                await responses.put(await self._dispatch(line))
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+            del self._connections[asyncio.current_task()]
+
+    async def _dispatch(self, line):
+        """
+        Turn one request line into its answer, or a future of it for MATCH
+
+        Awaiting the shared queue is what applies backpressure across
+        connections.
+        """
+        try:
+            text = line.decode('utf-8').rstrip('\r\n')
+        except UnicodeDecodeError:
+            return 'ERR request is not UTF-8'
+        command, _, rest = text.partition(' ')
+        if command == 'MATCH':
+            machine, _, input_string = rest.partition(' ')
+            if machine not in self.machines:
+                return f'ERR unknown machine {machine!r}'
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((machine, input_string, future, perf_counter()))
+            return future
+        if command == 'PING':
+            return 'PONG'
+        if command == 'MACHINES':
+            return ' '.join(self.machines)
+        if command == 'STATS':
+            return json.dumps(self.stats())
+        return f'ERR unknown command {command!r}'
+
+    async def _send(self, responses, writer):
+        """Write answers in request order, draining once the queue is empty"""
+        while True:
+            response = await responses.get()
+            if response is None:
+                break
+            if not isinstance(response, str):
+                try:
+                    response = '1' if await response else '0'
+                except Exception as error:
+                    response = f'ERR match failed: {error!r}'
+            writer.write(response.encode('utf-8') + b'\n')
+            if responses.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    # Keep consuming so the reader is never stuck on a full queue
+                    pass
+
+    async def _run_batches(self):
+        """Collect waiting requests into batches and answer them"""
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            # Let the other connections that are ready enqueue their requests
+            await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            self._answer(batch)
+
+    def _answer(self, batch):
+        """
+        Match one batch, grouped by machine
+
+        A group whose matching raises gets the exception on its futures, so
+        its clients get an ERR line and the other groups are still answered.
+        """
+        self.batches += 1
+        self.batched_requests += len(batch)
+        groups = {}
+        for request in batch:
+            groups.setdefault(request[0], []).append(request)
+        for machine, requests in groups.items():
+            compiled = self.machines[machine]
+            strings = [request[1] for request in requests]
+            try:
+                if len(strings) >= VECTOR_MIN_BATCH:
+                    verdicts = compiled.accepts_many(strings)
+                else:
+                    verdicts = [compiled.accepts(s) for s in strings]
+            except Exception as error:
+                for _, _, future, _ in requests:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            finished = perf_counter()
+            for (_, _, future, started), verdict in zip(requests, verdicts):
+                if not future.done():
+                    future.set_result(bool(verdict))
+                self.latency.record(finished - started)
+
+
+async def _load_connection(open_connection, machine, strings, pipeline, histogram, results):
+    """Send strings on one connection keeping up to pipeline requests in flight"""
+    reader, writer = await open_connection()
+    window = asyncio.Semaphore(pipeline)
+    sent = deque()
+
+    async def receive():
+        for _ in strings:
+            line = await reader.readline()
+            histogram.record(perf_counter() - sent.popleft())
+            window.release()
+            if line == b'1\n':
+                results['accepted'] += 1
+            elif line != b'0\n':
+                results['errors'] += 1
+
+    receiver = asyncio.ensure_future(receive())
+    for s in strings:
+        await window.acquire()
+        sent.append(perf_counter())
+        writer.write(f'MATCH {machine} {s}\n'.encode('utf-8'))
+        if window.locked():
+            await writer.drain()
+    await writer.drain()
+    await receiver
+    writer.close()
+
+
+async def run_load(machine, strings, host='127.0.0.1', port=None, path=None, connections=8, pipeline=32):
+    """
+    Drive a server with pipelined MATCH requests and measure the latency
+
+    Args:
+        machine (str): Machine name to match against
+        strings (list): Inputs, spread round-robin over the connections
+        host (str): TCP host
+        port (int): TCP port
+        path (str): Unix socket path (instead of host and port)
+        connections (int): Number of concurrent connections
+        pipeline (int): Requests in flight per connection
+
+    Returns:
+        dict: requests, seconds, requests_per_sec, accepted, errors and the
+            client-side latency percentiles
+    """
+    if path is not None:
+        def open_connection():
+            return asyncio.open_unix_connection(path, limit=MAX_LINE)
+    else:
+        def open_connection():
+            return asyncio.open_connection(host, port, limit=MAX_LINE)
+
+    histogram = LatencyHistogram()
+    results = {'accepted': 0, 'errors': 0}
+    started = perf_counter()
+    await asyncio.gather(*(
+        _load_connection(open_connection, machine, strings[i::connections], pipeline, histogram, results)
+        for i in range(connections)
+    ))
+    seconds = perf_counter() - started
+    return {
+        'requests': len(strings),
+        'seconds': round(seconds, 4),
+        'requests_per_sec': round(len(strings) / seconds, 1) if seconds else None,
+        'accepted': results['accepted'],
+        'errors': results['errors'],
+        'latency': histogram.summary(),
+    }
@@ -0,0 +1,138 @@
+"""
+Run statistics - opt-in instrumentation for the matching engines
+
+Instrumentation never adds a check to the normal matching loops. Calling
+instrument(stats) on an FSM or an engine shadows its matching method with a
+separate, instrumented copy of the loop, and instrument(None) removes the
+shadow again, so an uninstrumented machine runs exactly the original code.
+
+Every instrumented run reports a record to a RunStats object:
+
+    engine          which loop ran ('dict', 'compiled', 'lazy', 'bitset')
+    symbols         symbols consumed before the run ended or died
+    accepted        the verdict
+    dead_at         position of the symbol that killed the run, or None
+    active_sizes    Counter of active-state-set sizes after each step
+    cache_hits      lazy DFA transitions served from its cache
+    cache_misses    lazy DFA transitions that had to be computed
+    phases          seconds spent per phase, e.g. {'translate': ..., 'run': ...}
+"""
+
+import functools
+from collections import Counter
+
+
+class RunStats:
+    """
+    Totals over every instrumented run, with an optional per-run callback
+    """
+    def __init__(self, callback=None, keep_runs=False):
+        """
+        Initialize empty statistics
+
+        Args:
+            callback (function): Called with each run record as it completes
+            keep_runs (bool): Also keep every run record in self.records
+        """
+        self.callback = callback
+        self.records = [] if keep_runs else None
+        self.runs = 0
+        self.accepted = 0
+        self.symbols = 0
+        self.active_sizes = Counter()
+        self.dead_positions = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.phase_seconds = Counter()
+
+    def record(self, engine, symbols, accepted, dead_at=None, active_sizes=None, cache_hits=0,
+               cache_misses=0, phases=None):
+        """
+        Add one run to the totals and pass it to the callback
+
+        Args:
+            engine (str): Name of the loop that ran
+            symbols (int): Symbols consumed
+            accepted (bool): The verdict
+            dead_at (int): Position at which the run died, or None
+            active_sizes (Counter): Active-set sizes after each step
+            cache_hits (int): Cached transitions used
+            cache_misses (int): Transitions computed
+            phases (dict): Seconds per phase
+        """
+        run = {
+            'engine': engine,
+            'symbols': symbols,
+            'accepted': accepted,
+            'dead_at': dead_at,
+            'active_sizes': active_sizes or Counter(),
+            'cache_hits': cache_hits,
+            'cache_misses': cache_misses,
+            'phases': phases or {},
+        }
+        self.runs += 1
+        self.accepted += accepted
+        self.symbols += symbols
+        self.active_sizes.update(run['active_sizes'])
+        if dead_at is not None:
+            self.dead_positions[dead_at] += 1
+        self.cache_hits += cache_hits
+        self.cache_misses += cache_misses
+        self.phase_seconds.update(run['phases'])
+        if self.records is not None:
+            self.records.append(run)
+        if self.callback is not None:
+            self.callback(run)
+
+    @property
+    def dead_runs(self):
+        """Number of runs that reached the dead state"""
+        return sum(self.dead_positions.values())
+
+    @property
+    def cache_hit_rate(self):
+        """Fraction of lazy DFA transitions served from the cache (None if unused)"""
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+    @property
+    def mean_active_size(self):
+        """Average active-set size per step (None before any step)"""
+        steps = sum(self.active_sizes.values())
+        if not steps:
+            return None
+        return sum(size * count for size, count in self.active_sizes.items()) / steps
+
+    def summary(self):
+        """
+        Get the totals as a plain dict
+
+        Returns:
+            dict: Counts, rates and seconds per phase
+        """
+        return {
+            'runs': self.runs,
+            'accepted': self.accepted,
+            'symbols': self.symbols,
+            'dead_runs': self.dead_runs,
+            'mean_active_size': self.mean_active_size,
+            'max_active_size': max(self.active_sizes, default=None),
+            'cache_hit_rate': self.cache_hit_rate,
+            'phase_seconds': dict(self.phase_seconds),
+        }
+
+
+def install(target, name, variant, stats):
+    """
+    Shadow a method with an instrumented variant, or remove the shadow
+
+    Args:
+        target: The object whose method is replaced
+        name (str): Method name
+        variant: Unbound-style callable taking (stats, *args)
+        stats (RunStats): Statistics to report to, or None to uninstall
+    """
+    if stats is None:
+        target.__dict__.pop(name, None)
+    else:
+        setattr(target, name, functools.partial(variant, stats))
@@ -0,0 +1,193 @@
+"""
+Streaming FSM matching - feed input in chunks, get the verdict at the end
+
+A StreamMatcher keeps only the current state of a compiled DFA, so it uses
+constant memory however long the stream is. Chunks can be str or bytes, which
+makes it usable on log streams and socket data as they arrive.
+
+scan_file() runs a compiled DFA straight over a memory-mapped file, either
+as a whole or line by line, without reading it into Python strings.
+"""
+
+import codecs
+import mmap
+import os
+
+# Whole-file scans check for a decided state between windows of this many bytes
+SCAN_WINDOW = 1 << 20
+
+
+class StreamMatcher:
+    """
+    A constant-memory cursor over a compiled DFA
+    """
+    def __init__(self, compiled, encoding=None, record_history=False):
+        """
+        Initialize the stream matcher
+
+        Args:
+            compiled (CompiledDFA): The compiled machine to run
+            encoding (str): Decode bytes chunks with this encoding (None reads
+                each byte as one latin-1 character)
+            record_history (bool): Keep every consumed symbol in self.history
+        """
+        self.compiled = compiled
+        self.encoding = encoding
+        self.record_history = record_history
+        self.reset()
+
+    def reset(self):
+        """Start a new stream"""
+        self.state = self.compiled.start
+        self.position = 0
+        self.history = [] if self.record_history else None
+        # An incremental decoder copes with characters split across chunks
+        self._decoder = codecs.getincrementaldecoder(self.encoding)() if self.encoding else None
+
+    def feed(self, chunk):
+        """
+        Consume the next chunk of input
+
+        Args:
+            chunk (str or bytes): The next piece of the stream
+
+        Returns:
+            bool: False once the stream can no longer be accepted (True once
+                it is accepted whatever follows, or while it is undecided)
+        """
+        is_bytes = isinstance(chunk, (bytes, bytearray, memoryview))
+        if is_bytes and self._decoder is not None:
+            chunk = self._decoder.decode(chunk)
+            is_bytes = False
+        self.position += len(chunk)
+        if self.history is not None:
+            if is_bytes:
+                self.history.extend(chr(byte) for byte in bytes(chunk))
+            else:
+                self.history.extend(chunk)
+
+        # Once the run is in a sink or an accept-forever state the rest of
+        # the stream can't change the verdict
+        decided = self.compiled.decided
+        if not decided[self.state]:
+            if is_bytes:
+                columns = self.compiled.byte_columns(chunk)
+            else:
+                columns = self.compiled.columns(chunk)
+            self.state = self.compiled.advance(self.state, columns)
+        if decided[self.state]:
+            return bool(self.compiled.accepting[self.state])
+        return True
+
+    def finish(self):
+        """
+        End the stream and report the verdict
+
+        Returns:
+            bool: True if the whole stream is accepted, False otherwise
+        """
+        if self._decoder is not None:
+            self.feed(self._decoder.decode(b'', final=True))
+        return bool(self.compiled.accepting[self.state])
+
+
+def _walk(byte_delta, offset, view):
+    """Walk the byte-level table over a memoryview and return the final offset"""
+    for byte in view:
+        offset = byte_delta[offset + byte]
+    return offset
+
+
+def _newlines(view):
+    """Yield the position of every b'\\n' in a byte view, copying one window at a time"""
+    for start in range(0, len(view), SCAN_WINDOW):
+        window = bytes(view[start:start + SCAN_WINDOW])
+        index = window.find(b'\n')
+        while index >= 0:
+            yield start + index
+            index = window.find(b'\n', index + 1)
+
+
+def scan_buffer(compiled, buffer):
+    """
+    Check whether a whole buffer is accepted, reading each byte as latin-1
+
+    Args:
+        compiled (CompiledDFA): The compiled machine
+        buffer: Any object supporting the buffer protocol (bytes, mmap, ...)
+
+    Returns:
+        bool: True if the buffer is accepted, False otherwise
+    """
+    byte_delta = compiled.byte_delta()
+    decided = compiled.decided
+    offset = compiled.start * 256
+    with memoryview(buffer) as raw, raw.cast('B') as view:
+        for start in range(0, len(view), SCAN_WINDOW):
+            if decided[offset // 256]:
+                break
+            offset = _walk(byte_delta, offset, view[start:start + SCAN_WINDOW])
+    return bool(compiled.accepting[offset // 256])
+
+
+def scan_buffer_lines(compiled, buffer):
+    """
+    Check every line of a buffer, reading each byte as latin-1
+
+    Lines are split on b'\\n' and a trailing b'\\r' is dropped. A final
+    newline does not start an extra empty line.
+
+    Args:
+        compiled (CompiledDFA): The compiled machine
+        buffer: Any object supporting the buffer protocol (bytes, mmap, ...)
+
+    Yields:
+        tuple: (line_number, accepted) for each line, numbered from 1
+    """
+    byte_delta = compiled.byte_delta()
+    accepting = compiled.accepting
+    start_offset = compiled.start * 256
+    position = 0
+    line_number = 0
+    with memoryview(buffer) as raw, raw.cast('B') as view:
+        size = len(view)
+        newlines = _newlines(view)
+        while position < size:
+            end = next(newlines, -1)
+            next_position = end + 1
+            if end < 0:
+                end = next_position = size
+            line_end = end - 1 if end > position and view[end - 1] == 13 else end
+            offset = _walk(byte_delta, start_offset, view[position:line_end])
+            line_number += 1
+            yield line_number, bool(accepting[offset // 256])
+            position = next_position
+
+
+def scan_file(compiled, path, by_line=False):
+    """
+    Run a compiled DFA over a file through mmap
+
+    Args:
+        compiled (CompiledDFA): The compiled machine
+        path (str): Path of the file to scan
+        by_line (bool): Report a verdict per line instead of for the whole file
+
+    Returns:
+        bool for a whole-file scan, or a generator of (line_number, accepted)
+        tuples when by_line is True
+    """
+    if by_line:
+        return _scan_file_lines(compiled, path)
+    if os.path.getsize(path) == 0:
+        return bool(compiled.accepting[compiled.start])
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return scan_buffer(compiled, buffer)
+
+
+def _scan_file_lines(compiled, path):
+    """Generator behind scan_file(by_line=True), keeps the mapping open while iterating"""
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        yield from scan_buffer_lines(compiled, buffer)
@@ -1,5 +1,21 @@
 import unittest
-import nfa_config.txt, dfa_config.txt
+import itertools
+import json
+import os
+import re
+import string
+import sys
+import tempfile
+from finite_state_machines import (
+    EPSILON, FSM, create_dfa_a_plus_b_c_star, create_nfa_a_or_b_star_abb, create_nfa_nth_last_a
+)
+
+
+def all_strings(alphabet, max_length):
+    """Yield every string over the alphabet up to max_length symbols"""
+    for length in range(max_length + 1):
+        for symbols in itertools.product(alphabet, repeat=length):
+            yield ''.join(symbols)
 
 class TestDFA(unittest.TestCase):
     def setUp(self):
@@ -84,6 +100,1512 @@ class TestNFA(unittest.TestCase):
             with self.subTest(string=s):
                 self.assertFalse(self.nfa.process_string(s), f"String '{s}' should be rejected")
 
+class TestCompiledDFA(unittest.TestCase):
+    def setUp(self):
+        self.dfa = create_dfa_a_plus_b_c_star()
+        self.compiled = self.dfa.compile()
+    
+    def test_matches_dict_engine(self):
+        # The compiled table must agree with the dict-based DFA everywhere
+        strings = ['', 'a', 'b', 'c', 'ac', 'bccc', 'ab', 'aca', 'x', 'acx', 'a' + 'c' * 500]
+        
+        for s in strings:
+            with self.subTest(string=s):
+                self.assertEqual(self.compiled.accepts(s), self.dfa.process_string(s))
+    
+    def test_dead_state(self):
+        # Missing transitions and unknown symbols both end in the dead state
+        self.assertEqual(self.compiled.run('ab'), 0)
+        self.assertEqual(self.compiled.run('a?'), 0)
+        self.assertEqual(self.compiled.state_names[self.compiled.run('acc')], 'q1')
+    
+    def test_compiled_engine(self):
+        dfa = create_dfa_a_plus_b_c_star()
+        dfa.engine = 'compiled'
+        self.assertTrue(dfa.process_string('bcc'))
+        self.assertFalse(dfa.process_string('bcb'))
+    
+    def test_nfa_not_compilable(self):
+        with self.assertRaises(ValueError):
+            create_nfa_a_or_b_star_abb().compile()
+
+class TestLazyDFA(unittest.TestCase):
+    def setUp(self):
+        self.nfa = create_nfa_a_or_b_star_abb()
+    
+    def test_matches_set_simulation(self):
+        lazy = self.nfa.lazy_dfa()
+        
+        for s in all_strings('abc', 6):
+            with self.subTest(string=s):
+                self.assertEqual(lazy.accepts(s), self.nfa.process_string(s))
+    
+    def test_cache_counters(self):
+        lazy = self.nfa.lazy_dfa()
+        lazy.accepts('abbabb')
+        first_misses = lazy.misses
+        lazy.accepts('abbabb')
+        
+        # The second run is answered entirely from the cache
+        self.assertEqual(lazy.misses, first_misses)
+        self.assertEqual(lazy.hits + lazy.misses, 12)
+    
+    def test_bounded_cache(self):
+        nfa = create_nfa_nth_last_a(8)
+        lazy = nfa.lazy_dfa(max_states=16)
+        
+        for s in itertools.islice(all_strings('ab', 12), 0, None, 37):
+            with self.subTest(string=s):
+                self.assertEqual(lazy.accepts(s), nfa.process_string(s))
+                self.assertLessEqual(lazy.cache_size, 16)
+        self.assertGreater(lazy.flushes, 0)
+    
+    def test_lazy_engine(self):
+        self.nfa.engine = 'lazy'
+        self.assertTrue(self.nfa.process_string('babb'))
+        self.assertFalse(self.nfa.process_string('abba'))
+
+class TestConstruction(unittest.TestCase):
+    def setUp(self):
+        self.nfa = create_nfa_a_or_b_star_abb()
+    
+    def test_determinize(self):
+        dfa = self.nfa.determinize()
+        self.assertTrue(dfa.is_deterministic)
+        self.assertEqual(len(dfa.states), 4)
+        
+        for s in all_strings('ab', 8):
+            with self.subTest(string=s):
+                self.assertEqual(dfa.process_string(s), self.nfa.process_string(s))
+    
+    def test_determinize_blowup(self):
+        nfa = create_nfa_nth_last_a(5)
+        dfa = nfa.determinize()
+        self.assertEqual(len(dfa.states), 2 ** 6)
+        
+        for s in all_strings('ab', 9):
+            with self.subTest(string=s):
+                self.assertEqual(dfa.process_string(s), nfa.process_string(s))
+    
+    def test_minimize(self):
+        # An explicit error state and a duplicate of q1 both disappear
+        states = {'start', 'x', 'y', 'error'}
+        transitions = {
+            ('start', 'a'): 'x', ('start', 'b'): 'y', ('start', 'c'): 'error',
+            ('x', 'c'): 'y', ('y', 'c'): 'x',
+            ('x', 'a'): 'error', ('x', 'b'): 'error',
+            ('y', 'a'): 'error', ('y', 'b'): 'error',
+            ('error', 'a'): 'error', ('error', 'b'): 'error', ('error', 'c'): 'error',
+        }
+        dfa = FSM(states, {'a', 'b', 'c'}, transitions, 'start', {'x', 'y'})
+        minimal = dfa.minimize()
+        
+        self.assertEqual(minimal.states, {'q0', 'q1'})
+        for s in all_strings('abc', 5):
+            with self.subTest(string=s):
+                self.assertEqual(minimal.process_string(s), dfa.process_string(s))
+    
+    def test_minimize_is_canonical(self):
+        # Equivalent machines minimize to the same FSM
+        direct = self.nfa.minimize()
+        via_dfa = self.nfa.determinize().minimize()
+        
+        self.assertEqual(direct.transitions, via_dfa.transitions)
+        self.assertEqual(direct.accept_states, via_dfa.accept_states)
+        self.assertEqual(len(direct.states), 4)
+    
+    def test_minimize_empty_language(self):
+        dfa = FSM({'q0', 'q1'}, {'a'}, {('q0', 'a'): 'q1'}, 'q0', set())
+        minimal = dfa.minimize()
+        
+        self.assertEqual(minimal.states, {'q0'})
+        self.assertEqual(minimal.transitions, {})
+
+class TestBitsetNFA(unittest.TestCase):
+    def setUp(self):
+        self.nfa = create_nfa_a_or_b_star_abb()
+        self.bitset = self.nfa.bitset_nfa()
+    
+    def test_matches_set_simulation(self):
+        for s in all_strings('abc', 6):
+            with self.subTest(string=s):
+                self.assertEqual(self.bitset.accepts(s), self.nfa.process_string(s))
+    
+    def test_step_matches_transition(self):
+        # Every single step agrees with the set-based transition
+        nfa = create_nfa_nth_last_a(12)
+        bitset = nfa.bitset_nfa()
+        mask = bitset.start_mask
+        nfa.reset()
+        
+        for symbol in 'abaabbbabaababba':
+            nfa.transition(symbol)
+            mask = bitset.step(mask, symbol)
+            self.assertEqual(bitset.to_states(mask), nfa.current_states)
+    
+    def test_bitset_engine(self):
+        self.nfa.engine = 'bitset'
+        self.assertTrue(self.nfa.process_string('aabb'))
+        self.assertFalse(self.nfa.process_string('aab'))
+
+class TestAcceptsMany(unittest.TestCase):
+    def test_dfa_batch(self):
+        dfa = create_dfa_a_plus_b_c_star()
+        strings = list(all_strings('abcx', 5)) + ['a' + 'c' * 300, '']
+        
+        results = dfa.accepts_many(strings)
+        self.assertEqual(len(results), len(strings))
+        for s, result in zip(strings, results):
+            with self.subTest(string=s):
+                self.assertEqual(bool(result), dfa.process_string(s))
+    
+    def test_nfa_batch(self):
+        nfa = create_nfa_a_or_b_star_abb()
+        strings = list(all_strings('ab', 7))
+        
+        expected = [nfa.process_string(s) for s in strings]
+        self.assertEqual([bool(r) for r in nfa.accepts_many(strings)], expected)
+    
+    def test_empty_batch(self):
+        self.assertEqual(len(create_dfa_a_plus_b_c_star().accepts_many([])), 0)
+
+class TestStreamMatcher(unittest.TestCase):
+    def test_chunks(self):
+        nfa = create_nfa_a_or_b_star_abb()
+        
+        for s in all_strings('ab', 7):
+            with self.subTest(string=s):
+                stream = nfa.stream()
+                for i in range(0, len(s), 3):
+                    stream.feed(s[i:i + 3])
+                self.assertEqual(stream.finish(), nfa.process_string(s))
+    
+    def test_bytes_and_history(self):
+        dfa = create_dfa_a_plus_b_c_star()
+        stream = dfa.stream()
+        self.assertIsNone(stream.history)
+        
+        stream.feed(b'a')
+        stream.feed(bytearray(b'cc'))
+        self.assertTrue(stream.finish())
+        self.assertEqual(stream.position, 3)
+        
+        stream = dfa.stream(record_history=True)
+        stream.feed('bc')
+        self.assertEqual(stream.history, ['b', 'c'])
+    
+    def test_encoded_bytes(self):
+        # A two-byte UTF-8 character split across chunks is decoded whole
+        fsm = FSM({'q0', 'q1'}, {'\u00e9'}, {('q0', '\u00e9'): 'q1'}, 'q0', {'q1'})
+        data = '\u00e9'.encode('utf-8')
+        stream = fsm.stream(encoding='utf-8')
+        stream.feed(data[:1])
+        stream.feed(data[1:])
+        self.assertTrue(stream.finish())
+    
+    def test_dead_stream(self):
+        stream = create_dfa_a_plus_b_c_star().stream()
+        self.assertFalse(stream.feed('ab'))
+        self.assertFalse(stream.feed('c' * 1000))
+        self.assertFalse(stream.finish())
+    
+    def test_decided_stream(self):
+        from unittest import mock
+        from fsm_ranges import MAX_CODE, CharRange
+        
+        # An explicit error state that loops on every symbol, not trimmed away
+        dfa = FSM({'s', 'ok', 'err'}, {'a', 'b'},
+                  {('s', 'a'): 'ok', ('s', 'b'): 'err', ('err', 'a'): 'err', ('err', 'b'): 'err'},
+                  's', {'ok'})
+        stream = dfa.stream()
+        self.assertFalse(stream.feed('b'))
+        with mock.patch.object(stream.compiled, 'advance', side_effect=AssertionError):
+            self.assertFalse(stream.feed('ab' * 1000))
+        self.assertFalse(stream.finish())
+        
+        everything = CharRange(chr(0), chr(MAX_CODE))
+        prefix = FSM({'q0', 'q1'}, {everything}, {('q0', 'a'): 'q1', ('q1', everything): 'q1'}, 'q0', {'q1'})
+        stream = prefix.stream()
+        self.assertTrue(stream.feed('a'))
+        with mock.patch.object(stream.compiled, 'advance', side_effect=AssertionError):
+            self.assertTrue(stream.feed(b'\xff' * 10))
+        self.assertTrue(stream.finish())
+
+class TestScanFile(unittest.TestCase):
+    def setUp(self):
+        self.dfa = create_dfa_a_plus_b_c_star()
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+    
+    def tearDown(self):
+        os.remove(self.path)
+    
+    def write(self, data):
+        with open(self.path, 'wb') as file:
+            file.write(data)
+    
+    def test_whole_file(self):
+        self.write(b'a' + b'c' * 10000)
+        self.assertTrue(self.dfa.scan_file(self.path))
+        
+        self.write(b'a' + b'c' * 10000 + b'a')
+        self.assertFalse(self.dfa.scan_file(self.path))
+    
+    def test_empty_file(self):
+        self.write(b'')
+        self.assertFalse(self.dfa.scan_file(self.path))
+        self.assertEqual(list(self.dfa.scan_file(self.path, by_line=True)), [])
+    
+    def test_lines(self):
+        self.write(b'ac\r\nab\n\nbccc\nc')
+        verdicts = list(self.dfa.scan_file(self.path, by_line=True))
+        
+        self.assertEqual(verdicts, [(1, True), (2, False), (3, False), (4, True), (5, False)])
+    
+    def test_nfa_lines(self):
+        nfa = create_nfa_a_or_b_star_abb()
+        lines = list(all_strings('ab', 5))
+        self.write('\n'.join(lines).encode() + b'\n')
+        
+        verdicts = [accepted for _, accepted in nfa.scan_file(self.path, by_line=True)]
+        self.assertEqual(verdicts, [nfa.process_string(s) for s in lines])
+    
+    def test_buffer_protocol(self):
+        from array import array
+        from unittest import mock
+        import fsm_stream
+        
+        compiled = self.dfa.compiled_dfa()
+        expected = [(1, True), (2, False), (3, True)]
+        for buffer in (memoryview(b'ac\r\nab\nbc'), bytearray(b'ac\r\nab\nbc'), array('b', b'ac\r\nab\nbc')):
+            with self.subTest(kind=type(buffer).__name__):
+                self.assertEqual(list(fsm_stream.scan_buffer_lines(compiled, buffer)), expected)
+        # Newlines are found across window boundaries too
+        lines = [b'a' + b'c' * length for length in range(20)]
+        with mock.patch.object(fsm_stream, 'SCAN_WINDOW', 8):
+            verdicts = list(fsm_stream.scan_buffer_lines(compiled, memoryview(b'\n'.join(lines))))
+        self.assertEqual(verdicts, [(number, True) for number in range(1, 21)])
+        self.assertTrue(fsm_stream.scan_buffer(compiled, array('b', b'acc')))
+    
+    def test_stops_at_decided_state(self):
+        from unittest import mock
+        import fsm_stream
+        from fsm_ranges import MAX_CODE, CharRange
+        
+        dfa = FSM({'s', 'ok', 'err'}, {'a', 'b'},
+                  {('s', 'a'): 'ok', ('s', 'b'): 'err', ('err', 'a'): 'err', ('err', 'b'): 'err'},
+                  's', {'ok'})
+        everything = CharRange(chr(0), chr(MAX_CODE))
+        prefix = FSM({'q0', 'q1'}, {everything}, {('q0', 'a'): 'q1', ('q1', everything): 'q1'}, 'q0', {'q1'})
+        walk = fsm_stream._walk
+        windows = []
+        
+        def counting_walk(byte_delta, offset, view):
+            windows.append(len(view))
+            return walk(byte_delta, offset, view)
+        
+        with mock.patch.object(fsm_stream, 'SCAN_WINDOW', 64), \
+                mock.patch.object(fsm_stream, '_walk', counting_walk):
+            self.write(b'b' + b'ab' * 5000)
+            self.assertFalse(dfa.scan_file(self.path))
+            self.assertEqual(windows, [64])
+            
+            windows.clear()
+            self.write(b'a' + b'\xff' * 10000)
+            self.assertTrue(prefix.scan_file(self.path))
+            self.assertEqual(windows, [64])
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        self.nfa = create_nfa_a_or_b_star_abb()
+        self.strings = list(all_strings('abx', 6))
+    
+    def test_parallel_accepts(self):
+        from fsm_parallel import parallel_accepts
+        
+        results = parallel_accepts(self.nfa, self.strings, workers=2, chunk_size=100)
+        self.assertEqual(results, [self.nfa.process_string(s) for s in self.strings])
+    
+    def test_parallel_scan_lines(self):
+        from fsm_parallel import parallel_scan_lines
+        
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as file:
+            file.write('\n'.join(self.strings) + '\n')
+        try:
+            results = parallel_scan_lines(self.nfa.compiled_dfa(), path, workers=2)
+        finally:
+            os.remove(path)
+        self.assertEqual(results, [self.nfa.process_string(s) for s in self.strings])
+
+class TestComposition(unittest.TestCase):
+    def setUp(self):
+        self.compiled = create_nfa_nth_last_a(4).compiled_dfa()
+        self.text = ''.join(itertools.islice(itertools.cycle('abbabaaabbb'), 5000))
+    
+    def test_chunk_mapping(self):
+        from fsm_parallel import chunk_mapping
+        
+        columns = self.compiled.columns(self.text[:300])
+        mapping = chunk_mapping(self.compiled._delta, self.compiled._stride,
+                                self.compiled.num_states, columns)
+        for state in range(self.compiled.num_states):
+            with self.subTest(state=state):
+                self.assertEqual(mapping[state], self.compiled.advance(state, columns))
+    
+    def test_parallel_run(self):
+        from fsm_parallel import parallel_run
+        
+        for length in (0, 1, 7, 5000):
+            text = self.text[:length]
+            with self.subTest(length=length):
+                expected = self.compiled.run(text)
+                self.assertEqual(parallel_run(self.compiled, text, workers=3, force=True), expected)
+                self.assertEqual(parallel_run(self.compiled, text.encode(), workers=3, force=True), expected)
+    
+    def test_parallel_run_file(self):
+        from unittest import mock
+        import fsm_parallel
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'input.txt')
+            # Small windows so the workers read their ranges in several pieces
+            with mock.patch.object(fsm_parallel, 'FILE_WINDOW', 100):
+                for length in (0, 1, 7, 5000):
+                    with open(path, 'w') as file:
+                        file.write(self.text[:length])
+                    with self.subTest(length=length):
+                        expected = self.compiled.run(self.text[:length])
+                        self.assertEqual(fsm_parallel.parallel_run_file(self.compiled, path, workers=3, force=True),
+                                         expected)
+                        self.assertEqual(fsm_parallel.parallel_run_file(self.compiled, path, workers=3), expected)
+    
+    def test_heuristic(self):
+        from fsm_parallel import composition_pays_off
+        
+        # Short inputs and single workers never go parallel
+        self.assertFalse(composition_pays_off(self.compiled, self.text, 16))
+        self.assertFalse(composition_pays_off(self.compiled, self.text * 1000, 1))
+        self.assertTrue(composition_pays_off(self.compiled, self.text * 1000, 16))
+
+class TestEpsilon(unittest.TestCase):
+    def setUp(self):
+        # a*b* written with an epsilon move between the two loops
+        transitions = {
+            ('q0', 'a'): {'q0'},
+            ('q0', EPSILON): {'q1'},
+            ('q1', 'b'): {'q1'},
+        }
+        self.nfa = FSM({'q0', 'q1'}, {'a', 'b'}, transitions, 'q0', {'q1'}, is_deterministic=False)
+    
+    def test_closure(self):
+        self.assertEqual(self.nfa.epsilon_closure(['q0']), {'q0', 'q1'})
+        self.assertEqual(self.nfa.start_states(), {'q0', 'q1'})
+    
+    def test_engines(self):
+        for engine in ('dict', 'lazy', 'bitset'):
+            self.nfa.engine = engine
+            for s in all_strings('ab', 5):
+                with self.subTest(engine=engine, string=s):
+                    self.assertEqual(self.nfa.process_string(s), re.fullmatch('a*b*', s) is not None)
+
+class TestRegex(unittest.TestCase):
+    def assertMatchesRe(self, pattern, test_symbols, max_length=6, **kwargs):
+        from fsm_regex import regex_to_nfa
+        
+        nfa = regex_to_nfa(pattern, **kwargs)
+        dfa = nfa.minimize()
+        for s in all_strings(test_symbols, max_length):
+            expected = re.fullmatch(pattern, s) is not None and all(map(nfa.in_alphabet, s))
+            with self.subTest(pattern=pattern, string=s):
+                self.assertEqual(nfa.process_string(s), expected)
+                self.assertEqual(dfa.process_string(s), expected)
+    
+    def test_operators(self):
+        self.assertMatchesRe('(a|b)*abb', 'ab')
+        self.assertMatchesRe('a+b?c*', 'abc')
+        self.assertMatchesRe('(ab|a)*', 'ab')
+        self.assertMatchesRe('(a|)b', 'ab')
+        self.assertMatchesRe('', 'a')
+    
+    def test_bounded_repetition(self):
+        self.assertMatchesRe('a{2,3}b', 'ab')
+        self.assertMatchesRe('a{2,}', 'ab')
+        self.assertMatchesRe('a{0,2}(b|c)', 'abc')
+        self.assertMatchesRe('x(y|z){3}', 'xyz')
+    
+    def test_classes(self):
+        self.assertMatchesRe('[a-c]+x', 'abcx')
+        self.assertMatchesRe('[^a]b', 'abc', alphabet={'a', 'b', 'c'})
+        self.assertMatchesRe('.a.', 'abc', alphabet={'a', 'b', 'c'})
+        self.assertMatchesRe('\\d+', '01a')
+        self.assertMatchesRe('[^a-b]c', 'abcd', alphabet={'a', 'b', 'c', 'd'})
+        self.assertMatchesRe('[a\\dc-e]+', 'a1cex')
+
+    def test_wide_class_is_one_range(self):
+        from fsm_regex import regex_to_nfa
+        from fsm_ranges import CharRange
+
+        nfa = regex_to_nfa('[\u0000-\uffff]')
+        labels = [label for (_, label) in nfa.transitions if label != EPSILON]
+        self.assertEqual(labels, [CharRange('\u0000', '\uffff')])
+        self.assertTrue(nfa.process_string('\u4e2d'))
+        self.assertFalse(nfa.process_string('\U0001f600'))
+
+        # Negation is the interval complement, cut to the alphabet's ranges
+        nfa = regex_to_nfa('[^b-y]', alphabet={CharRange('a', 'z'), '!'})
+        labels = {label for (_, label) in nfa.transitions if label != EPSILON}
+        self.assertEqual(labels, {CharRange('a', 'a'), CharRange('z', 'z'), '!'})
+        for s, expected in (('a', True), ('z', True), ('!', True), ('m', False), ('?', False)):
+            with self.subTest(string=s):
+                self.assertEqual(nfa.process_string(s), expected)
+    
+    def test_syntax_errors(self):
+        from fsm_regex import regex_to_nfa
+        
+        for pattern in ('(a', 'a)', '*a', 'a{3,1}', '[b-a]', 'a{'):
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(ValueError):
+                    regex_to_nfa(pattern)
+
+class TestAlphabetClasses(unittest.TestCase):
+    def setUp(self):
+        # Identifiers over a large alphabet: letters, digits and some non-latin symbols
+        letters = set(string.ascii_letters) | {'é', 'ß', 'λ', 'Ж', '\U0001F600'}
+        digits = set(string.digits)
+        transitions = {}
+        for symbol in letters:
+            transitions[('start', symbol)] = 'ident'
+            transitions[('ident', symbol)] = 'ident'
+        for symbol in digits:
+            transitions[('ident', symbol)] = 'ident'
+        self.dfa = FSM({'start', 'ident'}, letters | digits | {'-'}, transitions, 'start', {'ident'})
+        self.compiled = self.dfa.compile()
+    
+    def test_class_count(self):
+        # Letters, digits and the unused '-' collapse to three columns
+        self.assertEqual(self.compiled.num_classes, 3)
+        self.assertEqual(len(self.compiled.table), self.compiled.num_states * 3)
+        self.assertEqual(self.compiled.symbol_index['a'], self.compiled.symbol_index['λ'])
+        self.assertNotIn('-', self.compiled.symbol_index)
+    
+    def test_matches_dict_engine(self):
+        strings = ['', 'a', 'a1', '1a', 'λx9', 'Жé', 'ß-', '\U0001F600z', 'a\U0001F601', 'aĀ', 'a\0']
+        for s in strings:
+            with self.subTest(string=s):
+                self.assertEqual(self.compiled.accepts(s), self.dfa.process_string(s))
+                self.assertEqual(bool(self.compiled.accepts_many([s])[0]), self.dfa.process_string(s))
+    
+    def test_wide_lookup(self):
+        # Without the astral symbol the lookup fits in a 65536-entry string
+        dfa = create_dfa_a_plus_b_c_star()
+        dfa.alphabet.add('Ж')
+        dfa.transitions[('q1', 'Ж')] = 'q1'
+        compiled = dfa.compile()
+        self.assertEqual(len(compiled._column_map), 65536)
+        self.assertTrue(compiled.accepts('aЖc'))
+        self.assertFalse(compiled.accepts('a\U0001F600'))
+
+class TestRanges(unittest.TestCase):
+    def setUp(self):
+        from fsm_ranges import CharRange
+        
+        # Identifiers: a letter (latin, cyrillic or astral) or '_', then letters and digits
+        letters = [CharRange('a', 'z'), CharRange('A', 'Z'), CharRange('\u0400', '\u04ff'),
+                   CharRange('\U00010000', '\U0001ffff')]
+        transitions = {('start', '_'): 'ident', ('ident', CharRange('0', '9')): 'ident'}
+        for letter in letters:
+            transitions[('start', letter)] = 'ident'
+            transitions[('ident', letter)] = 'ident'
+        # 'q' is special-cased: it may only start an identifier
+        transitions[('ident', 'q')] = 'after_q'
+        alphabet = set(letters) | {'_', 'q', CharRange('0', '9')}
+        self.dfa = FSM({'start', 'ident', 'after_q'}, alphabet, transitions, 'start', {'ident', 'after_q'})
+        self.strings = ['', 'a', '_', 'q', 'aq', 'aqa', 'Жx9', '9a', 'a9', '_\U0001f600',
+                        '\U0001f600z', 'a\u0500', 'é', 'a-b', 'zZ09']
+    
+    def expected(self, s):
+        def letter(c):
+            return c.isascii() and c.isalpha() or '\u0400' <= c <= '\u04ff' or '\U00010000' <= c <= '\U0001ffff'
+        if not s or not (letter(s[0]) or s[0] == '_'):
+            return False
+        rest = s[1:]
+        if 'q' in rest:
+            return rest.index('q') == len(rest) - 1 and all(letter(c) or c.isdigit() for c in rest)
+        return all(letter(c) or c.isdigit() for c in rest)
+    
+    def test_engines_agree(self):
+        minimal = self.dfa.minimize()
+        compiled = self.dfa.compile()
+        lazy = self.dfa.lazy_dfa()
+        bitset = self.dfa.bitset_nfa()
+        for s in self.strings:
+            with self.subTest(string=s):
+                expected = self.expected(s)
+                self.assertEqual(self.dfa.process_string(s), expected)
+                self.assertEqual(compiled.accepts(s), expected)
+                self.assertEqual(lazy.accepts(s), expected)
+                self.assertEqual(bitset.accepts(s), expected)
+                self.assertEqual(minimal.process_string(s), expected)
+    
+    def test_size_follows_ranges(self):
+        from fsm_ranges import CharRange
+        
+        # Any character at all, then 'x': a handful of classes, not 10^6 columns
+        everything = CharRange('\0', '\U0010ffff')
+        dfa = FSM({'q0', 'q1'}, {everything}, {('q0', everything): 'q0', ('q0', 'x'): 'q1'}, 'q0', {'q1'})
+        compiled = dfa.compile()
+        self.assertEqual(compiled.num_classes, 3)
+        self.assertTrue(compiled.accepts('\U0010fffd\u4e2dx'))
+        self.assertFalse(compiled.accepts('x\u4e2d'))
+        self.assertEqual(len(dfa.minimize().transitions), 3)
+    
+    def test_nfa_combines_ranges(self):
+        from fsm_ranges import CharRange
+        
+        nfa = FSM({'q0', 'q1', 'q2'}, {CharRange('a', 'z')},
+                  {('q0', CharRange('a', 'm')): {'q1'}, ('q0', CharRange('k', 'z')): {'q2'},
+                   ('q0', 'l'): {'q0'}, ('q2', 'z'): {'q2'}},
+                  'q0', {'q1', 'q2'}, is_deterministic=False)
+        for s in ('a', 'l', 'k', 'x', 'lz', 'az', 'lla', 'A'):
+            expected = bool(re.fullmatch('l*([a-m]|[k-z]z*)', s))
+            with self.subTest(string=s):
+                self.assertEqual(nfa.process_string(s), expected)
+                self.assertEqual(nfa.compiled_dfa().accepts(s), expected)
+                self.assertEqual(nfa.bitset_nfa().accepts(s), expected)
+    
+    def test_overlapping_dfa_ranges(self):
+        from fsm_ranges import CharRange
+        
+        with self.assertRaises(ValueError):
+            FSM({'q0'}, {CharRange('a', 'z')},
+                {('q0', CharRange('a', 'm')): 'q0', ('q0', CharRange('k', 'z')): 'q0'}, 'q0', {'q0'})
+    
+    def test_labels(self):
+        from fsm_ranges import CharRange, format_label, parse_label
+        
+        self.assertEqual(parse_label('a-z'), CharRange('a', 'z'))
+        self.assertEqual(parse_label('U+0400-U+04FF'), CharRange('\u0400', '\u04ff'))
+        self.assertEqual(parse_label('U+00E9'), '\u00e9')
+        self.assertEqual(parse_label('-'), '-')
+        self.assertEqual(format_label(CharRange(' ', '~')), 'U+0020-U+007E')
+        with self.assertRaises(ValueError):
+            parse_label('z-a')
+    
+    def test_loaders(self):
+        from fsm_loader import fsm_from_config, fsm_from_definition
+        
+        json_fsm = fsm_from_definition({
+            "states": ["q0", "q1"], "alphabet": ["a-z", "U+0400-U+04FF"],
+            "transitions": {"q0": {"a-z": "q1", "U+0400-U+04FF": "q1"}, "q1": {"a-z": "q1"}},
+            "start_state": "q0", "accept_states": ["q1"],
+        })
+        ini_fsm = fsm_from_config(
+            "[General]\ntype = DFA\n[States]\nstates = q0, q1\ninitial_state = q0\naccepting_states = q1\n"
+            "[Transition_0]\nfrom_state = q0\nsymbol = a-z\nto_states = q1\n"
+            "[Transition_1]\nfrom_state = q0\nsymbol = U+0400-U+04FF\nto_states = q1\n"
+            "[Transition_2]\nfrom_state = q1\nsymbol = a-z\nto_states = q1\n"
+        )
+        for fsm in (json_fsm, ini_fsm):
+            for s, expected in (('abc', True), ('Жab', True), ('aЖ', False), ('', False)):
+                with self.subTest(string=s):
+                    self.assertEqual(fsm.process_string(s), expected)
+
+class TestCompactFSM(unittest.TestCase):
+    def setUp(self):
+        from fsm_regex import regex_to_nfa
+        
+        self.machines = [
+            (create_dfa_a_plus_b_c_star(), 'abc'),
+            (create_nfa_a_or_b_star_abb(), 'ab'),
+            (regex_to_nfa('(ab|c)*a?'), 'abc'),
+        ]
+    
+    def test_round_trip(self):
+        for fsm, symbols in self.machines:
+            compact = fsm.compact()
+            back = compact.to_fsm()
+            self.assertEqual(back.states, fsm.states)
+            for s in all_strings(symbols + 'x', 5):
+                with self.subTest(string=s):
+                    self.assertEqual(compact.accepts(s), fsm.process_string(s))
+                    self.assertEqual(back.process_string(s), fsm.process_string(s))
+    
+    def test_ranges(self):
+        from fsm_ranges import CharRange
+        
+        nfa = FSM({'q0', 'q1'}, {CharRange('a', 'z'), CharRange('\u0400', '\u04ff')},
+                  {('q0', CharRange('a', 'z')): {'q0'}, ('q0', 'x'): {'q1'},
+                   ('q1', CharRange('\u0400', '\u04ff')): {'q1'}},
+                  'q0', {'q1'}, is_deterministic=False)
+        compact = nfa.compact()
+        for s in ('x', 'axЖ', 'xx', 'Ж', 'abxЖЖ', 'abx?'):
+            with self.subTest(string=s):
+                self.assertEqual(compact.accepts(s), nfa.process_string(s))
+                self.assertEqual(compact.to_fsm().process_string(s), nfa.process_string(s))
+    
+    def test_layout(self):
+        compact = create_dfa_a_plus_b_c_star().compact()
+        self.assertEqual(compact.num_edges, 3)
+        self.assertEqual(list(compact.row_offsets), [0, 2, 3, 3])
+        q1 = compact.state_names.index('q1')
+        self.assertEqual(list(compact.targets(q1, compact.symbols.index('c'))), [q1])
+        self.assertEqual(len(compact.accepting), 1)
+        self.assertTrue(compact.is_accepting(q1))
+        self.assertFalse(hasattr(compact, '__dict__'))
+    
+    def test_from_edges(self):
+        from fsm_compact import CompactFSM
+        
+        # Edges in any order; state 1 loops on 'b' and accepts
+        compact = CompactFSM.from_edges(2, ['a', 'b'], [1, 0], [1, 0], [1, 1], 0, [1])
+        self.assertTrue(compact.accepts('abbb'))
+        self.assertFalse(compact.accepts('ba'))
+        self.assertEqual(compact.to_fsm().transitions, {(0, 'a'): 1, (1, 'b'): 1})
+        with self.assertRaises(ValueError):
+            CompactFSM.from_edges(2, ['a'], [0, 0], [0, 0], [0, 1], 0, [1])
+
+class TestBinaryFormat(unittest.TestCase):
+    def setUp(self):
+        from fsm_ranges import CharRange
+        
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'machine.fsmc')
+        letters = CharRange('\u0400', '\u04ff')
+        astral = CharRange('\U0001f600', '\U0001f64f')
+        self.dfa = FSM({'q0', 'q1', 'q2'}, {'a', 'b', letters, astral},
+                       {('q0', 'a'): 'q1', ('q1', letters): 'q1', ('q1', 'b'): 'q2', ('q2', astral): 'q2'},
+                       'q0', {'q1', 'q2'})
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def test_round_trip(self):
+        from fsm_binary import load_compiled, save_compiled
+        
+        compiled = self.dfa.compile()
+        save_compiled(compiled, self.path)
+        loaded = load_compiled(self.path)
+        self.assertEqual(loaded.num_states, compiled.num_states)
+        self.assertEqual(list(loaded.state_names), compiled.state_names)
+        self.assertEqual(list(loaded.table), list(compiled.table))
+        self.assertEqual(bytes(loaded.accepting), bytes(compiled.accepting))
+        self.assertEqual(bytes(loaded.decided), bytes(compiled.decided))
+        for s in ('a', 'aЖЖ', 'ab\U0001f600', 'ab\U0001f700', 'b', 'aЖbЖ', ''):
+            with self.subTest(string=s):
+                self.assertEqual(loaded.accepts(s), self.dfa.process_string(s))
+        self.assertEqual(list(loaded.accepts_many(['a', 'b', 'aЖb'])), [True, False, True])
+        self.assertEqual(loaded.state_names[loaded.run('ab')], 'q2')
+    
+    def test_zero_copy(self):
+        from fsm_binary import load_compiled, save_compiled
+        
+        save_compiled(create_dfa_a_plus_b_c_star().compile(), self.path)
+        loaded = load_compiled(self.path)
+        if sys.byteorder == 'little':
+            self.assertIsInstance(loaded._delta, memoryview)
+            self.assertTrue(loaded._delta.readonly)
+    
+    def test_byte_order(self):
+        from unittest import mock
+        import struct
+        import fsm_binary
+        
+        compiled = self.dfa.compile()
+        fsm_binary.save_compiled(compiled, self.path)
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        fields = fsm_binary.HEADER.unpack_from(data)
+        delta_offset, delta_length = fields[7:9]
+        # The table is little-endian whatever the host
+        self.assertEqual(data[delta_offset:delta_offset + delta_length],
+                         struct.pack(f'<{len(compiled.table)}i', *compiled._delta))
+        
+        # The big-endian paths byteswap on both sides, so they round-trip
+        with mock.patch.object(fsm_binary.sys, 'byteorder', 'big' if sys.byteorder == 'little' else 'little'):
+            fsm_binary.save_compiled(compiled, self.path)
+            loaded = fsm_binary.load_compiled(self.path)
+            self.assertEqual(list(loaded.state_names), compiled.state_names)
+            for s in ('a', 'aЖЖ', 'ab\U0001f600', 'b'):
+                with self.subTest(string=s):
+                    self.assertEqual(loaded.accepts(s), self.dfa.process_string(s))
+    
+    def test_rejects_bad_files(self):
+        from fsm_binary import FORMAT_VERSION, load_compiled, save_compiled
+        
+        save_compiled(self.dfa.compile(), self.path)
+        with open(self.path, 'rb') as file:
+            data = bytearray(file.read())
+        for corrupt, message in ((b'XXXX' + data[4:], 'not a compiled'),
+                                 (data[:4] + bytes([FORMAT_VERSION + 1, 0]) + data[6:], 'version'),
+                                 (data[:20] + bytes(reversed(data[20:24])) + data[24:], 'byte order'),
+                                 (data[:len(data) // 2], 'truncated')):
+            with open(self.path, 'wb') as file:
+                file.write(corrupt)
+            with self.subTest(message=message):
+                with self.assertRaisesRegex(ValueError, message):
+                    load_compiled(self.path)
+
+class TestLoader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        self.here = os.path.dirname(os.path.abspath(__file__))
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+    
+    def test_all_formats(self):
+        from fsm_loader import load_fsm
+        
+        dfa = create_dfa_a_plus_b_c_star()
+        nfa = create_nfa_a_or_b_star_abb()
+        table = os.path.join(self.here, 'transition_tables.json')
+        custom = self.write('custom.json', json.dumps({
+            "states": ["q0", "q1"], "alphabet": ["a", "b", "c"],
+            "transitions": {"q0": {"a": "q1", "b": "q1"}, "q1": {"c": "q1"}},
+            "start_state": "q0", "accept_states": ["q1"], "is_deterministic": True,
+        }))
+        cases = [
+            (load_fsm(os.path.join(self.here, 'dfa_config.txt')), dfa),
+            (load_fsm(os.path.join(self.here, 'nfa_config.txt')), nfa),
+            (load_fsm(table, 'dfa_a_plus_b_c_star'), dfa),
+            (load_fsm(table, 'nfa_a_or_b_star_abb'), nfa),
+            (load_fsm(custom), dfa),
+        ]
+        for loaded, reference in cases:
+            for s in all_strings('abc', 5):
+                with self.subTest(string=s):
+                    self.assertEqual(loaded.process_string(s), reference.process_string(s))
+    
+    def test_validation(self):
+        from fsm_loader import parse_definition
+        
+        definition = {
+            "states": ["q0", "q1"], "alphabet": ["a", "c-e"],
+            "transitions": {"q0": {"a": "q1", "b": "q1", "d": "q2", "c-f": "q1"}, "q9": {"a": ["q0", "q1"]}},
+            "start_state": "q0", "accept_states": ["q1", "q3"],
+        }
+        with self.assertRaises(ValueError) as raised:
+            parse_definition(json.dumps(definition))
+        message = str(raised.exception)
+        for problem in ("'b' of state 'q0' is not in the alphabet", "'q2' leads to an unknown state",
+                        "'c-f' of state 'q0' is not in the alphabet", "accept state 'q3'",
+                        "unknown state 'q9'", "several targets on 'a' in a DFA"):
+            self.assertIn(problem, message)
+        self.assertNotIn("'d'", message)
+        
+        with self.assertRaisesRegex(ValueError, 'Pick one of'):
+            with open(os.path.join(self.here, 'transition_tables.json')) as file:
+                parse_definition(file.read())
+        with self.assertRaisesRegex(ValueError, 'exactly one target'):
+            parse_definition("[General]\ntype = DFA\n[States]\nstates = q0\ninitial_state = q0\n"
+                             "[Transition_0]\nfrom_state = q0\nsymbol = a\nto_states = q0, q0\n")
+    
+    def test_compiled_cache(self):
+        from unittest import mock
+        import fsm_loader
+        
+        with open(os.path.join(self.here, 'nfa_config.txt')) as file:
+            path = self.write('machine.txt', file.read())
+        first = fsm_loader.load_compiled_definition(path, cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        
+        # An unchanged source never reaches the parser again
+        with mock.patch.object(fsm_loader, 'parse_definition', side_effect=AssertionError):
+            cached = fsm_loader.load_compiled_definition(path, cache_dir=self.cache_dir)
+        self.assertIsInstance(cached._delta, memoryview)
+        for s in all_strings('ab', 6):
+            with self.subTest(string=s):
+                self.assertEqual(cached.accepts(s), first.accepts(s))
+        
+        # Any edit to the source gives a new key
+        with open(path, 'a') as file:
+            file.write("\n")
+        fsm_loader.load_compiled_definition(path, cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        
+        # A corrupt entry is rebuilt instead of failing
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as file:
+                file.write(b'junk')
+        self.assertTrue(fsm_loader.load_compiled_definition(path, cache_dir=self.cache_dir).accepts('abb'))
+
+    def test_compiled_machines_warm_restart(self):
+        from unittest import mock
+        import fsm_loader
+        
+        with open(os.path.join(self.here, 'transition_tables.json')) as file:
+            table = self.write('tables.json', file.read())
+        with open(os.path.join(self.here, 'dfa_config.txt')) as file:
+            single = self.write('single.txt', file.read())
+        for path in (table, single):
+            first = fsm_loader.load_compiled_machines(path, cache_dir=self.cache_dir)
+            keys = []
+            
+            def counting_key(source, name=None, source_key=fsm_loader.source_key):
+                keys.append(name)
+                return source_key(source, name)
+            
+            # A warm load hashes the source once and never parses it
+            with mock.patch.object(fsm_loader, 'parse_definition', side_effect=AssertionError), \
+                    mock.patch.object(fsm_loader, 'fsm_from_definition', side_effect=AssertionError), \
+                    mock.patch.object(fsm_loader, 'json', mock.Mock(**{'loads.side_effect': AssertionError})), \
+                    mock.patch.object(fsm_loader, 'source_key', counting_key):
+                cached = fsm_loader.load_compiled_machines(path, cache_dir=self.cache_dir)
+            with self.subTest(path=os.path.basename(path)):
+                self.assertEqual(len(keys), 1)
+                self.assertEqual(list(cached), list(first))
+                for name, compiled in cached.items():
+                    self.assertIsInstance(compiled._delta, memoryview)
+                    for s in all_strings('abc', 4):
+                        self.assertEqual(compiled.accepts(s), first[name].accepts(s))
+        self.assertEqual(len(first), 1)
+
+class TestBenchmark(unittest.TestCase):
+    def test_generators(self):
+        from fsm_benchmark import random_dfa, random_nfa
+        
+        dfa = random_dfa(200, 'ab', density=0.5)
+        self.assertEqual(len(dfa.states), 200)
+        self.assertTrue(150 < len(dfa.transitions) < 250)
+        self.assertEqual(random_dfa(200, 'ab', density=0.5).transitions, dfa.transitions)
+        nfa = random_nfa(100, 'ab', density=2)
+        self.assertFalse(nfa.is_deterministic)
+        targets = sum(map(len, nfa.transitions.values()))
+        self.assertTrue(300 < targets < 420)
+    
+    def test_engines_agree(self):
+        from fsm_benchmark import ENGINES, build_engine, random_corpus, random_nfa
+        
+        strings = random_corpus('ab', 200, 0, 12)
+        verdicts = [list(map(bool, build_engine(random_nfa(30, 'ab'), engine)(strings))) for engine in ENGINES]
+        for engine, result in zip(ENGINES, verdicts):
+            with self.subTest(engine=engine):
+                self.assertEqual(result, verdicts[0])
+    
+    def test_run_suite(self):
+        from fsm_benchmark import run_suite
+        
+        results = run_suite(workloads=[('tiny', 'random_dfa', {'num_states': 20, 'alphabet': 'ab'})],
+                            corpora=[('short', 50, 0, 8)], engines=('dict', 'compiled'), repeat=1)
+        self.assertEqual([(r['workload'], r['engine']) for r in results['results']],
+                         [('tiny', 'dict'), ('tiny', 'compiled')])
+        for result in results['results']:
+            self.assertGreater(result['strings_per_sec'], 0)
+            self.assertGreaterEqual(result['peak_bytes'], 0)
+        json.dumps(results)
+    
+    def test_compare_results(self):
+        from fsm_benchmark import compare_results
+        
+        def run(strings_per_sec, compile_seconds, peak_bytes):
+            return {'results': [{'workload': 'w', 'corpus': 'c', 'engine': 'e', 'strings_per_sec': strings_per_sec,
+                                 'bytes_per_sec': strings_per_sec * 10, 'compile_seconds': compile_seconds,
+                                 'peak_bytes': peak_bytes}]}
+        
+        baseline = run(1000, 0.5, 1000)
+        self.assertEqual(compare_results(baseline, run(950, 0.54, 1050), 0.1), [])
+        regressions = compare_results(baseline, run(800, 0.6, 2000), 0.1)
+        self.assertEqual([metric for *_, metric, _, _ in regressions],
+                         ['strings_per_sec', 'bytes_per_sec', 'compile_seconds', 'peak_bytes'])
+        # Millisecond compile times are noise, not regressions
+        self.assertEqual(compare_results(run(1000, 0.001, 1000), run(1000, 0.005, 1000)), [])
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.dfa = create_dfa_a_plus_b_c_star()
+        self.nfa = create_nfa_a_or_b_star_abb()
+
+    def test_verdicts_unchanged(self):
+        from fsm_stats import RunStats
+
+        for fsm in (self.dfa, self.nfa):
+            for engine in ('dict', 'compiled', 'lazy', 'bitset'):
+                if engine == 'compiled' and not fsm.is_deterministic:
+                    continue
+                fsm.engine = engine
+                expected = [fsm.process_string(s) for s in all_strings('abcx', 5)]
+                stats = RunStats()
+                fsm.instrument(stats)
+                with self.subTest(engine=engine, deterministic=fsm.is_deterministic):
+                    self.assertEqual([fsm.process_string(s) for s in all_strings('abcx', 5)], expected)
+                    self.assertEqual(stats.runs, len(expected))
+                    self.assertEqual(stats.accepted, sum(expected))
+                fsm.instrument(None)
+
+    def test_dead_position_and_sizes(self):
+        from fsm_stats import RunStats
+
+        for engine in ('dict', 'compiled', 'lazy', 'bitset'):
+            runs = []
+            stats = RunStats(callback=runs.append)
+            self.dfa.engine = engine
+            self.dfa.instrument(stats)
+            with self.subTest(engine=engine):
+                self.assertFalse(self.dfa.process_string('acaccccc'))
+                self.assertEqual(runs[-1]['engine'], engine)
+                self.assertEqual(runs[-1]['dead_at'], 2)
+                self.assertEqual(runs[-1]['symbols'], 3)
+                self.assertEqual(runs[-1]['active_sizes'], {1: 2, 0: 1})
+                self.assertTrue(self.dfa.process_string('bcc'))
+                self.assertIsNone(runs[-1]['dead_at'])
+                self.assertEqual(stats.dead_positions, {2: 1})
+                self.assertEqual(stats.symbols, 6)
+
+        stats = RunStats()
+        self.nfa.engine = 'bitset'
+        self.nfa.instrument(stats)
+        self.nfa.process_string('abb')
+        # {q0} -a-> {q0, q1} -b-> {q0, q2} -b-> {q0, q3}
+        self.assertEqual(stats.active_sizes, {2: 3})
+        self.assertEqual(stats.mean_active_size, 2)
+
+    def test_cache_hits_and_phases(self):
+        from fsm_stats import RunStats
+
+        stats = RunStats(keep_runs=True)
+        lazy = self.nfa.lazy_dfa()
+        lazy.instrument(stats)
+        lazy.accepts('abab')
+        lazy.accepts('abab')
+        # The second 'b' reuses the transition cached by the first
+        self.assertEqual([run['cache_misses'] for run in stats.records], [3, 0])
+        self.assertEqual(stats.cache_hit_rate, 5 / 8)
+        self.assertEqual(set(stats.phase_seconds), {'determinize', 'run'})
+
+        compiled = self.dfa.compile()
+        compiled.instrument(stats)
+        compiled.accepts('acc')
+        self.assertEqual(set(stats.records[-1]['phases']), {'translate', 'run'})
+        json.dumps(stats.summary())
+
+    def test_uninstrumented_path(self):
+        from fsm_stats import RunStats
+
+        compiled = self.dfa.compile()
+        compiled.instrument(RunStats())
+        compiled.instrument(None)
+        self.assertNotIn('accepts', vars(compiled))
+        self.dfa.instrument(RunStats())
+        self.dfa.instrument(None)
+        self.assertNotIn('process_string', vars(self.dfa))
+
+class TestAcceptingPath(unittest.TestCase):
+    def assertValidRun(self, fsm, path, input_string):
+        """Check that every move of the path is a real transition and it reads the input"""
+        states = path.states()
+        self.assertEqual(states[0], fsm.start_state)
+        read = []
+        for state, symbol, next_state in path:
+            if symbol == EPSILON:
+                self.assertIn(next_state, fsm.transitions[(state, EPSILON)])
+            else:
+                target = fsm.target(state, symbol)
+                self.assertIn(next_state, {target} if fsm.is_deterministic else target)
+                read.append(symbol)
+        self.assertEqual(''.join(read), input_string[:path.consumed])
+        self.assertEqual(path.accepted, path.final_state in fsm.accept_states and
+                         path.consumed == len(input_string))
+
+    def test_genuine_runs(self):
+        from fsm_regex import regex_to_nfa
+
+        machines = [create_dfa_a_plus_b_c_star(), create_nfa_a_or_b_star_abb(), create_nfa_nth_last_a(3),
+                    regex_to_nfa('(ab|a)*b?')]
+        for fsm in machines:
+            for s in all_strings('abc', 6):
+                for interval in (None, 1, 2, 5):
+                    with self.subTest(string=s, interval=interval):
+                        path = fsm.accepting_path(s, checkpoint_interval=interval)
+                        self.assertEqual(path.accepted, fsm.process_string(s))
+                        self.assertValidRun(fsm, path, s)
+
+    def test_longest_viable_prefix(self):
+        dfa = create_dfa_a_plus_b_c_star()
+        path = dfa.accepting_path('accacc')
+        self.assertFalse(path.accepted)
+        self.assertEqual(path.consumed, 3)
+        self.assertEqual(path.final_state, 'q1')
+
+    def test_transition_history(self):
+        nfa = create_nfa_a_or_b_star_abb()
+        nfa.process_string('babb')
+        self.assertEqual([next_state for _, _, next_state in nfa.get_transition_history()],
+                         ['q0', 'q1', 'q2', 'q3'])
+
+    def test_long_input_with_checkpoints(self):
+        nfa = create_nfa_nth_last_a(4)
+        s = 'ab' * 50000 + 'abbbb'
+        path = nfa.accepting_path(s, checkpoint=True)
+        self.assertTrue(path.accepted)
+        self.assertEqual(path.consumed, len(s))
+        self.assertEqual(path.states()[-5:], nfa.accepting_path(s).states()[-5:])
+
+class TestProduct(unittest.TestCase):
+    def setUp(self):
+        from fsm_regex import regex_to_nfa
+
+        self.a = create_nfa_a_or_b_star_abb()
+        self.b = create_nfa_nth_last_a(2)
+        self.c = regex_to_nfa('(ab)*c?', alphabet='abc')
+
+    def test_boolean_operations(self):
+        rules = [
+            (self.a.intersection(self.b), lambda s: self.a.process_string(s) and self.b.process_string(s)),
+            (self.a.union(self.c), lambda s: self.a.process_string(s) or self.c.process_string(s)),
+            (self.b.difference(self.a), lambda s: self.b.process_string(s) and not self.a.process_string(s)),
+            (self.c.complement(), lambda s: not self.c.process_string(s)),
+            (self.a.union(self.b).difference(self.c.complement()),
+             lambda s: (self.a.process_string(s) or self.b.process_string(s)) and self.c.process_string(s)),
+        ]
+        for number, (product, expected) in enumerate(rules):
+            for s in all_strings('abcx', 5):
+                with self.subTest(rule=number, string=s):
+                    self.assertEqual(product.accepts(s), expected(s))
+
+    def test_eager_construction(self):
+        rules = [self.a.intersection(self.b), self.b.difference(self.a), self.a.union(self.c),
+                 self.c.complement()]
+        for number, product in enumerate(rules):
+            dfa = product.to_fsm()
+            self.assertTrue(dfa.is_deterministic)
+            self.assertEqual(dfa.minimize().transitions, dfa.transitions)
+            for s in all_strings('abc', 6):
+                with self.subTest(rule=number, string=s):
+                    self.assertEqual(dfa.process_string(s), product.accepts(s))
+
+    def test_only_reached_states_built(self):
+        product = create_nfa_nth_last_a(10).intersection(create_nfa_nth_last_a(9))
+        # The full product has 2^11 * 2^10 subset pairs; this run reaches 12
+        self.assertTrue(product.accepts('a' * 12))
+        self.assertEqual(product.cache_size, 12)
+        product.accepts('a' * 12)
+        self.assertEqual(product.misses, 12)
+
+    def test_ranges(self):
+        from fsm_ranges import CharRange
+
+        letters = FSM({'s', 'w'}, {CharRange('a', 'z')}, {('s', CharRange('a', 'z')): 's'}, 's', {'s'})
+        no_x = FSM({'s'}, {CharRange('a', 'w'), CharRange('y', 'z')},
+                   {('s', CharRange('a', 'w')): 's', ('s', CharRange('y', 'z')): 's'}, 's', {'s'})
+        product = letters.difference(no_x)
+        dfa = product.to_fsm()
+        for s in ('', 'abc', 'abxc', 'x', 'ABx'):
+            with self.subTest(string=s):
+                self.assertEqual(product.accepts(s), 'x' in s and s.islower())
+                self.assertEqual(dfa.process_string(s), product.accepts(s))
+
+class TestMultiMatcher(unittest.TestCase):
+    def setUp(self):
+        from fsm_regex import regex_to_nfa
+
+        self.fsms = {
+            'dfa': create_dfa_a_plus_b_c_star(),
+            'abb': create_nfa_a_or_b_star_abb(),
+            'nth': create_nfa_nth_last_a(2),
+            'regex': regex_to_nfa('(a|c)*b?c'),
+        }
+
+    def expected(self, s):
+        return {name for name, fsm in self.fsms.items() if fsm.process_string(s)}
+
+    def test_matches_separate_runs(self):
+        from fsm_multi import MultiMatcher
+
+        matcher = MultiMatcher(self.fsms)
+        strings = list(all_strings('abcx', 5))
+        results = matcher.match_many(strings)
+        for s, result in zip(strings, results):
+            with self.subTest(string=s):
+                self.assertEqual(result, self.expected(s))
+                self.assertEqual(matcher.accepts(s), bool(result))
+
+    def test_bounded_cache(self):
+        from fsm_multi import MultiMatcher
+
+        matcher = MultiMatcher(list(self.fsms.values()), max_states=8)
+        for s in itertools.islice(all_strings('abc', 7), 0, None, 11):
+            with self.subTest(string=s):
+                names = list(self.fsms)
+                self.assertEqual({names[i] for i in matcher.match(s)}, self.expected(s))
+                self.assertLessEqual(matcher.cache_size, 8)
+        self.assertGreater(matcher.flushes, 0)
+
+    def test_from_file(self):
+        from fsm_multi import MultiMatcher
+
+        matcher = MultiMatcher.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                      'transition_tables.json'))
+        self.assertEqual(set(matcher.ids), {'dfa_a_plus_b_c_star', 'nfa_a_or_b_star_abb'})
+        self.assertEqual(matcher.match('acc'), {'dfa_a_plus_b_c_star'})
+        self.assertEqual(matcher.match('babb'), {'nfa_a_or_b_star_abb'})
+        self.assertEqual(matcher.match('abc'), set())
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.dfa = create_dfa_a_plus_b_c_star()
+        self.nfa = create_nfa_a_or_b_star_abb()
+        self.machines = {'dfa': self.dfa.compiled_dfa(), 'nfa': self.nfa.compiled_dfa()}
+
+    def test_histogram(self):
+        from fsm_server import LatencyHistogram
+
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1e6)
+        self.assertEqual(histogram.count, 1000)
+        for fraction in (0.5, 0.9, 0.99):
+            with self.subTest(fraction=fraction):
+                exact = fraction * 1000 / 1e6
+                self.assertTrue(exact <= histogram.percentile(fraction) <= exact * 2 ** (1 / 8) * 1.01)
+        self.assertEqual(histogram.percentile(1), 1000 / 1e6)
+        self.assertIsNone(LatencyHistogram().percentile(0.5))
+
+    def test_pipelined_requests(self):
+        import asyncio
+        from fsm_server import MatchServer
+
+        strings = list(all_strings('abc', 4))
+        lines = [f'MATCH {"dfa" if i % 2 else "nfa"} {s}' for i, s in enumerate(strings)]
+        expected = [('1' if (self.dfa if i % 2 else self.nfa).process_string(s) else '0')
+                    for i, s in enumerate(strings)]
+
+        async def scenario():
+            server = MatchServer(self.machines, batch_size=16, max_pending=8, max_inflight=4)
+            await server.start()
+            host, port = server.address[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+            # Everything is written before anything is read back
+            writer.write(''.join(line + '\n' for line in lines + ['PING', 'MATCH nope a', 'HELLO']).encode())
+            answers = [(await reader.readline()).decode().rstrip('\n') for _ in range(len(lines) + 3)]
+            writer.write(b'STATS\n')
+            stats = json.loads(await reader.readline())
+            writer.close()
+            await server.close()
+            return answers, stats
+
+        answers, stats = asyncio.run(scenario())
+        self.assertEqual(answers[:len(lines)], expected)
+        self.assertEqual(answers[len(lines)], 'PONG')
+        self.assertTrue(answers[-2].startswith('ERR') and answers[-1].startswith('ERR'))
+        self.assertEqual(stats['latency']['count'], len(lines))
+        self.assertGreater(stats['mean_batch_size'], 1)
+
+    def test_failing_match_answers_error(self):
+        import asyncio
+        from fsm_server import MatchServer
+
+        class Broken:
+            def accepts(self, input_string):
+                raise ValueError("broken machine")
+
+            def accepts_many(self, strings):
+                raise ValueError("broken machine")
+
+        async def scenario():
+            server = MatchServer(dict(self.machines, broken=Broken()))
+            await server.start()
+            host, port = server.address[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b'MATCH broken ab\nMATCH dfa a\nPING\n')
+            first = [await reader.readline() for _ in range(3)]
+            # The batcher keeps running after the failure
+            writer.write(b'MATCH broken a\nMATCH dfa bcc\n')
+            second = [await reader.readline() for _ in range(2)]
+            writer.close()
+            await server.close()
+            return first + second
+
+        answers = asyncio.run(asyncio.wait_for(scenario(), 10))
+        self.assertTrue(answers[0].startswith(b'ERR') and b'broken machine' in answers[0])
+        self.assertEqual(answers[1:3], [b'1\n', b'PONG\n'])
+        self.assertTrue(answers[3].startswith(b'ERR'))
+        self.assertEqual(answers[4], b'1\n')
+
+    def test_load_generator_over_unix_socket(self):
+        import asyncio
+        from fsm_server import MatchServer, run_load
+
+        strings = list(all_strings('abc', 5))
+
+        async def scenario(path):
+            server = MatchServer(self.machines)
+            await server.start(path=path)
+            result = await run_load('dfa', strings, path=path, connections=4, pipeline=16)
+            await server.close()
+            return result
+
+        with tempfile.TemporaryDirectory() as directory:
+            result = asyncio.run(scenario(os.path.join(directory, 'fsm.sock')))
+        self.assertEqual(result['requests'], len(strings))
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['accepted'], sum(map(self.dfa.process_string, strings)))
+        self.assertEqual(result['latency']['count'], len(strings))
+
+class TestCursor(unittest.TestCase):
+    def setUp(self):
+        self.dfa = create_dfa_a_plus_b_c_star()
+        self.nfa = create_nfa_a_or_b_star_abb()
+
+    def test_independent_cursors(self):
+        first = self.nfa.cursor()
+        second = self.nfa.cursor()
+        first.transition('a')
+        second.feed('bab')
+        self.assertEqual(first.current_states, {'q0', 'q1'})
+        self.assertEqual(second.current_states, {'q0', 'q2'})
+        self.assertTrue(second.transition('b') and second.is_accepting())
+        self.assertEqual(second.input_sequence, ['b', 'a', 'b', 'b'])
+        self.assertEqual(self.nfa.current_states, {'q0'})
+        self.assertFalse(hasattr(first, '__dict__'))
+
+    def test_legacy_api(self):
+        self.assertTrue(self.dfa.process_string('acc'))
+        self.assertEqual(self.dfa.current_states, 'q1')
+        self.assertEqual(self.dfa.input_sequence, ['a', 'c', 'c'])
+        self.assertEqual(len(self.dfa.get_transition_history()), 3)
+        self.dfa.reset()
+        self.assertEqual(self.dfa.current_states, 'q0')
+
+    def test_shared_between_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        strings = list(all_strings('abc', 6))
+        for fsm in (self.dfa, self.nfa):
+            expected = [fsm.process_string(s) for s in strings]
+            for engine in ('dict', 'compiled', 'lazy', 'bitset'):
+                if engine == 'compiled' and not fsm.is_deterministic:
+                    continue
+                fsm.engine = engine
+                if engine == 'lazy':
+                    # A tiny cache flushes constantly while the threads run
+                    fsm.lazy_dfa(max_states=3)
+                with ThreadPoolExecutor(8) as pool:
+                    chunks = [strings[i::8] for i in range(8)]
+                    results = list(pool.map(lambda chunk: [fsm.accepts(s) for s in chunk], chunks))
+                with self.subTest(engine=engine, deterministic=fsm.is_deterministic):
+                    for i, chunk_results in enumerate(results):
+                        self.assertEqual(chunk_results, expected[i::8])
+
+class TestTrimming(unittest.TestCase):
+    def setUp(self):
+        from fsm_ranges import MAX_CODE, CharRange
+        
+        # a(b|c)* with an explicit error state and a state nothing reaches
+        self.dfa = FSM({'q0', 'q1', 'err', 'orphan'}, {'a', 'b', 'c'},
+                       {('q0', 'a'): 'q1', ('q0', 'b'): 'err', ('q0', 'c'): 'err',
+                        ('q1', 'b'): 'q1', ('q1', 'c'): 'q1', ('q1', 'a'): 'err',
+                        ('err', 'a'): 'err', ('err', 'b'): 'err', ('err', 'c'): 'err',
+                        ('orphan', 'a'): 'q1'},
+                       'q0', {'q1', 'orphan'})
+        # Strings starting with 'a', over every character
+        everything = CharRange(chr(0), chr(MAX_CODE))
+        self.prefix = FSM({'q0', 'q1'}, {everything},
+                          {('q0', 'a'): 'q1', ('q1', everything): 'q1'}, 'q0', {'q1'})
+        self.nfa = create_nfa_a_or_b_star_abb()
+    
+    def test_trim(self):
+        trimmed = self.dfa.trim()
+        self.assertEqual(trimmed.states, {'q0', 'q1'})
+        self.assertEqual(trimmed.accept_states, {'q1'})
+        for s in all_strings('abcx', 5):
+            with self.subTest(string=s):
+                self.assertEqual(trimmed.process_string(s), self.dfa.process_string(s))
+        
+        empty = FSM({'q0', 'q1'}, {'a'}, {('q0', 'a'): 'q1'}, 'q0', set()).trim()
+        self.assertEqual((empty.states, empty.transitions), ({'q0'}, {}))
+        self.assertEqual(self.nfa.trim().transitions, self.nfa.transitions)
+    
+    def test_dead_ends(self):
+        self.assertEqual(self.dfa.dead_ends(), ({'err'}, frozenset()))
+        self.assertEqual(self.nfa.dead_ends(), (frozenset(), frozenset()))
+        self.assertEqual(self.prefix.dead_ends(), (frozenset(), {'q1'}))
+        self.assertEqual(self.prefix.compile().decided, bytearray([1, 0, 1]))
+        self.assertEqual(self.dfa.compile().decided, bytearray([1, 1, 0, 0, 0]))
+    
+    def test_long_accept_chain(self):
+        from fsm_construction import closed_subset
+        from fsm_ranges import MAX_CODE, CharRange
+        
+        # Every accept state of the chain leads to the next and the last one
+        # out of the accept states, so one state drops out per fixpoint round
+        everything = CharRange(chr(0), chr(MAX_CODE))
+        n = 5000
+        chain = FSM({f'q{i}' for i in range(n + 2)}, {everything},
+                    {**{(f'q{i}', everything): f'q{i + 1}' for i in range(n)},
+                     (f'q{n + 1}', everything): f'q{n + 1}'},
+                    'q0', {f'q{i}' for i in range(n)} | {f'q{n + 1}'})
+        self.assertEqual(chain.dead_ends(), ({f'q{n}'}, {f'q{n + 1}'}))
+        decided = chain.compile().decided
+        self.assertEqual(sum(decided), 3)
+        
+        moves = {'a': [('a', 'b'), ('c',)], 'b': [('b',)], 'c': [('a',)], 'd': [()]}
+        self.assertEqual(closed_subset('abcd', moves.__getitem__), {'a', 'b', 'c'})
+        self.assertEqual(closed_subset('abd', moves.__getitem__), {'b'})
+    
+    def test_engines_stop_early(self):
+        for fsm, rejected, accepted in ((self.dfa, 'b' + 'a' * 500, None),
+                                        (self.prefix, 'b' * 500, 'a' + '\U0001f600' * 500)):
+            lazy = fsm.lazy_dfa()
+            for s in (rejected, accepted):
+                if s is None:
+                    continue
+                expected = s == accepted
+                for engine in ('dict', 'compiled', 'lazy', 'bitset'):
+                    fsm.engine = engine
+                    with self.subTest(engine=engine, string=s[:2]):
+                        self.assertEqual(fsm.process_string(s), expected)
+                lazy.hits = lazy.misses = 0
+                lazy.accepts(s)
+                self.assertLessEqual(lazy.hits + lazy.misses, 32)
+            fsm.engine = 'dict'
+        self.assertEqual(self.dfa.process_string('bcc'), False)
+        self.assertEqual(self.dfa.input_sequence, ['b'])
+    
+    def test_engines_agree(self):
+        nfa = FSM({'q0', 'q1', 'dead'}, {'a', 'b'},
+                  {('q0', 'a'): {'q0', 'q1', 'dead'}, ('q0', 'b'): {'dead'}, ('dead', 'a'): {'dead'},
+                   ('q1', 'b'): {'q1'}}, 'q0', {'q1'}, is_deterministic=False)
+        for fsm in (self.dfa, self.nfa, nfa):
+            expected = [fsm.process_string(s) for s in all_strings('abcx', 5)]
+            for engine in ('compiled', 'lazy', 'bitset'):
+                if engine == 'compiled' and not fsm.is_deterministic:
+                    continue
+                fsm.engine = engine
+                with self.subTest(engine=engine, deterministic=fsm.is_deterministic):
+                    self.assertEqual([fsm.process_string(s) for s in all_strings('abcx', 5)], expected)
+            fsm.engine = 'dict'
+
+class TestPrefixMatcher(unittest.TestCase):
+    def setUp(self):
+        self.nfa = create_nfa_a_or_b_star_abb()
+        self.dfa = self.nfa.minimize()
+        self.strings = list(all_strings('abx', 6)) + ['abab' * 50 + tail for tail in ('abb', 'b', 'abb', '')]
+    
+    def test_engines_agree(self):
+        import random
+        
+        shuffled = list(self.strings)
+        random.Random(7).shuffle(shuffled)
+        for fsm, engine in ((self.dfa, 'compiled'), (self.nfa, 'lazy'), (self.nfa, 'bitset'), (self.nfa, 'dict')):
+            fsm.engine = engine
+            expected = [fsm.accepts(s) for s in shuffled]
+            with self.subTest(engine=engine):
+                self.assertEqual(fsm.prefix_matcher().accepts_many(shuffled), expected)
+                matcher = fsm.prefix_matcher(memo_size=8)
+                self.assertEqual([matcher.accepts(s) for s in shuffled], expected)
+            fsm.engine = 'dict'
+    
+    def test_reads_each_prefix_once(self):
+        from fsm_prefix import PrefixMatcher
+        
+        matcher = PrefixMatcher(self.dfa.compile())
+        self.assertEqual(matcher.accepts_many(['abba', 'abb', 'ab', 'abb', 'b', 'abab']),
+                         [False, True, False, True, False, False])
+        # The trie of the batch: a, ab, abb, abba, aba, abab, b
+        self.assertEqual(matcher.symbols, 7)
+        self.assertEqual(matcher.accepts_many([]), [])
+        
+        matcher.symbols = 0
+        prefixes = {s[:i] for s in self.strings for i in range(1, len(s) + 1)}
+        matcher.accepts_many(self.strings)
+        self.assertEqual(matcher.symbols, len(prefixes))
+    
+    def test_lru_memo(self):
+        from fsm_prefix import PrefixMatcher
+        
+        matcher = PrefixMatcher(self.nfa.lazy_dfa(), memo_size=2, block=4)
+        self.assertTrue(matcher.accepts('abababb'))
+        self.assertTrue(matcher.accepts('abababb'))
+        self.assertEqual((matcher.hits, matcher.misses, matcher.symbols), (1, 1, 10))
+        self.assertFalse(matcher.accepts('ababbbba'))
+        self.assertEqual((matcher.hits, matcher.misses), (2, 2))
+        # The two new blocks evict both prefixes of 'ababbbba'
+        matcher.accepts('bbbbbbbb')
+        self.assertEqual((matcher.hits, matcher.misses), (2, 4))
+        matcher.accepts('ababbbba')
+        self.assertEqual((matcher.hits, matcher.misses), (2, 6))
+        self.assertLessEqual(len(matcher._memo), 2)
+        with self.assertRaises(ValueError):
+            PrefixMatcher(self.nfa, memo_size=-1)
+
+
+class TestLexer(unittest.TestCase):
+    def setUp(self):
+        from fsm_lexer import Lexer
+        
+        self.lexer = Lexer.from_regexes([
+            ('if', 'if'), ('ident', '[a-z][a-z0-9]*'), ('num', '[0-9]+'), ('ws', ' +'), ('op', '[=<+]|==|<='),
+        ])
+    
+    def test_longest_match_and_priority(self):
+        text = 'if iffy==42 x1<=7'
+        tokens = list(self.lexer.tokens(text))
+        self.assertEqual([(kind, text[start:end]) for kind, start, end in tokens], [
+            ('if', 'if'), ('ws', ' '), ('ident', 'iffy'), ('op', '=='), ('num', '42'), ('ws', ' '),
+            ('ident', 'x1'), ('op', '<='), ('num', '7'),
+        ])
+        self.assertEqual(list(self.lexer.tokens('')), [])
+    
+    def test_lazy_errors(self):
+        from fsm_lexer import Lexer
+        
+        tokens = self.lexer.tokens('x = ?')
+        self.assertEqual([next(tokens) for _ in range(4)],
+                         [('ident', 0, 1), ('ws', 1, 2), ('op', 2, 3), ('ws', 3, 4)])
+        with self.assertRaisesRegex(ValueError, 'position 4'):
+            next(tokens)
+        with self.assertRaises(ValueError):
+            Lexer([])
+    
+    def test_matches_reference(self):
+        from fsm_lexer import Lexer
+        from fsm_regex import regex_to_nfa
+        
+        rules = [('a', 'a'), ('ab', 'a*b'), ('abc', '(ab)+c?'), ('c', 'c+')]
+        lexer = Lexer.from_regexes(rules)
+        fsms = [(kind, regex_to_nfa(pattern)) for kind, pattern in rules]
+        
+        def reference(text):
+            start = 0
+            while start < len(text):
+                best = None
+                for end in range(len(text), start, -1):
+                    best = next((kind for kind, fsm in fsms if fsm.accepts(text[start:end])), None)
+                    if best is not None:
+                        yield best, start, end
+                        start = end
+                        break
+                if best is None:
+                    return
+        
+        for text in itertools.islice(all_strings('abc', 7), 0, None, 7):
+            with self.subTest(text=text):
+                expected = list(reference(text))
+                if sum(end - start for _, start, end in expected) == len(text):
+                    self.assertEqual(list(lexer.tokens(text)), expected)
+                else:
+                    with self.assertRaises(ValueError):
+                        list(lexer.tokens(text))
+    
+    def test_adversarial_input_is_linear(self):
+        from fsm_lexer import Lexer
+        
+        lexer = Lexer.from_regexes([('a', 'a'), ('ab', 'a*b')])
+        self.assertEqual(list(lexer.tokens('aaab')), [('ab', 0, 4)])
+        # Plain backtracking reads n^2 / 2 = 8 * 10^8 symbols here
+        tokens = list(lexer.tokens('a' * 40000))
+        self.assertEqual(len(tokens), 40000)
+        self.assertEqual(tokens[-1], ('a', 39999, 40000))
+
+
 if __name__ == '__main__':
     unittest.main()
 # """
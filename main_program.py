@@ -5,14 +5,25 @@ My program provides a user interface to test both DFA and NFA implementations,
 visualize state machines, run tests, and work with configuration files.
 """
 
+import argparse
+import json
 import os
 import sys
 import unittest
-import nfa_config.txt, dfa_config.txt
-from fsm_visualizer import (
-    generate_ascii_diagram, visualize_path, save_fsm_visualization
-)
-from fsm_tests import TestDFA, TestNFA
+from finite_state_machines import create_dfa_a_plus_b_c_star, create_nfa_a_or_b_star_abb
+from fsm_loader import load_compiled_definition
+import fsm_tests
+
+# Definitions the matching service loads when none are given
+DEFAULT_DEFINITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transition_tables.json')
+
+DEFAULT_PORT = 7878
+
+# Machines that can be picked by name on the command line
+BUILTIN_MACHINES = {
+    'dfa': create_dfa_a_plus_b_c_star,
+    'nfa': create_nfa_a_or_b_star_abb,
+}
 
 
 def clear_screen():
@@ -46,6 +57,8 @@ def get_user_choice(prompt, options):
 
 def test_fsm(fsm):
     """Test a finite state machine interactively"""
+    from fsm_visualizer import generate_ascii_diagram, visualize_path
+    
     clear_screen()
     display_header(f"Testing {fsm.name}")
     
@@ -65,7 +78,150 @@ def run_all_tests():
     clear_screen()
     display_header("Running Unit Tests")
     
-    # Create test suite
-    suite = unittest.TestSuite()
-    suite.addTest(unittest.makeSuite(TestDFA))
-    suite.addTest
+    # Every test class of fsm_tests, so new ones are picked up too
+    suite = unittest.TestLoader().loadTestsFromModule(fsm_tests)
+    
+    unittest.TextTestRunner(verbosity=2).run(suite)
+
+
+def load_compiled_machine(args):
+    """Get the compiled form of the FSM selected on the command line"""
+    if args.definition is None:
+        return BUILTIN_MACHINES[args.machine]().compiled_dfa()
+    # Unchanged definitions load straight from the compiled-artifact cache
+    return load_compiled_definition(args.definition, args.name, use_cache=not args.no_cache)
+
+
+def scan_command(args):
+    """Scan a file with an FSM, as a whole or line by line"""
+    from fsm_stream import scan_file
+    
+    compiled = load_compiled_machine(args)
+    
+    if args.lines:
+        accepted_lines = 0
+        for line_number, accepted in scan_file(compiled, args.file, by_line=True):
+            accepted_lines += accepted
+            if not args.quiet:
+                print(f"{line_number}: {'ACCEPTED' if accepted else 'REJECTED'}")
+        print(f"{accepted_lines} line(s) accepted")
+        return 0
+    
+    accepted = scan_file(compiled, args.file)
+    print('ACCEPTED' if accepted else 'REJECTED')
+    return 0 if accepted else 1
+
+
+def serve_command(args):
+    """Run the matching service until interrupted"""
+    import asyncio
+    from fsm_loader import load_compiled_machines
+    from fsm_server import MatchServer
+    
+    machines = {name: create().compiled_dfa() for name, create in BUILTIN_MACHINES.items()}
+    for path in args.definition or [DEFAULT_DEFINITIONS]:
+        machines.update(load_compiled_machines(path, use_cache=not args.no_cache))
+    server = MatchServer(machines, batch_size=args.batch_size, batch_delay=args.batch_delay / 1000,
+                         max_pending=args.max_pending, max_inflight=args.max_inflight)
+    
+    async def serve():
+        await server.start(args.host, args.port, args.unix)
+        print(f"Serving {', '.join(machines)} on {args.unix or '%s:%d' % server.address[:2]}", flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            print(json.dumps(server.stats()))
+    
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def load_command(args):
+    """Drive a running matching service with random strings and report latency"""
+    import asyncio
+    import random
+    from fsm_server import run_load
+    
+    rng = random.Random(args.seed)
+    strings = [
+        ''.join(rng.choice(args.alphabet) for _ in range(rng.randint(args.min_length, args.max_length)))
+        for _ in range(args.requests)
+    ]
+    result = asyncio.run(run_load(args.machine, strings, args.host, args.port, args.unix,
+                                  args.connections, args.pipeline))
+    print(json.dumps(result, indent=2))
+    return 1 if result['errors'] else 0
+
+
+def add_address_arguments(parser):
+    """Add the options that say where the matching service listens"""
+    parser.add_argument('--host', default='127.0.0.1', help="TCP host (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument('--unix', help="Unix socket path to use instead of TCP")
+
+
+def add_machine_arguments(parser):
+    """Add the options that select which FSM a command runs"""
+    parser.add_argument('--machine', choices=sorted(BUILTIN_MACHINES), default='dfa',
+                        help="built-in machine to use (default: dfa)")
+    parser.add_argument('--definition', help="JSON or INI definition file to load instead")
+    parser.add_argument('--name', help="entry to use when the definition file holds several machines")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always parse and compile the definition instead of using the cache")
+
+
+def main(argv=None):
+    """Run the command-line interface"""
+    parser = argparse.ArgumentParser(description="Finite State Machine tools")
+    commands = parser.add_subparsers(dest='command')
+    
+    commands.add_parser('test', help="run all unit tests")
+    
+    scan_parser = commands.add_parser('scan', help="scan a file with an FSM through mmap")
+    scan_parser.add_argument('file', help="file to scan")
+    scan_parser.add_argument('--lines', action='store_true', help="report a verdict per line")
+    scan_parser.add_argument('--quiet', action='store_true', help="only print the summary with --lines")
+    add_machine_arguments(scan_parser)
+    
+    serve_parser = commands.add_parser('serve', help="run the batching match service")
+    serve_parser.add_argument('--definition', action='append',
+                              help="definition file to load (repeatable; default: transition_tables.json)")
+    serve_parser.add_argument('--no-cache', action='store_true', help="skip the compiled-artifact cache")
+    serve_parser.add_argument('--batch-size', type=int, default=256, help="most requests per batch")
+    serve_parser.add_argument('--batch-delay', type=float, default=0.0,
+                              help="milliseconds to wait for a batch to fill (default: 0)")
+    serve_parser.add_argument('--max-pending', type=int, default=4096, help="most queued requests")
+    serve_parser.add_argument('--max-inflight', type=int, default=256,
+                              help="most unanswered requests per connection")
+    add_address_arguments(serve_parser)
+    
+    load_parser = commands.add_parser('load', help="load-test a running match service")
+    load_parser.add_argument('--machine', default='dfa', help="machine name to match against (default: dfa)")
+    load_parser.add_argument('--requests', type=int, default=10000, help="number of requests")
+    load_parser.add_argument('--connections', type=int, default=8, help="concurrent connections")
+    load_parser.add_argument('--pipeline', type=int, default=32, help="requests in flight per connection")
+    load_parser.add_argument('--alphabet', default='abc', help="characters of the random inputs")
+    load_parser.add_argument('--min-length', type=int, default=1, help="shortest random input")
+    load_parser.add_argument('--max-length', type=int, default=16, help="longest random input")
+    load_parser.add_argument('--seed', type=int, default=0, help="random seed")
+    add_address_arguments(load_parser)
+    
+    args = parser.parse_args(argv)
+    if args.command == 'test':
+        run_all_tests()
+        return 0
+    if args.command == 'scan':
+        return scan_command(args)
+    if args.command == 'serve':
+        return serve_command(args)
+    if args.command == 'load':
+        return load_command(args)
+    parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())